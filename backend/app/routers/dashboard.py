@@ -7,6 +7,7 @@ from typing import Optional
 import math
 
 from app.auth import get_current_user
+from app.services.asset_register import AssetRegister
 
 router = APIRouter()
 
@@ -40,53 +41,29 @@ def get_month(date_str: str) -> str:
         return ""
 
 
-def get_expense_amount_for_year(exp: dict, target_year: int) -> float:
+def get_expense_amount_for_year(exp: dict, target_year: int, register: AssetRegister) -> float:
     """Calculate the expense amount attributable to a given year.
 
     For normal expenses: full subtotaal if the expense year matches.
-    For depreciated expenses: annual depreciation portion for each applicable year.
+    For depreciated expenses: the annual depreciation from the asset register.
     """
-    datum = exp.get("datum", "")
-    exp_year = get_year(datum)
-
     if not exp.get("afschrijving"):
         # Normal expense: only counts in its own year
-        return exp.get("subtotaal", 0) if exp_year == target_year else 0.0
-
-    # Depreciation: spread over multiple years
-    jaren = exp.get("afschrijving_jaren") or 1
-    restwaarde = exp.get("afschrijving_restwaarde") or 0
-    subtotaal = exp.get("subtotaal", 0)
-    jaarlijks = (subtotaal - restwaarde) / jaren
+        return exp.get("subtotaal", 0) if get_year(exp.get("datum", "")) == target_year else 0.0
 
-    # Depreciation starts in the year of purchase and runs for `jaren` years
-    if exp_year <= target_year < exp_year + jaren:
-        return jaarlijks
-    return 0.0
+    return register.afschrijving(exp.get("id"), target_year)
 
 
-def get_expense_amount_for_month(exp: dict, target_year: int, target_month: str) -> float:
-    """Calculate the expense amount attributable to a given month.
+def get_expense_amount_for_month(exp: dict, target_month: str, register: AssetRegister) -> float:
+    """Calculate the expense amount attributable to a given month (YYYY-MM).
 
     For normal expenses: full subtotaal if the expense month matches.
-    For depreciated expenses: monthly depreciation portion (annual / 12) for applicable months.
+    For depreciated expenses: the monthly depreciation from the asset register.
     """
-    datum = exp.get("datum", "")
-    exp_year = get_year(datum)
-    exp_month = get_month(datum)
-
     if not exp.get("afschrijving"):
-        return exp.get("subtotaal", 0) if exp_month == target_month else 0.0
-
-    # Depreciation: spread evenly across months over multiple years
-    jaren = exp.get("afschrijving_jaren") or 1
-    restwaarde = exp.get("afschrijving_restwaarde") or 0
-    subtotaal = exp.get("subtotaal", 0)
-    maandelijks = (subtotaal - restwaarde) / jaren / 12
+        return exp.get("subtotaal", 0) if get_month(exp.get("datum", "")) == target_month else 0.0
 
-    if exp_year <= target_year < exp_year + jaren:
-        return maandelijks
-    return 0.0
+    return register.afschrijving_maand(exp.get("id"), target_month)
 
 
 @router.get("")
@@ -124,7 +101,8 @@ async def get_dashboard(
         .where(filter=FieldFilter("user_id", "==", uid))
         .stream()
     )
-    all_expense_data = [doc.to_dict() for doc in expenses]
+    all_expense_data = [{"id": doc.id, **doc.to_dict()} for doc in expenses]
+    register = AssetRegister.from_expenses(all_expense_data)
 
     # Filter expenses by year (include all for depreciation calculation)
     expense_data = [
@@ -151,7 +129,7 @@ async def get_dashboard(
     # Normal expenses + depreciation portions for this year
     totaal_uitgaven = sum(exp.get("subtotaal", 0) for exp in expense_data)
     totaal_uitgaven += sum(
-        get_expense_amount_for_year(exp, jaar)
+        get_expense_amount_for_year(exp, jaar, register)
         for exp in all_expense_data
         if exp.get("afschrijving")
     )
@@ -182,7 +160,7 @@ async def get_dashboard(
         if exp.get("afschrijving"):
             for m in range(1, 13):
                 month_key = f"{jaar}-{m:02d}"
-                amount = get_expense_amount_for_month(exp, jaar, month_key)
+                amount = get_expense_amount_for_month(exp, month_key, register)
                 if amount > 0:
                     uitgaven_per_maand[month_key] += amount
 
@@ -205,7 +183,7 @@ async def get_dashboard(
     # Add depreciation portions
     for exp in all_expense_data:
         if exp.get("afschrijving"):
-            amount = get_expense_amount_for_year(exp, jaar)
+            amount = get_expense_amount_for_year(exp, jaar, register)
             if amount > 0:
                 cat = exp.get("categorie", "Afschrijvingen") or "Afschrijvingen"
                 categorie_totalen[cat] += amount
@@ -305,7 +283,8 @@ async def get_financieel_dashboard(
         .where(filter=FieldFilter("user_id", "==", uid))
         .stream()
     )
-    expense_data = [doc.to_dict() for doc in expenses]
+    expense_data = [{"id": doc.id, **doc.to_dict()} for doc in expenses]
+    register = AssetRegister.from_expenses(expense_data)
 
     # === WINST & VERLIES (filtered by year) ===
     wv_inkomsten = 0.0
@@ -318,7 +297,7 @@ async def get_financieel_dashboard(
 
     for exp in expense_data:
         # Use depreciation-aware amount for each expense
-        wv_uitgaven += get_expense_amount_for_year(exp, jaar)
+        wv_uitgaven += get_expense_amount_for_year(exp, jaar, register)
 
     wv_winst = wv_inkomsten - wv_uitgaven
 
@@ -367,7 +346,7 @@ async def get_financieel_dashboard(
 
     for exp in expense_data:
         # Use depreciation-aware amount for inkomstenbelasting
-        subtotaal = get_expense_amount_for_year(exp, jaar)
+        subtotaal = get_expense_amount_for_year(exp, jaar, register)
         if subtotaal == 0:
             continue
         eigenaar = exp.get("daan_of_wim") or "Beiden"
@@ -445,7 +424,8 @@ async def winst_verlies_detail(
         .where(filter=FieldFilter("user_id", "==", uid))
         .stream()
     )
-    expense_data = [doc.to_dict() for doc in expenses]
+    expense_data = [{"id": doc.id, **doc.to_dict()} for doc in expenses]
+    register = AssetRegister.from_expenses(expense_data)
 
     # Available years (include depreciation years)
     all_years = set()
@@ -457,10 +437,7 @@ async def winst_verlies_detail(
         y = get_year(exp.get("datum", ""))
         if y:
             all_years.add(y)
-            if exp.get("afschrijving"):
-                jaren = exp.get("afschrijving_jaren") or 1
-                for offset in range(jaren):
-                    all_years.add(y + offset)
+    all_years |= register.jaren()
     beschikbare_jaren = sorted(all_years, reverse=True)
 
     # Per-person income by client
@@ -487,7 +464,7 @@ async def winst_verlies_detail(
     uit_per_cat_wim = defaultdict(float)
 
     for exp in expense_data:
-        subtotaal = get_expense_amount_for_year(exp, jaar)
+        subtotaal = get_expense_amount_for_year(exp, jaar, register)
         if subtotaal == 0:
             continue
         categorie = exp.get("categorie", "Overig") or "Overig"
@@ -526,7 +503,7 @@ async def winst_verlies_detail(
         eigenaar = exp.get("daan_of_wim") or "Beiden"
         for m in range(1, 13):
             month_key = f"{jaar}-{m:02d}"
-            subtotaal = get_expense_amount_for_month(exp, jaar, month_key)
+            subtotaal = get_expense_amount_for_month(exp, month_key, register)
             if subtotaal == 0:
                 continue
             if eigenaar == "Beiden":
@@ -5,6 +5,7 @@ from datetime import datetime, timezone
 
 from app.auth import get_current_user
 from app.models.expense import ExpenseCreate, ExpenseUpdate
+from app.services.jaarcijfers_snapshots import invalidate_snapshots
 from app.services.pdf_parser import detect_expense_upload_mime_type, extract_expense_data
 
 router = APIRouter()
@@ -81,6 +82,7 @@ async def upload_expense(
         "updated_at": now,
     }
     doc_ref = db.collection("expenses").add(data)
+    invalidate_snapshots(db, user["uid"], data["datum"])
     return {"id": doc_ref[1].id, **data, "methode": extracted.get("methode", "regex")}
 
 
@@ -98,6 +100,7 @@ async def create_expense(
         "updated_at": now,
     }
     doc_ref = db.collection("expenses").add(data)
+    invalidate_snapshots(db, user["uid"], data["datum"])
     return {"id": doc_ref[1].id, **data}
 
 
@@ -116,6 +119,8 @@ async def update_expense(
     now = datetime.now(timezone.utc).isoformat()
     data = {**expense.model_dump(exclude_unset=True), "updated_at": now}
     doc_ref.update(data)
+    current_datum = doc.to_dict().get("datum", "")
+    invalidate_snapshots(db, user["uid"], current_datum, data.get("datum", current_datum))
     return {"id": expense_id, **doc.to_dict(), **data}
 
 
@@ -127,4 +132,5 @@ async def delete_expense(expense_id: str, user: dict = Depends(get_current_user)
     if not doc.exists or doc.to_dict().get("user_id") != user["uid"]:
         raise HTTPException(status_code=404, detail="Uitgave niet gevonden")
     doc_ref.delete()
+    invalidate_snapshots(db, user["uid"], doc.to_dict().get("datum", ""))
     return {"ok": True}
@@ -7,6 +7,7 @@ from typing import Optional
 import json
 
 from app.auth import get_current_user
+from app.services.jaarcijfers_snapshots import invalidate_snapshots
 
 router = APIRouter()
 
@@ -69,6 +70,7 @@ async def import_wordpress(
     user_id = user["uid"]
     now = datetime.now(timezone.utc).isoformat()
     results = {"klanten": 0, "inkomsten": 0, "uitgaven": 0}
+    datums = []
 
     # --- Klanten ---
     klant_mapping = {}  # wp_user_id → firestore_id
@@ -171,6 +173,7 @@ async def import_wordpress(
             'updated_at': now,
         }
         db.collection('invoices').add(inv_data)
+        datums.append(factuurdatum)
         results["inkomsten"] += 1
 
     # --- Uitgaven ---
@@ -214,8 +217,11 @@ async def import_wordpress(
             'updated_at': now,
         }
         db.collection('expenses').add(exp_data)
+        datums.append(factuurdatum)
         results["uitgaven"] += 1
 
+    invalidate_snapshots(db, user_id, *datums)
+
     # Update volgende factuurnummer op basis van hoogste geïmporteerde
     if results["inkomsten"] > 0:
         all_nummers = [ink.get('factuurnummer', '') for ink in data.get('inkomsten', [])]
@@ -1,6 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse
-from firebase_admin import firestore, storage
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from firebase_admin import firestore
 from google.cloud.firestore_v1 import FieldFilter
 from datetime import datetime, timezone
 from typing import Optional
@@ -14,7 +14,8 @@ from app.models.invoice import InvoiceCreate, InvoiceUpdate
 class SendInvoiceRequest(BaseModel):
     onderwerp: Optional[str] = None
     bericht: Optional[str] = None
-from app.services.pdf_generator import generate_invoice_pdf
+from app.services.jaarcijfers_snapshots import invalidate_snapshots
+from app.services.pdf_cache import get_invoice_pdf, has_final_pdf, invoice_pdf_hash, invoice_pdf_key
 from app.services.email_service import send_invoice_email
 
 router = APIRouter()
@@ -103,6 +104,7 @@ async def create_invoice(
         "updated_at": now,
     }
     doc_ref = db.collection("invoices").add(data)
+    invalidate_snapshots(db, user["uid"], data["factuurdatum"])
     return {"id": doc_ref[1].id, **data}
 
 
@@ -143,8 +145,16 @@ async def update_invoice(
             update_data["verzonden_op"] = current_verzonden_op or now
             update_data["betaald_op"] = current_data.get("betaald_op") or now
 
+    if _stale_final_pdf(db, user["uid"], current_data, {**current_data, **update_data}):
+        update_data["pdf_url"] = None
+        update_data["pdf_hash"] = None
+
     update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     doc_ref.update(update_data)
+    invalidate_snapshots(
+        db, user["uid"], current_data.get("factuurdatum", ""),
+        update_data.get("factuurdatum", current_data.get("factuurdatum", "")),
+    )
 
     updated = doc_ref.get()
     return {"id": invoice_id, **updated.to_dict()}
@@ -158,35 +168,81 @@ async def delete_invoice(invoice_id: str, user: dict = Depends(get_current_user)
     if not doc.exists or doc.to_dict().get("user_id") != user["uid"]:
         raise HTTPException(status_code=404, detail="Factuur niet gevonden")
     doc_ref.delete()
+    invalidate_snapshots(db, user["uid"], doc.to_dict().get("factuurdatum", ""))
     return {"ok": True}
 
 
-@router.post("/{invoice_id}/pdf")
-async def generate_pdf(invoice_id: str, user: dict = Depends(get_current_user)):
+def _load_pdf_context(db, uid: str, invoice_data: dict) -> tuple[dict, dict]:
+    """Load the company settings and customer needed to render an invoice PDF."""
+    settings_doc = db.collection("company_settings").document(uid).get()
+    company = settings_doc.to_dict() if settings_doc.exists else {}
+
+    klant = {}
+    if invoice_data.get("klant_id"):
+        klant_doc = db.collection("customers").document(invoice_data["klant_id"]).get()
+        klant = klant_doc.to_dict() if klant_doc.exists else {}
+    return company, klant
+
+
+def _stale_final_pdf(db, uid: str, current_data: dict, updated: dict) -> bool:
+    """Whether the stored PDF must be dropped rather than kept as the final copy.
+
+    A copy becomes final only if it matches the invoice when it stops being a
+    concept; a final copy is dropped when the sent invoice itself is edited.
+    """
+    if not updated.get("pdf_url") or updated.get("status", "concept") == "concept":
+        return False
+    company, klant = _load_pdf_context(db, uid, updated)
+    if not has_final_pdf(current_data):
+        return updated.get("pdf_hash") != invoice_pdf_hash(updated, company, klant)
+    if updated.get("klant_id") != current_data.get("klant_id"):
+        return True
+    return invoice_pdf_hash(updated, company, klant) != invoice_pdf_hash(current_data, company, klant)
+
+
+@router.get("/{invoice_id}/pdf")
+async def download_pdf(
+    invoice_id: str,
+    request: Request,
+    user: dict = Depends(get_current_user),
+):
+    """Serve the (cached) invoice PDF with an ETag, answering 304 when unchanged."""
     db = get_db()
     doc = db.collection("invoices").document(invoice_id).get()
     if not doc.exists or doc.to_dict().get("user_id") != user["uid"]:
         raise HTTPException(status_code=404, detail="Factuur niet gevonden")
 
     invoice_data = doc.to_dict()
+    company, klant = _load_pdf_context(db, user["uid"], invoice_data)
 
-    # Get company settings and customer
-    settings_doc = db.collection("company_settings").document(user["uid"]).get()
-    company = settings_doc.to_dict() if settings_doc.exists else {}
+    etag = f'"{invoice_pdf_key(invoice_data, company, klant)}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, max-age=0, must-revalidate",
+        "Content-Disposition": f'attachment; filename="{invoice_data["factuurnummer"]}.pdf"',
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    pdf_bytes, key = get_invoice_pdf(db, user["uid"], invoice_id, invoice_data, company, klant)
+    # A sent invoice whose copy could not be read was rendered instead
+    headers["ETag"] = f'"{key}"'
+    return Response(pdf_bytes, media_type="application/pdf", headers=headers)
 
-    klant_doc = db.collection("customers").document(invoice_data.get("klant_id", "")).get()
-    klant = klant_doc.to_dict() if klant_doc.exists else {}
 
-    pdf_bytes = generate_invoice_pdf(invoice_data, company, klant)
+@router.post("/{invoice_id}/pdf")
+async def generate_pdf(invoice_id: str, user: dict = Depends(get_current_user)):
+    db = get_db()
+    doc = db.collection("invoices").document(invoice_id).get()
+    if not doc.exists or doc.to_dict().get("user_id") != user["uid"]:
+        raise HTTPException(status_code=404, detail="Factuur niet gevonden")
 
-    # Upload to Firebase Storage
-    bucket = storage.bucket()
-    blob = bucket.blob(f"invoices/{user['uid']}/{invoice_id}.pdf")
-    blob.upload_from_string(pdf_bytes, content_type="application/pdf")
-    blob.make_public()
+    invoice_data = doc.to_dict()
+    company, klant = _load_pdf_context(db, user["uid"], invoice_data)
 
-    # Update invoice with PDF URL
-    db.collection("invoices").document(invoice_id).update({"pdf_url": blob.public_url})
+    # Sent invoices keep their stored copy; concepts render only when something changed
+    pdf_bytes, _ = get_invoice_pdf(db, user["uid"], invoice_id, invoice_data, company, klant)
 
     return StreamingResponse(
         io.BytesIO(pdf_bytes),
@@ -226,8 +282,8 @@ async def send_invoice(
     settings_doc = db.collection("company_settings").document(user["uid"]).get()
     company = settings_doc.to_dict() if settings_doc.exists else {}
 
-    # Generate PDF
-    pdf_bytes = generate_invoice_pdf(invoice_data, company, klant)
+    # Get PDF (the stored copy when resending, else cached unless something changed)
+    pdf_bytes, _ = get_invoice_pdf(db, user["uid"], invoice_id, invoice_data, company, klant)
 
     klant_naam = " ".join(filter(None, [klant.get("voornaam"), klant.get("achternaam")])) or klant["bedrijfsnaam"]
 
@@ -253,5 +309,6 @@ async def send_invoice(
     db.collection("invoices").document(invoice_id).update(
         {"status": "verzonden", "verzonden_op": now, "updated_at": now}
     )
+    invalidate_snapshots(db, user["uid"], invoice_data.get("factuurdatum", ""))
 
     return {"ok": True, "message": "Factuur verzonden"}
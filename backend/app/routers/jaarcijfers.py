@@ -1,22 +1,50 @@
 """Jaarcijfers router - generates annual financial report data."""
 
-import csv
+import hashlib
 import io
+import itertools
+import json
+import tempfile
 import zipfile
-from datetime import date
+from datetime import date, datetime, timedelta, timezone
+from typing import BinaryIO
 from urllib.parse import urlparse, unquote
 
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, UploadFile, File, HTTPException
 from fastapi.responses import StreamingResponse
 from firebase_admin import firestore, storage
 from google.cloud.firestore_v1 import FieldFilter
-from collections import defaultdict
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, numbers
+from google.cloud.firestore_v1.field_path import FieldPath
+from collections import Counter, defaultdict
+import math
 
 from app.auth import get_current_user
-from app.services.pdf_generator import generate_invoice_pdf
-from app.config import FIREBASE_STORAGE_BUCKET
+from app.routers.dashboard import get_expense_amount_for_year
+from app.services.asset_register import AssetRegister, depreciation_years
+from app.services.bank_matching import run_incremental_matching
+from app.services.bank_statements import PARSE_ERRORS, STATEMENT_EXTENSIONS, parse_statement
+from app.services.batch_writes import BulkWrites, bulk_delete
+from app.services.excel_export import SheetWriter, save_workbook
+from app.services.jaarcijfers_snapshots import (
+    get_loaded_snapshot,
+    get_year,
+    get_snapshot,
+    invalidate_snapshots,
+    load_generations,
+    load_snapshots,
+    save_snapshot,
+)
+from app.services.jobs import (
+    ACTIVE_STATUSES,
+    STATUS_DONE,
+    JobProgress,
+    create_job,
+    is_stale,
+    job_event_stream,
+)
+from app.services.match_suggestions import invalidate_suggestions
+from app.services.matching import transaction_match_fields
+from app.services.pdf_cache import get_invoice_pdf, storage_path_from_url
 
 router = APIRouter()
 
@@ -25,19 +53,13 @@ def get_db():
     return firestore.client()
 
 
-def get_year(date_str: str) -> int:
-    try:
-        return int(date_str[:4])
-    except (ValueError, IndexError):
-        return 0
-
-
 # === Core computation ===
 
 def _compute_jaarcijfers(
     jaar: int,
     all_invoice_data: list[dict],
     all_expense_data: list[dict],
+    register: AssetRegister,
     bank_accounts: dict | None = None,
     prev_year_eind: dict | None = None,
 ) -> dict:
@@ -61,89 +83,24 @@ def _compute_jaarcijfers(
 
     # === 2. KOSTEN & AFSCHRIJVINGEN ===
     kosten_direct = 0.0
-    afschrijvingen = 0.0
+    afschrijvingen = register.totaal_afschrijving(jaar)
     kosten_per_categorie = defaultdict(float)
-    afschrijving_items = []
 
     for exp in all_expense_data:
-        exp_year = get_year(exp.get("datum", ""))
-        is_afschrijving = exp.get("afschrijving", False)
-
-        if is_afschrijving:
-            jaren = exp.get("afschrijving_jaren") or 1
-            restwaarde = exp.get("afschrijving_restwaarde") or 0
+        if exp.get("afschrijving", False):
+            continue
+        if get_year(exp.get("datum", "")) == jaar:
             subtotaal = exp.get("subtotaal", 0)
-            jaarlijks = (subtotaal - restwaarde) / jaren
-
-            if exp_year <= jaar < exp_year + jaren:
-                afschrijvingen += jaarlijks
-                afschrijving_items.append({
-                    "id": exp.get("id", ""),
-                    "leverancier": exp.get("leverancier", ""),
-                    "beschrijving": exp.get("beschrijving", ""),
-                    "datum": exp.get("datum", ""),
-                    "categorie": exp.get("categorie", ""),
-                    "aanschafwaarde": subtotaal,
-                    "restwaarde": restwaarde,
-                    "jaren": jaren,
-                    "jaarlijkse_afschrijving": round(jaarlijks, 2),
-                    "jaar_van_aanschaf": exp_year,
-                    "boekwaarde_begin": round(max(0, subtotaal - jaarlijks * (jaar - exp_year)), 2),
-                    "boekwaarde_eind": round(max(0, subtotaal - jaarlijks * (jaar - exp_year + 1)), 2),
-                })
-        else:
-            if exp_year == jaar:
-                subtotaal = exp.get("subtotaal", 0)
-                kosten_direct += subtotaal
-                cat = exp.get("categorie", "Overig") or "Overig"
-                kosten_per_categorie[cat] += subtotaal
+            kosten_direct += subtotaal
+            cat = exp.get("categorie", "Overig") or "Overig"
+            kosten_per_categorie[cat] += subtotaal
 
     # === 3. MVA (Materiële Vaste Activa) ===
-    mva_items = []
-    mva_boekwaarde_begin = 0.0
-    mva_boekwaarde_eind = 0.0
-    mva_aanschaf_dit_jaar = 0.0
-
-    for exp in all_expense_data:
-        if not exp.get("afschrijving"):
-            continue
-        exp_year = get_year(exp.get("datum", ""))
-        jaren = exp.get("afschrijving_jaren") or 1
-        restwaarde = exp.get("afschrijving_restwaarde") or 0
-        subtotaal = exp.get("subtotaal", 0)
-        jaarlijks = (subtotaal - restwaarde) / jaren
-
-        years_elapsed_begin = jaar - exp_year
-        years_elapsed_end = jaar - exp_year + 1
-
-        bw_begin = 0.0
-        bw_eind = 0.0
-
-        if 0 <= years_elapsed_begin <= jaren:
-            bw_begin = max(0, subtotaal - jaarlijks * years_elapsed_begin)
-        if 0 < years_elapsed_end <= jaren:
-            bw_eind = max(0, subtotaal - jaarlijks * years_elapsed_end)
-        if exp_year == jaar:
-            bw_begin = 0
-            mva_aanschaf_dit_jaar += subtotaal
-
-        if bw_begin > 0 or bw_eind > 0:
-            mva_items.append({
-                "id": exp.get("id", ""),
-                "leverancier": exp.get("leverancier", ""),
-                "beschrijving": exp.get("beschrijving", ""),
-                "datum": exp.get("datum", ""),
-                "categorie": exp.get("categorie", ""),
-                "aanschafwaarde": subtotaal,
-                "restwaarde": restwaarde,
-                "jaren": jaren,
-                "jaarlijkse_afschrijving": round(jaarlijks, 2),
-                "boekwaarde_begin": round(bw_begin, 2),
-                "boekwaarde_eind": round(bw_eind, 2),
-                "afschrijving_dit_jaar": round(jaarlijks if exp_year <= jaar < exp_year + jaren else 0, 2),
-            })
-            mva_boekwaarde_begin += bw_begin
-            mva_boekwaarde_eind += bw_eind
+    mva = register.mva(jaar)
+    mva_items = mva["items"]
+    mva_boekwaarde_begin = mva["boekwaarde_begin"]
+    mva_boekwaarde_eind = mva["boekwaarde_eind"]
+    mva_aanschaf_dit_jaar = mva["aanschaf_dit_jaar"]
 
     # === 4. DEBITEUREN ===
     # All invoices marked "betaald" are treated as paid on invoice date.
@@ -357,6 +314,11 @@ def _load_all_data(db, uid):
     )
     all_expense_data = [{"id": doc.id, **doc.to_dict()} for doc in expenses]
 
+    return all_invoice_data, all_expense_data, _years_from_data(all_invoice_data, all_expense_data)
+
+
+def _years_from_data(all_invoice_data: list[dict], all_expense_data: list[dict]) -> list[int]:
+    """All years with invoices, expenses or running depreciation, newest first."""
     all_years = set()
     for inv in all_invoice_data:
         y = get_year(inv.get("factuurdatum", ""))
@@ -366,90 +328,119 @@ def _load_all_data(db, uid):
         y = get_year(exp.get("datum", ""))
         if y:
             all_years.add(y)
-            if exp.get("afschrijving"):
-                jaren = exp.get("afschrijving_jaren") or 1
-                for offset in range(jaren):
-                    all_years.add(y + offset)
+        all_years.update(depreciation_years(exp))
+
+    return sorted(all_years, reverse=True)
 
-    return all_invoice_data, all_expense_data, sorted(all_years, reverse=True)
 
+def _load_beschikbare_jaren(db, uid) -> list[int]:
+    """Available years, reading only the date fields of invoices and expenses."""
+    invoices = (
+        db.collection("invoices")
+        .where(filter=FieldFilter("user_id", "==", uid))
+        .select(["factuurdatum"])
+        .stream()
+    )
+    expenses = (
+        db.collection("expenses")
+        .where(filter=FieldFilter("user_id", "==", uid))
+        .select(["datum", "afschrijving", "afschrijving_jaren"])
+        .stream()
+    )
+    return _years_from_data(
+        [doc.to_dict() for doc in invoices],
+        [doc.to_dict() for doc in expenses],
+    )
+
+
+# === Bank statement import ===
+
+# Fields that identify a transaction within an account
+_TRANSACTION_KEY_FIELDS = ("datum", "bedrag", "saldo_na_mutatie", "omschrijving", "tegenrekening", "mededelingen")
 
-# === Bank CSV Parsing ===
 
-def _detect_and_parse_csv(content: str) -> tuple[str, str, list[dict]]:
+def _transaction_key(uid: str, account_number: str, tx: dict) -> str:
+    """Deterministic id of a transaction: the same row uploaded again gets the same key.
+
+    Identical rows within one account are told apart by the upload by
+    appending their occurrence number.
     """
-    Detect CSV format and parse transactions.
-    Returns (account_name, account_number, transactions).
+    payload = "\x1f".join([
+        uid,
+        account_number,
+        tx.get("datum") or "",
+        f"{tx.get('bedrag') or 0:.2f}",
+        f"{tx.get('saldo_na_mutatie') or 0:.2f}",
+        tx.get("omschrijving") or "",
+        tx.get("tegenrekening") or "",
+        tx.get("mededelingen") or "",
+    ])
+    return hashlib.sha256(payload.encode()).hexdigest()[:40]
+
+
+def _stored_transaction_keys(db, uid: str, account_number: str) -> Counter:
+    """Content keys of the transactions already stored for an account."""
+    return Counter(
+        _transaction_key(uid, account_number, doc.to_dict())
+        for doc in db.collection("bank_transactions")
+        .where(filter=FieldFilter("user_id", "==", uid))
+        .where(filter=FieldFilter("account_number", "==", account_number))
+        .select(list(_TRANSACTION_KEY_FIELDS))
+        .stream()
+    )
+
+
+def _save_bank_account(db, uid: str, imported: dict, ingelezen_at: str):
+    """Upsert the metadata of an account after importing into it.
 
-    Supports two ING formats:
-    1. Betaalrekening: date=YYYYMMDD, amount col="Bedrag (EUR)", has "Code"/"Tag"
-    2. Spaarrekening: date=YYYY-MM-DD, amount col="Bedrag", has "Rekening naam"/"Valuta"
+    `ingelezen_at` stamps the upload; it is recorded on the account when the
+    upload added transactions, for incremental matching.
     """
-    reader = csv.DictReader(io.StringIO(content), delimiter=";")
-    fields = reader.fieldnames or []
-    # Strip quotes from fieldnames
-    fields = [f.strip('"') for f in fields]
-    reader.fieldnames = fields
-
-    is_spaar = "Rekening naam" in fields
-    amount_col = "Bedrag" if is_spaar else "Bedrag (EUR)"
-    account_number = ""
-    account_name = ""
-
-    transactions = []
-    for row in reader:
-        raw_datum = row.get("Datum", "").strip('"')
-        if is_spaar:
-            # Format: YYYY-MM-DD → keep as-is
-            datum = raw_datum
-        else:
-            # Format: YYYYMMDD → convert to YYYY-MM-DD
-            if len(raw_datum) == 8:
-                datum = f"{raw_datum[:4]}-{raw_datum[4:6]}-{raw_datum[6:8]}"
-            else:
-                datum = raw_datum
-
-        af_bij = row.get("Af Bij", "").strip('"')
-        bedrag_str = row.get(amount_col, "0").strip('"').replace(".", "").replace(",", ".")
-        try:
-            bedrag = float(bedrag_str)
-        except ValueError:
-            bedrag = 0.0
-        if af_bij == "Af":
-            bedrag = -bedrag
-
-        saldo_str = row.get("Saldo na mutatie", "0").strip('"').replace(".", "").replace(",", ".")
-        try:
-            saldo = float(saldo_str)
-        except ValueError:
-            saldo = 0.0
-
-        if not account_number:
-            account_number = row.get("Rekening", "").strip('"')
-        if is_spaar and not account_name:
-            account_name = row.get("Rekening naam", "").strip('"')
-
-        omschrijving = row.get("Naam / Omschrijving", "") or row.get("Omschrijving", "")
-        omschrijving = omschrijving.strip('"')
-
-        tegenrekening = row.get("Tegenrekening", "").strip('"')
-        mededelingen = row.get("Mededelingen", "").strip('"')
-
-        transactions.append({
-            "datum": datum,
-            "omschrijving": omschrijving,
-            "bedrag": round(bedrag, 2),
-            "saldo_na_mutatie": round(saldo, 2),
-            "af_bij": af_bij,
-            "mutatiesoort": row.get("Mutatiesoort", "").strip('"'),
-            "tegenrekening": tegenrekening,
-            "mededelingen": mededelingen,
-        })
+    existing_acc = list(
+        db.collection("bank_accounts")
+        .where(filter=FieldFilter("user_id", "==", uid))
+        .where(filter=FieldFilter("account_number", "==", imported["account_number"]))
+        .stream()
+    )
+    old_acc = existing_acc[0].to_dict() if existing_acc else {}
+    acc_data = {
+        "account_number": imported["account_number"],
+        "account_name": imported["account_name"],
+        "min_date": min(filter(None, [imported["min_date"], old_acc.get("min_date", "")]), default=""),
+        "max_date": max(imported["max_date"], old_acc.get("max_date", "")),
+        "transaction_count": imported["stored"] + imported["nieuw"],
+        "uploaded_at": date.today().isoformat(),
+        "matched_velden": True,  # every transaction carries matched / matched_invoice_id
+        "user_id": uid,
+    }
+    if imported["nieuw"]:
+        acc_data["ingelezen_at"] = ingelezen_at
+    if imported["nieuw"] or not existing_acc:
+        acc_data["updated_at"] = ingelezen_at
+    if existing_acc:
+        existing_acc[0].reference.update(acc_data)
+    else:
+        db.collection("bank_accounts").add(acc_data)
 
-    if not account_name:
-        account_name = f"Betaalrekening {account_number}"
 
-    return account_name, account_number, transactions
+def _finish_bank_import(db, uid: str, imported: dict, ingelezen_at: str, failures: list = ()):
+    """Save the accounts of an upload and invalidate what its new transactions change.
+
+    Also called when the upload stops halfway, so the transactions written
+    up to then are reflected in the account metadata, snapshots and stored
+    suggestions. `failures` are the writes of the upload that failed for
+    good (BulkWrites.failures); those transactions do not count as new.
+    """
+    failed = Counter(f.operation.document_data["account_number"] for f in failures)
+    accounts = list(imported.values())
+    for account in accounts:
+        account["nieuw"] -= failed[account["account_number"]]
+        _save_bank_account(db, uid, account, ingelezen_at)
+
+    # Liquide middelen changed from the earliest new transaction onwards
+    if any(acc["nieuw"] for acc in accounts):
+        invalidate_snapshots(db, uid, *filter(None, (acc["new_min_date"] for acc in accounts)))
+        invalidate_suggestions(db, uid)
 
 
 def _get_saldo_at_date(transactions: list[dict], target_date: str) -> float | None:
@@ -467,10 +458,10 @@ def _get_saldo_at_date(transactions: list[dict], target_date: str) -> float | No
     return best["saldo_na_mutatie"] if best else None
 
 
-def _load_bank_data(db, uid) -> dict:
+def _load_bank_accounts(db, uid) -> dict:
     """
-    Load bank accounts and compute saldo per date from stored transactions.
-    Returns: {account_number: {"name": ..., "transactions": [...], "min_date": ..., "max_date": ...}}
+    Load bank account metadata without transactions.
+    Returns: {account_number: {"name": ..., "min_date": ..., "max_date": ...}}
     """
     accounts = {}
     docs = list(
@@ -486,6 +477,15 @@ def _load_bank_data(db, uid) -> dict:
             "min_date": d.get("min_date", ""),
             "max_date": d.get("max_date", ""),
         }
+    return accounts
+
+
+def _load_bank_data(db, uid) -> dict:
+    """
+    Load bank accounts and compute saldo per date from stored transactions.
+    Returns: {account_number: {"name": ..., "transactions": [...], "min_date": ..., "max_date": ...}}
+    """
+    accounts = _load_bank_accounts(db, uid)
 
     # Load transactions per account
     for acc_nr in accounts:
@@ -596,6 +596,49 @@ def _get_prev_year_eind(overrides: dict[int, dict], jaar: int) -> dict | None:
     }
 
 
+def _resolve_jaarcijfers(
+    db,
+    uid: str,
+    jaar: int,
+    all_invoice_data: list[dict],
+    all_expense_data: list[dict],
+    overrides: dict[int, dict],
+    generations: dict,
+    bank_accounts: dict | None = None,
+    snapshots: dict[int, dict] | None = None,
+    register: AssetRegister | None = None,
+) -> dict:
+    """Jaarcijfers for one year: accountant override, frozen snapshot, or live computation.
+
+    `snapshots` may hold preloaded snapshot documents; when None the year's
+    snapshot is read directly. Computed closed years are stored as snapshot,
+    unless invalidated since `generations` was loaded (before the data).
+    The asset register is only built when the year is computed; pass
+    `register` when resolving several years from the same expenses.
+    """
+    if jaar in overrides:
+        return _override_to_jaarcijfers(overrides[jaar])
+
+    # Use previous year's override eind as begin
+    prev_eind = _get_prev_year_eind(overrides, jaar)
+    if snapshots is None:
+        snapshot = get_snapshot(db, uid, jaar, prev_eind)
+    else:
+        snapshot = get_loaded_snapshot(snapshots, jaar, prev_eind)
+    if snapshot is not None:
+        return snapshot
+
+    if bank_accounts is None:
+        bank_accounts = _load_bank_data(db, uid)
+    if register is None:
+        register = AssetRegister.from_expenses(all_expense_data)
+    result = _compute_jaarcijfers(
+        jaar, all_invoice_data, all_expense_data, register, bank_accounts, prev_eind,
+    )
+    save_snapshot(db, uid, jaar, result, prev_eind, generations)
+    return result
+
+
 # === Endpoints ===
 
 @router.get("/bank-status")
@@ -625,81 +668,103 @@ async def get_bank_status(user: dict = Depends(get_current_user)):
 
 @router.post("/upload-csv")
 async def upload_bank_csv(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
+    matchen: bool = False,
     user: dict = Depends(get_current_user),
 ):
-    """Upload and process an ING bank CSV (betaalrekening or spaarrekening)."""
-    if not file.filename or not file.filename.lower().endswith(".csv"):
-        raise HTTPException(400, "Alleen CSV-bestanden zijn toegestaan")
+    """Upload and process a bank statement: ING CSV (betaalrekening or
+    spaarrekening), CAMT.053 XML or MT940. A file may hold several accounts.
 
-    content = (await file.read()).decode("utf-8-sig")
+    Transactions get deterministic ids, so uploading an overlapping export
+    again only writes the rows that are not stored yet; existing
+    transactions (and their matches) are left untouched.
+
+    With `matchen`, the new transactions are matched against open invoices
+    in the background (incremental bank matching).
+    """
+    if not file.filename or not file.filename.lower().endswith(STATEMENT_EXTENSIONS):
+        raise HTTPException(400, "Alleen CSV-, CAMT.053- (XML) en MT940-bestanden zijn toegestaan")
+
+    rows = parse_statement(file.file)
     try:
-        account_name, account_number, transactions = _detect_and_parse_csv(content)
-    except Exception as e:
-        raise HTTPException(400, f"Fout bij verwerken CSV: {str(e)}")
+        first = next(rows, None)
+    except PARSE_ERRORS as e:
+        raise HTTPException(400, f"Fout bij verwerken bestand: {str(e)}")
 
-    if not transactions:
-        raise HTTPException(400, "Geen transacties gevonden in CSV")
+    if first is None:
+        raise HTTPException(400, "Geen transacties gevonden in bestand")
 
     db = get_db()
     uid = user["uid"]
 
-    # Find date range
-    dates = [tx["datum"] for tx in transactions if tx["datum"]]
-    min_date = min(dates) if dates else ""
-    max_date = max(dates) if dates else ""
-
-    # Delete existing transactions for this account
-    existing = list(
-        db.collection("bank_transactions")
-        .where(filter=FieldFilter("user_id", "==", uid))
-        .where(filter=FieldFilter("account_number", "==", account_number))
-        .stream()
-    )
-    batch = db.batch()
-    for doc in existing:
-        batch.delete(doc.reference)
-    batch.commit()
-
-    # Store new transactions in batches of 500
-    for i in range(0, len(transactions), 500):
-        batch = db.batch()
-        for tx in transactions[i:i + 500]:
-            ref = db.collection("bank_transactions").document()
-            batch.set(ref, {
-                **tx,
-                "account_number": account_number,
-                "user_id": uid,
-            })
-        batch.commit()
+    # Store the new transactions while parsing; the bulk writer sends them in parallel
+    ingelezen_at = datetime.now(timezone.utc).isoformat()
+    imported = {}  # account number -> import summary
+    stored = Counter()
+    seen = Counter()
+    writes = None
+    try:
+        with BulkWrites(db) as writes:
+            for account_name, account_number, tx in itertools.chain([first], rows):
+                account = imported.get(account_number)
+                if account is None:
+                    keys = _stored_transaction_keys(db, uid, account_number)
+                    stored.update(keys)
+                    account = imported[account_number] = {
+                        "account_name": account_name,
+                        "account_number": account_number,
+                        "transactions": 0,
+                        "nieuw": 0,
+                        "stored": sum(keys.values()),
+                        "min_date": "",
+                        "max_date": "",
+                        "new_min_date": "",
+                    }
+                account["transactions"] += 1
+                if tx["datum"]:
+                    account["min_date"] = min(account["min_date"] or tx["datum"], tx["datum"])
+                    account["max_date"] = max(account["max_date"], tx["datum"])
+
+                key = _transaction_key(uid, account_number, tx)
+                occurrence = seen[key]
+                seen[key] += 1
+                if occurrence < stored[key]:
+                    continue
+                account["nieuw"] += 1
+                if tx["datum"]:
+                    account["new_min_date"] = min(account["new_min_date"] or tx["datum"], tx["datum"])
+                doc_id = key if occurrence == 0 else f"{key}-{occurrence}"
+                writes.set(db.collection("bank_transactions").document(doc_id), {
+                    **tx,
+                    **transaction_match_fields(tx),
+                    "matched": False,
+                    "matched_invoice_id": None,
+                    "account_number": account_number,
+                    "ingelezen_at": ingelezen_at,
+                    "user_id": uid,
+                })
+    except PARSE_ERRORS as e:
+        raise HTTPException(400, f"Fout bij verwerken bestand: {str(e)}")
+    finally:
+        # Rows written before an error stay stored
+        _finish_bank_import(db, uid, imported, ingelezen_at, writes.failures if writes else [])
 
-    # Upsert account metadata
-    existing_acc = list(
-        db.collection("bank_accounts")
-        .where(filter=FieldFilter("user_id", "==", uid))
-        .where(filter=FieldFilter("account_number", "==", account_number))
-        .stream()
-    )
-    acc_data = {
-        "account_number": account_number,
-        "account_name": account_name,
-        "min_date": min_date,
-        "max_date": max_date,
-        "transaction_count": len(transactions),
-        "uploaded_at": date.today().isoformat(),
-        "user_id": uid,
-    }
-    if existing_acc:
-        existing_acc[0].reference.update(acc_data)
-    else:
-        db.collection("bank_accounts").add(acc_data)
+    accounts = list(imported.values())
+    if matchen and writes.count:
+        background_tasks.add_task(run_incremental_matching, db, uid)
 
     return {
-        "account_name": account_name,
-        "account_number": account_number,
-        "transactions": len(transactions),
-        "min_date": min_date,
-        "max_date": max_date,
+        "account_name": ", ".join(acc["account_name"] for acc in accounts),
+        "account_number": ", ".join(acc["account_number"] for acc in accounts),
+        "transactions": sum(acc["transactions"] for acc in accounts),
+        "nieuw": writes.count,
+        "min_date": min((acc["min_date"] for acc in accounts if acc["min_date"]), default=""),
+        "max_date": max(acc["max_date"] for acc in accounts),
+        "accounts": [
+            {key: acc[key] for key in ("account_name", "account_number", "transactions", "nieuw", "min_date", "max_date")}
+            for acc in accounts
+        ],
     }
 
 
@@ -719,19 +784,19 @@ async def delete_bank_account(
     account_number = doc.to_dict().get("account_number", "")
 
     # Delete transactions
-    txs = list(
-        db.collection("bank_transactions")
+    bulk_delete(db, (
+        tx_doc.reference
+        for tx_doc in db.collection("bank_transactions")
         .where(filter=FieldFilter("user_id", "==", uid))
         .where(filter=FieldFilter("account_number", "==", account_number))
+        .select([FieldPath.document_id()])
         .stream()
-    )
-    batch = db.batch()
-    for tx_doc in txs:
-        batch.delete(tx_doc.reference)
-    batch.commit()
+    ))
 
     # Delete account
     db.collection("bank_accounts").document(account_id).delete()
+    invalidate_snapshots(db, uid, doc.to_dict().get("min_date", ""))
+    invalidate_suggestions(db, uid)
     return {"ok": True}
 
 
@@ -743,9 +808,10 @@ async def get_jaarcijfers_overzicht(
     db = get_db()
     uid = user["uid"]
 
+    generations = load_generations(db, uid)
     all_invoice_data, all_expense_data, beschikbare_jaren = _load_all_data(db, uid)
-    bank_accounts = _load_bank_data(db, uid)
     overrides = _load_overrides(db, uid)
+    snapshots = load_snapshots(db, uid)
 
     # Add override years to beschikbare_jaren
     for y in overrides:
@@ -753,22 +819,22 @@ async def get_jaarcijfers_overzicht(
             beschikbare_jaren.append(y)
     beschikbare_jaren = sorted(set(beschikbare_jaren), reverse=True)
 
-    # Compute for each year
+    # Bank transactions are only needed for years without override or snapshot
+    needs_compute = any(
+        y not in overrides
+        and get_loaded_snapshot(snapshots, y, _get_prev_year_eind(overrides, y)) is None
+        for y in beschikbare_jaren
+    )
+    bank_accounts = _load_bank_data(db, uid) if needs_compute else _load_bank_accounts(db, uid)
+
+    # Compute for each year, sharing one asset register
+    register = AssetRegister.from_expenses(all_expense_data) if needs_compute else None
     jaren_data = {}
     for y in sorted(beschikbare_jaren):
-        if y in overrides:
-            # Use accountant data
-            jaren_data[y] = _override_to_jaarcijfers(overrides[y])
-        else:
-            # Compute, using previous year's override eind as begin
-            prev_eind = _get_prev_year_eind(overrides, y)
-            jaren_data[y] = _compute_jaarcijfers(
-                y,
-                all_invoice_data,
-                all_expense_data,
-                bank_accounts,
-                prev_eind,
-            )
+        jaren_data[y] = _resolve_jaarcijfers(
+            db, uid, y, all_invoice_data, all_expense_data, overrides, generations, bank_accounts, snapshots,
+            register,
+        )
 
     # Bank status summary
     bank_status = []
@@ -796,8 +862,21 @@ async def get_jaarcijfers(
     db = get_db()
     uid = user["uid"]
 
-    all_invoice_data, all_expense_data, beschikbare_jaren = _load_all_data(db, uid)
     overrides = _load_overrides(db, uid)
+    if jaar in overrides:
+        result = _override_to_jaarcijfers(overrides[jaar])
+    else:
+        result = get_snapshot(db, uid, jaar, _get_prev_year_eind(overrides, jaar))
+
+    if result is not None:
+        # Override or snapshot: only the available years need raw data
+        beschikbare_jaren = _load_beschikbare_jaren(db, uid)
+    else:
+        generations = load_generations(db, uid)
+        all_invoice_data, all_expense_data, beschikbare_jaren = _load_all_data(db, uid)
+        result = _resolve_jaarcijfers(
+            db, uid, jaar, all_invoice_data, all_expense_data, overrides, generations, snapshots={},
+        )
 
     # Add override years
     for y in overrides:
@@ -805,13 +884,6 @@ async def get_jaarcijfers(
             beschikbare_jaren.append(y)
     beschikbare_jaren = sorted(set(beschikbare_jaren), reverse=True)
 
-    if jaar in overrides:
-        result = _override_to_jaarcijfers(overrides[jaar])
-    else:
-        bank_accounts = _load_bank_data(db, uid)
-        prev_eind = _get_prev_year_eind(overrides, jaar)
-        result = _compute_jaarcijfers(jaar, all_invoice_data, all_expense_data, bank_accounts, prev_eind)
-
     result["beschikbare_jaren"] = beschikbare_jaren
     return result
 
@@ -835,39 +907,223 @@ def _date_to_dutch(date_str: str) -> str:
     return date_str
 
 
-def _storage_path_from_url(url: str) -> str:
-    """Extract the Firebase Storage blob path from a public URL.
-    
-    Public URLs look like:
-      https://storage.googleapis.com/BUCKET/expenses/uid/timestamp_file.pdf
-    Or Firebase REST API URLs:
-      https://firebasestorage.googleapis.com/v0/b/BUCKET/o/path%2Fto%2Ffile
+# === Excel sheets ===
+
+def _get_quarter(date_str: str) -> int:
+    try:
+        return (int(date_str[5:7]) - 1) // 3 + 1
+    except (ValueError, IndexError):
+        return 0
+
+
+def _eigenaar_aandelen(eigenaar: str) -> list[tuple[str, float]]:
+    """Split an amount over Daan and Wim the same way the W&V dashboard does."""
+    if eigenaar == "Beiden":
+        return [("Daan", 0.5), ("Wim", 0.5)]
+    if eigenaar in ("Daan", "Wim"):
+        return [(eigenaar, 1.0)]
+    return []
+
+
+def _overzicht_sheet(jaar: int, rows: list[dict]) -> SheetWriter:
+    sheet = SheetWriter(str(jaar), money_columns={4, 5})
+    sheet.title_row(f"Overzicht facturen {jaar} – Opwolken.com VOF", span=7)
+    sheet.blank()
+    sheet.header(["In/Uit", "Factuurdatum", "Factuurnummer", "Daan of Wim", "BTW", "Waarde", "Bestand"])
+    for row in rows:
+        sheet.row([
+            row["in_uit"],
+            _date_to_dutch(row["factuurdatum"]),
+            row["factuurnummer"],
+            row["daan_of_wim"],
+            row["btw"],
+            row["waarde"],
+            row["bestand"],
+        ])
+    return sheet
+
+
+def _btw_sheet(jaar: int, all_invoice_data: list[dict], all_expense_data: list[dict]) -> SheetWriter:
+    """BTW per kwartaal, rounded like the aangifte on the financieel dashboard."""
+    kwartalen = {q: {"omzet": 0.0, "omzet_btw": 0.0, "inkoop": 0.0, "inkoop_btw": 0.0} for q in range(1, 5)}
+
+    for inv in all_invoice_data:
+        datum = inv.get("factuurdatum", "")
+        q = _get_quarter(datum)
+        if get_year(datum) == jaar and q in kwartalen and inv.get("status") in ("verzonden", "betaald"):
+            kwartalen[q]["omzet"] += inv.get("subtotaal", 0)
+            kwartalen[q]["omzet_btw"] += inv.get("btw_totaal", 0)
+
+    for exp in all_expense_data:
+        datum = exp.get("datum", "")
+        q = _get_quarter(datum)
+        if get_year(datum) == jaar and q in kwartalen:
+            kwartalen[q]["inkoop"] += exp.get("subtotaal", 0)
+            kwartalen[q]["inkoop_btw"] += exp.get("btw", 0)
+
+    sheet = SheetWriter("BTW per kwartaal", money_columns={1, 2, 3, 4, 5})
+    sheet.title_row(f"BTW per kwartaal {jaar}", span=6)
+    sheet.blank()
+    sheet.header(["Kwartaal", "Omzet", "BTW omzet", "Inkoop", "BTW inkoop", "Te betalen"])
+    totaal = [0, 0, 0, 0, 0]
+    for q, k in kwartalen.items():
+        values = [
+            math.floor(k["omzet"]),
+            math.floor(k["omzet_btw"]),
+            math.ceil(k["inkoop"]),
+            math.ceil(k["inkoop_btw"]),
+            math.floor(k["omzet_btw"]) - math.ceil(k["inkoop_btw"]),
+        ]
+        totaal = [t + v for t, v in zip(totaal, values)]
+        sheet.row([f"Q{q}", *values])
+    sheet.row(["Totaal", *totaal], bold=True)
+    return sheet
+
+
+def _wv_eigenaar_sheet(
+    jaar: int, all_invoice_data: list[dict], all_expense_data: list[dict], register: AssetRegister,
+) -> SheetWriter:
+    """Winst & verlies per eigenaar: omzet per klant and (depreciation-aware) kosten per categorie."""
+    omzet = {"Daan": defaultdict(float), "Wim": defaultdict(float)}
+    kosten = {"Daan": defaultdict(float), "Wim": defaultdict(float)}
+
+    for inv in all_invoice_data:
+        if get_year(inv.get("factuurdatum", "")) != jaar or inv.get("status") not in ("verzonden", "betaald"):
+            continue
+        klant = inv.get("klant_naam", "Onbekend") or "Onbekend"
+        for naam, aandeel in _eigenaar_aandelen(inv.get("daan_of_wim") or "Beiden"):
+            omzet[naam][klant] += inv.get("subtotaal", 0) * aandeel
+
+    for exp in all_expense_data:
+        bedrag = get_expense_amount_for_year(exp, jaar, register)
+        if bedrag == 0:
+            continue
+        categorie = exp.get("categorie", "Overig") or "Overig"
+        if exp.get("afschrijving"):
+            categorie = f"Afschrijving: {categorie}"
+        for naam, aandeel in _eigenaar_aandelen(exp.get("daan_of_wim") or "Beiden"):
+            kosten[naam][categorie] += bedrag * aandeel
+
+    sheet = SheetWriter("W&V per eigenaar", money_columns={3})
+    sheet.title_row(f"Winst & verlies per eigenaar {jaar}", span=4)
+    sheet.blank()
+    sheet.header(["Eigenaar", "Soort", "Naam", "Bedrag"])
+    for naam in ("Daan", "Wim"):
+        for klant, bedrag in sorted(omzet[naam].items(), key=lambda x: x[1], reverse=True):
+            sheet.row([naam, "Omzet", klant, round(bedrag, 2)])
+        for categorie, bedrag in sorted(kosten[naam].items(), key=lambda x: x[1], reverse=True):
+            sheet.row([naam, "Kosten", categorie, round(bedrag, 2)])
+        totaal_omzet = math.floor(sum(omzet[naam].values()))
+        totaal_kosten = math.ceil(sum(kosten[naam].values()))
+        sheet.row([naam, "Totaal omzet", "", totaal_omzet], bold=True)
+        sheet.row([naam, "Totaal kosten", "", totaal_kosten], bold=True)
+        sheet.row([naam, "Winst", "", totaal_omzet - totaal_kosten], bold=True)
+        sheet.blank()
+    return sheet
+
+
+def _mva_sheet(jaar: int, jaarcijfers: dict) -> SheetWriter:
+    mva = jaarcijfers.get("mva", {})
+    sheet = SheetWriter("MVA", money_columns={4, 5, 7, 8, 9, 10})
+    sheet.title_row(f"Materiële vaste activa {jaar}", span=11)
+    sheet.blank()
+    sheet.header([
+        "Leverancier", "Beschrijving", "Aanschafdatum", "Jaren", "Aanschafwaarde", "Restwaarde",
+        "Jaar van aanschaf", "Afschrijving per jaar", "Boekwaarde begin", f"Afschrijving {jaar}", "Boekwaarde eind",
+    ])
+    for item in mva.get("items", []):
+        sheet.row([
+            item.get("leverancier", ""),
+            item.get("beschrijving", ""),
+            _date_to_dutch(item.get("datum", "")),
+            item.get("jaren"),
+            item.get("aanschafwaarde", 0),
+            item.get("restwaarde", 0),
+            get_year(item.get("datum", "")) or None,
+            item.get("jaarlijkse_afschrijving", 0),
+            item.get("boekwaarde_begin", 0),
+            item.get("afschrijving_dit_jaar", 0),
+            item.get("boekwaarde_eind", 0),
+        ])
+    sheet.row([
+        "Totaal", "", "", None, mva.get("totaal_aanschaf_dit_jaar", 0), None, None, None,
+        mva.get("totaal_boekwaarde_begin", 0), mva.get("totaal_afschrijving", 0), mva.get("totaal_boekwaarde_eind", 0),
+    ], bold=True)
+    return sheet
+
+
+def _balans_sheet(jaar: int, jaarcijfers: dict) -> SheetWriter:
+    activa = jaarcijfers.get("balans", {}).get("activa", {})
+    passiva = jaarcijfers.get("balans", {}).get("passiva", {})
+
+    sheet = SheetWriter("Balans", money_columns={1, 2})
+    sheet.title_row(f"Balans {jaar} ({jaarcijfers.get('bron', '')})", span=3)
+    sheet.blank()
+    sheet.header(["Post", f"1-1-{jaar}", f"31-12-{jaar}"])
+
+    def post(label: str, waarde: dict | None, bold: bool = False):
+        waarde = waarde or {}
+        sheet.row([label, waarde.get("begin"), waarde.get("eind")], bold=bold)
+
+    sheet.row(["Activa"], bold=True)
+    post("Materiële vaste activa", activa.get("mva"))
+    post("Debiteuren", activa.get("debiteuren"))
+    post("Liquide middelen", activa.get("liquide_middelen"))
+    post("Totaal activa", activa.get("totaal"), bold=True)
+    sheet.blank()
+    sheet.row(["Passiva"], bold=True)
+    post("Eigen vermogen", passiva.get("eigen_vermogen"))
+    post("Crediteuren", passiva.get("crediteuren"))
+    post("BTW schuld", passiva.get("btw_schuld"))
+    post("Kortlopende schulden", passiva.get("kortlopend_totaal"))
+    post("Totaal passiva", passiva.get("totaal"), bold=True)
+    return sheet
+
+
+def _export_fingerprint(db, uid: str, jaar: int, all_invoice_data: list[dict], all_expense_data: list[dict]) -> str:
+    """Hash of everything that ends up in a year's export, used to reuse finished exports.
+
+    Balans figures depend on earlier years too, so all invoices and expenses count,
+    together with company settings (PDF layout), customers, overrides and bank uploads.
     """
-    if not url:
-        return ""
-    decoded = unquote(urlparse(url).path)
-    # REST API format: /v0/b/bucket/o/the/actual/path
-    if "/o/" in decoded:
-        return decoded.split("/o/", 1)[1]
-    # Public URL format: /BUCKET/the/actual/path
-    bucket = FIREBASE_STORAGE_BUCKET
-    if bucket and f"/{bucket}/" in decoded:
-        return decoded.split(f"/{bucket}/", 1)[1]
-    # Fallback: everything after 3rd slash segment
-    parts = decoded.lstrip("/").split("/", 1)
-    return parts[1] if len(parts) > 1 else ""
+    settings_doc = db.collection("company_settings").document(uid).get()
+    customers = db.collection("customers").where(filter=FieldFilter("user_id", "==", uid)).stream()
+    bank_accounts = db.collection("bank_accounts").where(filter=FieldFilter("user_id", "==", uid)).stream()
+    key = {
+        "jaar": jaar,
+        "invoices": sorted((d["id"], d.get("updated_at", ""), d.get("status", "")) for d in all_invoice_data),
+        "expenses": sorted((d["id"], d.get("updated_at", ""), d.get("pdf_url") or "") for d in all_expense_data),
+        "company": settings_doc.to_dict() if settings_doc.exists else {},
+        "customers": sorted((c.id, c.to_dict().get("updated_at", "")) for c in customers),
+        "overrides": _load_overrides(db, uid),
+        "bank": sorted(
+            (b.get("account_number", ""), b.get("uploaded_at", ""), b.get("updated_at", ""),
+             b.get("transaction_count", 0), b.get("max_date", ""))
+            for b in (doc.to_dict() for doc in bank_accounts)
+        ),
+    }
+    payload = json.dumps(key, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
 
 
-@router.get("/{jaar}/export")
-async def export_jaarcijfers(
+def _build_export_zip(
+    db,
+    uid: str,
     jaar: int,
-    user: dict = Depends(get_current_user),
+    out: BinaryIO,
+    all_invoice_data: list[dict] | None = None,
+    all_expense_data: list[dict] | None = None,
+    progress: JobProgress | None = None,
+    generations: dict | None = None,
 ):
-    """Export a ZIP with Excel overview + all invoice/expense PDFs for the year."""
-    db = get_db()
-    uid = user["uid"]
+    """Write the export ZIP (Excel overview + all invoice/expense PDFs for the year) to `out`.
 
-    all_invoice_data, all_expense_data, _ = _load_all_data(db, uid)
+    PDFs go into the ZIP as soon as they are fetched, so only the Excel rows stay in memory.
+    Preloaded data comes with the snapshot `generations` read before loading it.
+    """
+    if all_invoice_data is None or all_expense_data is None:
+        generations = load_generations(db, uid)
+        all_invoice_data, all_expense_data, _ = _load_all_data(db, uid)
 
     # Load company settings + customers for on-the-fly PDF generation
     settings_doc = db.collection("company_settings").document(uid).get()
@@ -891,145 +1147,104 @@ async def export_jaarcijfers(
         if get_year(exp.get("datum", "")) == jaar
     ]
 
+    if progress:
+        progress.start(len(year_invoices) + len(year_expenses))
+
     # Build rows for Excel
     rows = []
     bucket = storage.bucket()
 
-    for inv in year_invoices:
-        factuurnummer = inv.get("factuurnummer", "")
-        bestand = f"{factuurnummer}.pdf"
-
-        # Try storage path from pdf_url first, fallback to convention
-        storage_path = _storage_path_from_url(inv.get("pdf_url", ""))
-        if not storage_path:
-            storage_path = f"invoices/{uid}/{inv.get('id')}.pdf"
-
-        # Try to get existing PDF; generate on-the-fly if missing
-        pdf_bytes = None
-        try:
-            blob = bucket.blob(storage_path)
-            pdf_bytes = blob.download_as_bytes()
-        except Exception:
-            pass
-
-        if not pdf_bytes:
-            # Generate PDF on the fly
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+        for inv in year_invoices:
+            factuurnummer = inv.get("factuurnummer", "")
+            bestand = f"{factuurnummer}.pdf"
+
+            # Cached PDF; only rendered when the invoice, company or customer changed
             try:
                 klant = customer_cache.get(inv.get("klant_id", ""), {})
-                pdf_bytes = generate_invoice_pdf(inv, company, klant)
+                pdf_bytes, _ = get_invoice_pdf(db, uid, inv["id"], inv, company, klant)
             except Exception:
                 pdf_bytes = None
-        rows.append({
-            "in_uit": "In",
-            "factuurdatum": inv.get("factuurdatum", ""),
-            "factuurnummer": factuurnummer,
-            "daan_of_wim": inv.get("daan_of_wim", "") or "",
-            "btw": inv.get("btw_totaal", 0),
-            "waarde": inv.get("totaal", 0),
-            "bestand": bestand,
-            "pdf_bytes": pdf_bytes,
-        })
-
-    for exp in year_expenses:
-        pdf_url = exp.get("pdf_url", "") or ""
-        # Determine filename for the PDF
-        if pdf_url:
-            raw_name = _filename_from_url(pdf_url)
-            # Strip the timestamp prefix (2024-01-01T00:00:00+00:00_filename.pdf)
-            if "_" in raw_name:
-                bestand = raw_name.split("_", 1)[1]
+            if pdf_bytes:
+                zf.writestr(f"inkomsten/{bestand}", pdf_bytes)
+            rows.append({
+                "in_uit": "In",
+                "factuurdatum": inv.get("factuurdatum", ""),
+                "factuurnummer": factuurnummer,
+                "daan_of_wim": inv.get("daan_of_wim", "") or "",
+                "btw": inv.get("btw_totaal", 0),
+                "waarde": inv.get("totaal", 0),
+                "bestand": bestand,
+            })
+            if progress:
+                progress.advance()
+
+        for exp in year_expenses:
+            pdf_url = exp.get("pdf_url", "") or ""
+            # Determine filename for the PDF
+            if pdf_url:
+                raw_name = _filename_from_url(pdf_url)
+                # Strip the timestamp prefix (2024-01-01T00:00:00+00:00_filename.pdf)
+                if "_" in raw_name:
+                    bestand = raw_name.split("_", 1)[1]
+                else:
+                    bestand = raw_name
             else:
-                bestand = raw_name
-        else:
-            bestand = ""
+                bestand = ""
 
-        storage_path = _storage_path_from_url(pdf_url)
+            storage_path = storage_path_from_url(pdf_url)
 
-        # Download expense PDF
-        pdf_bytes = None
-        if storage_path:
-            try:
-                blob = bucket.blob(storage_path)
-                pdf_bytes = blob.download_as_bytes()
-            except Exception:
-                pass
-
-        rows.append({
-            "in_uit": "Uit",
-            "factuurdatum": exp.get("datum", ""),
-            "factuurnummer": exp.get("factuurnummer", ""),
-            "daan_of_wim": exp.get("daan_of_wim", "") or "",
-            "btw": -(exp.get("btw", 0) or 0),
-            "waarde": -(exp.get("totaal", 0) or 0),
-            "bestand": bestand,
-            "pdf_bytes": pdf_bytes,
-        })
-
-    # Sort by date descending
-    rows.sort(key=lambda r: r["factuurdatum"], reverse=True)
-
-    # === Build Excel ===
-    wb = Workbook()
-    ws = wb.active
-    ws.title = str(jaar)
-
-    # Title row
-    ws.merge_cells("A1:G1")
-    title_cell = ws["A1"]
-    title_cell.value = f"Overzicht facturen {jaar} – Opwolken.com VOF"
-    title_cell.font = Font(bold=True, size=14)
-    title_cell.alignment = Alignment(horizontal="left")
-
-    # Header row (row 3)
-    headers = ["In/Uit", "Factuurdatum", "Factuurnummer", "Daan of Wim", "BTW", "Waarde", "Bestand"]
-    for col, h in enumerate(headers, 1):
-        cell = ws.cell(row=3, column=col, value=h)
-        cell.font = Font(bold=True)
-
-    # Data rows
-    for i, row in enumerate(rows, 4):
-        ws.cell(row=i, column=1, value=row["in_uit"])
-        ws.cell(row=i, column=2, value=_date_to_dutch(row["factuurdatum"]))
-        ws.cell(row=i, column=3, value=row["factuurnummer"])
-        ws.cell(row=i, column=4, value=row["daan_of_wim"])
-        btw_cell = ws.cell(row=i, column=5, value=row["btw"])
-        btw_cell.number_format = '#,##0.00'
-        val_cell = ws.cell(row=i, column=6, value=row["waarde"])
-        val_cell.number_format = '#,##0.00'
-        ws.cell(row=i, column=7, value=row["bestand"])
-
-    # Auto-width columns
-    for col in ws.columns:
-        max_len = 0
-        col_letter = None
-        for cell in col:
-            if hasattr(cell, "column_letter"):
-                col_letter = cell.column_letter
-            if cell.value and not isinstance(cell, type(None)):
+            # Download expense PDF
+            pdf_bytes = None
+            if storage_path:
                 try:
-                    max_len = max(max_len, len(str(cell.value)))
+                    blob = bucket.blob(storage_path)
+                    pdf_bytes = blob.download_as_bytes()
                 except Exception:
                     pass
-        if col_letter:
-            ws.column_dimensions[col_letter].width = min(max_len + 3, 50)
-
-    excel_buf = io.BytesIO()
-    wb.save(excel_buf)
-    excel_buf.seek(0)
+            if bestand and pdf_bytes:
+                zf.writestr(f"uitgaven/{bestand}", pdf_bytes)
+
+            rows.append({
+                "in_uit": "Uit",
+                "factuurdatum": exp.get("datum", ""),
+                "factuurnummer": exp.get("factuurnummer", ""),
+                "daan_of_wim": exp.get("daan_of_wim", "") or "",
+                "btw": -(exp.get("btw", 0) or 0),
+                "waarde": -(exp.get("totaal", 0) or 0),
+                "bestand": bestand,
+            })
+            if progress:
+                progress.advance()
 
-    # === Build ZIP ===
-    zip_buf = io.BytesIO()
+        # Sort by date descending
+        rows.sort(key=lambda r: r["factuurdatum"], reverse=True)
 
-    with zipfile.ZipFile(zip_buf, "w", zipfile.ZIP_DEFLATED) as zf:
-        zf.writestr(f"overzicht-{jaar}.xlsx", excel_buf.read())
+        # === Build Excel ===
+        overrides = _load_overrides(db, uid)
+        register = AssetRegister.from_expenses(all_expense_data)
+        jaarcijfers = _resolve_jaarcijfers(
+            db, uid, jaar, all_invoice_data, all_expense_data, overrides, generations, register=register,
+        )
+        excel_bytes = save_workbook([
+            _overzicht_sheet(jaar, rows),
+            _btw_sheet(jaar, all_invoice_data, all_expense_data),
+            _wv_eigenaar_sheet(jaar, all_invoice_data, all_expense_data, register),
+            _mva_sheet(jaar, jaarcijfers),
+            _balans_sheet(jaar, jaarcijfers),
+        ])
+        zf.writestr(f"overzicht-{jaar}.xlsx", excel_bytes)
 
-        # Add PDFs
-        for row in rows:
-            if not row["bestand"] or not row.get("pdf_bytes"):
-                continue
-            folder = "inkomsten" if row["in_uit"] == "In" else "uitgaven"
-            zf.writestr(f"{folder}/{row['bestand']}", row["pdf_bytes"])
 
+@router.get("/{jaar}/export")
+async def export_jaarcijfers(
+    jaar: int,
+    user: dict = Depends(get_current_user),
+):
+    """Export a ZIP with Excel overview + all invoice/expense PDFs for the year."""
+    db = get_db()
+    zip_buf = io.BytesIO()
+    _build_export_zip(db, user["uid"], jaar, zip_buf)
     zip_buf.seek(0)
 
     return StreamingResponse(
@@ -1039,3 +1254,185 @@ async def export_jaarcijfers(
             "Content-Disposition": f'attachment; filename="boekhouding-{jaar}.zip"'
         },
     )
+
+
+# === Export jobs ===
+
+def _export_job_response(job: dict) -> dict:
+    done = job.get("status") == STATUS_DONE
+    return {
+        "id": job["id"],
+        "jaar": job.get("jaar"),
+        "status": job.get("status"),
+        "done": job.get("done", 0),
+        "total": job.get("total", 0),
+        "error": job.get("error"),
+        "created_at": job.get("created_at"),
+        "updated_at": job.get("updated_at"),
+        "download_url": f"/api/jaarcijfers/export-jobs/{job['id']}/download" if done else None,
+    }
+
+
+def _get_export_job(db, uid: str, job_id: str) -> dict:
+    doc = db.collection("export_jobs").document(job_id).get()
+    if not doc.exists or doc.to_dict().get("user_id") != uid:
+        raise HTTPException(404, "Exporttaak niet gevonden")
+    return {"id": doc.id, **doc.to_dict()}
+
+
+# Superseded exports stay downloadable this long after their last update
+EXPORT_KEEP_SUPERSEDED = timedelta(hours=1)
+
+
+def _prune_export_jobs(db, uid: str, jaar: int):
+    """Delete the superseded export jobs of a year, with their ZIPs.
+
+    The newest job that finished or is still running is the current export.
+    Jobs created before it are superseded, except finished jobs with the
+    same fingerprint, which share its ZIP and are reused. Superseded jobs
+    are deleted once they are no longer running and have not changed for
+    EXPORT_KEEP_SUPERSEDED, so a client that just saw one finish can still
+    download it.
+    """
+    jobs = [
+        {"id": doc.id, **doc.to_dict()}
+        for doc in db.collection("export_jobs")
+        .where(filter=FieldFilter("user_id", "==", uid))
+        .where(filter=FieldFilter("jaar", "==", jaar))
+        .stream()
+    ]
+
+    def running(job: dict) -> bool:
+        return job.get("status") in ACTIVE_STATUSES and not is_stale(job)
+
+    current = [job for job in jobs if job.get("status") == STATUS_DONE or running(job)]
+    if not current:
+        return
+    latest = max(current, key=lambda job: job.get("created_at", ""))
+    cutoff = (datetime.now(timezone.utc) - EXPORT_KEEP_SUPERSEDED).isoformat()
+
+    for job in jobs:
+        if (
+            job.get("created_at", "") >= latest.get("created_at", "")
+            or (job.get("status") == STATUS_DONE and job.get("fingerprint") == latest.get("fingerprint"))
+            or running(job)
+            or job.get("updated_at", "") > cutoff
+        ):
+            continue
+        storage_path = job.get("storage_path")
+        if storage_path and storage_path != latest.get("storage_path"):
+            try:
+                storage.bucket().blob(storage_path).delete()
+            except Exception:
+                pass
+        db.collection("export_jobs").document(job["id"]).delete()
+
+
+def _run_export_job(
+    job_id: str,
+    uid: str,
+    jaar: int,
+    fingerprint: str,
+    all_invoice_data: list[dict],
+    all_expense_data: list[dict],
+    generations: dict,
+):
+    """Background task: build the export ZIP on disk and store it in Firebase Storage."""
+    db = get_db()
+    progress = JobProgress(db, "export_jobs", job_id)
+    try:
+        storage_path = f"exports/{uid}/boekhouding-{jaar}-{fingerprint[:16]}.zip"
+        with tempfile.TemporaryFile() as tmp:
+            _build_export_zip(db, uid, jaar, tmp, all_invoice_data, all_expense_data, progress, generations)
+            tmp.seek(0)
+            blob = storage.bucket().blob(storage_path)
+            blob.upload_from_file(tmp, content_type="application/zip")
+        progress.finish(storage_path=storage_path)
+    except Exception as e:
+        progress.fail(f"Fout bij exporteren: {str(e)}")
+        return
+    _prune_export_jobs(db, uid, jaar)
+
+
+@router.post("/{jaar}/export-jobs")
+async def create_export_job(
+    jaar: int,
+    background_tasks: BackgroundTasks,
+    user: dict = Depends(get_current_user),
+):
+    """Start building the export ZIP in the background, or reuse one for unchanged data."""
+    db = get_db()
+    uid = user["uid"]
+
+    generations = load_generations(db, uid)
+    all_invoice_data, all_expense_data, _ = _load_all_data(db, uid)
+    fingerprint = _export_fingerprint(db, uid, jaar, all_invoice_data, all_expense_data)
+
+    existing = [
+        {"id": doc.id, **doc.to_dict()}
+        for doc in db.collection("export_jobs")
+        .where(filter=FieldFilter("user_id", "==", uid))
+        .where(filter=FieldFilter("jaar", "==", jaar))
+        .where(filter=FieldFilter("fingerprint", "==", fingerprint))
+        .stream()
+    ]
+    existing.sort(key=lambda j: j.get("created_at", ""), reverse=True)
+    _prune_export_jobs(db, uid, jaar)
+    for job in existing:
+        if job.get("status") == STATUS_DONE:
+            return _export_job_response(job)
+        if job.get("status") in ACTIVE_STATUSES and not is_stale(job):
+            return _export_job_response(job)
+
+    job = create_job(db, "export_jobs", {
+        "user_id": uid,
+        "jaar": jaar,
+        "fingerprint": fingerprint,
+        "storage_path": None,
+    })
+    background_tasks.add_task(
+        _run_export_job, job["id"], uid, jaar, fingerprint, all_invoice_data, all_expense_data, generations,
+    )
+    return _export_job_response(job)
+
+
+@router.get("/export-jobs/{job_id}")
+async def get_export_job(job_id: str, user: dict = Depends(get_current_user)):
+    """Poll the progress of an export job."""
+    return _export_job_response(_get_export_job(get_db(), user["uid"], job_id))
+
+
+@router.get("/export-jobs/{job_id}/events")
+async def stream_export_job(job_id: str, user: dict = Depends(get_current_user)):
+    """Follow an export job as server-sent events until it is finished."""
+    db = get_db()
+    _get_export_job(db, user["uid"], job_id)
+    ref = db.collection("export_jobs").document(job_id)
+    return StreamingResponse(
+        job_event_stream(ref, formatter=_export_job_response),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@router.get("/export-jobs/{job_id}/download")
+async def download_export_job(job_id: str, user: dict = Depends(get_current_user)):
+    """Download the ZIP produced by a finished export job."""
+    job = _get_export_job(get_db(), user["uid"], job_id)
+    if job.get("status") != STATUS_DONE or not job.get("storage_path"):
+        raise HTTPException(409, "Export is nog niet klaar")
+
+    reader = storage.bucket().blob(job["storage_path"]).open("rb")
+
+    def chunks():
+        with reader:
+            while chunk := reader.read(1024 * 1024):
+                yield chunk
+
+    return StreamingResponse(
+        chunks(),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="boekhouding-{job["jaar"]}.zip"'
+        },
+    )
@@ -0,0 +1,147 @@
+"""Register of fixed assets (MVA) built from depreciated expenses.
+
+Every expense with `afschrijving` becomes an Asset whose complete schedule is
+computed once: depreciation per year and per month, and book values at the
+start and end of each year. The dashboard and jaarcijfers routers build one
+register per request from the expenses they load and query it, instead of
+re-deriving depreciation for every year, month and section.
+"""
+
+from dataclasses import dataclass, field
+
+from app.services.jaarcijfers_snapshots import get_year
+
+
+def depreciation_years(exp: dict) -> range:
+    """Years in which a depreciated expense is written off; empty without a purchase date."""
+    start = get_year(exp.get("datum", ""))
+    if not exp.get("afschrijving") or not start:
+        return range(0)
+    return range(start, start + (exp.get("afschrijving_jaren") or 1))
+
+
+@dataclass
+class AssetYear:
+    afschrijving: float
+    boekwaarde_begin: float  # balans value on 1 January (0 in the year of purchase)
+    boekwaarde_eind: float  # balans value on 31 December
+
+
+@dataclass
+class Asset:
+    expense: dict
+    jaar_van_aanschaf: int
+    jaren: int
+    aanschafwaarde: float
+    restwaarde: float
+    jaarlijks: float
+    maandelijks: float
+    jaren_schema: dict[int, AssetYear] = field(default_factory=dict)
+    maanden_schema: dict[str, float] = field(default_factory=dict)
+
+    @classmethod
+    def from_expense(cls, exp: dict) -> "Asset":
+        start = get_year(exp.get("datum", ""))
+        jaren = exp.get("afschrijving_jaren") or 1
+        restwaarde = exp.get("afschrijving_restwaarde") or 0
+        subtotaal = exp.get("subtotaal", 0)
+        jaarlijks = (subtotaal - restwaarde) / jaren
+        asset = cls(
+            expense=exp,
+            jaar_van_aanschaf=start,
+            jaren=jaren,
+            aanschafwaarde=subtotaal,
+            restwaarde=restwaarde,
+            jaarlijks=jaarlijks,
+            maandelijks=(subtotaal - restwaarde) / jaren / 12,
+        )
+
+        # Depreciation runs from the year of purchase for `jaren` years; the year
+        # after that still carries the residual value as begin balance.
+        for jaar in range(start, start + jaren + 1):
+            elapsed = jaar - start
+            actief = jaar < start + jaren
+            begin = 0 if jaar == start else max(0, subtotaal - jaarlijks * elapsed)
+            eind = max(0, subtotaal - jaarlijks * (elapsed + 1)) if actief else 0.0
+            asset.jaren_schema[jaar] = AssetYear(
+                afschrijving=jaarlijks if actief else 0,
+                boekwaarde_begin=begin,
+                boekwaarde_eind=eind,
+            )
+            if actief:
+                for maand in range(1, 13):
+                    asset.maanden_schema[f"{jaar}-{maand:02d}"] = asset.maandelijks
+        return asset
+
+    def afschrijving(self, jaar: int) -> float:
+        entry = self.jaren_schema.get(jaar)
+        return entry.afschrijving if entry else 0.0
+
+
+class AssetRegister:
+    """All assets of a user, in expense order, with lookups by expense id."""
+
+    def __init__(self, assets: list[Asset]):
+        self.assets = assets
+        self._by_id = {a.expense.get("id"): a for a in assets}
+
+    @classmethod
+    def from_expenses(cls, expenses: list[dict]) -> "AssetRegister":
+        return cls([Asset.from_expense(exp) for exp in expenses if exp.get("afschrijving")])
+
+    def afschrijving(self, expense_id: str, jaar: int) -> float:
+        asset = self._by_id.get(expense_id)
+        return asset.afschrijving(jaar) if asset else 0.0
+
+    def afschrijving_maand(self, expense_id: str, maand: str) -> float:
+        """Depreciation of one asset in month `maand` (YYYY-MM)."""
+        asset = self._by_id.get(expense_id)
+        return asset.maanden_schema.get(maand, 0.0) if asset else 0.0
+
+    def jaren(self) -> set[int]:
+        """All years in which an asset (with a known purchase date) is depreciated."""
+        return {jaar for a in self.assets for jaar in depreciation_years(a.expense)}
+
+    def totaal_afschrijving(self, jaar: int) -> float:
+        totaal = 0.0
+        for asset in self.assets:
+            totaal += asset.afschrijving(jaar)
+        return totaal
+
+    def mva(self, jaar: int) -> dict:
+        """MVA staat for a year: items with book value, begin/eind totals and purchases."""
+        items = []
+        boekwaarde_begin = 0.0
+        boekwaarde_eind = 0.0
+        aanschaf_dit_jaar = 0.0
+
+        for asset in self.assets:
+            if asset.jaar_van_aanschaf == jaar:
+                aanschaf_dit_jaar += asset.aanschafwaarde
+            entry = asset.jaren_schema.get(jaar)
+            if not entry or (entry.boekwaarde_begin <= 0 and entry.boekwaarde_eind <= 0):
+                continue
+            exp = asset.expense
+            items.append({
+                "id": exp.get("id", ""),
+                "leverancier": exp.get("leverancier", ""),
+                "beschrijving": exp.get("beschrijving", ""),
+                "datum": exp.get("datum", ""),
+                "categorie": exp.get("categorie", ""),
+                "aanschafwaarde": asset.aanschafwaarde,
+                "restwaarde": asset.restwaarde,
+                "jaren": asset.jaren,
+                "jaarlijkse_afschrijving": round(asset.jaarlijks, 2),
+                "boekwaarde_begin": round(entry.boekwaarde_begin, 2),
+                "boekwaarde_eind": round(entry.boekwaarde_eind, 2),
+                "afschrijving_dit_jaar": round(entry.afschrijving, 2),
+            })
+            boekwaarde_begin += entry.boekwaarde_begin
+            boekwaarde_eind += entry.boekwaarde_eind
+
+        return {
+            "items": items,
+            "boekwaarde_begin": boekwaarde_begin,
+            "boekwaarde_eind": boekwaarde_eind,
+            "aanschaf_dit_jaar": aanschaf_dit_jaar,
+        }
@@ -0,0 +1,406 @@
+"""Bank matching runs: load a user's invoices and transactions, match, store.
+
+`run_bank_matching` is the database side of `matching.run_match`. It loads
+the open invoices and free incoming transactions, stores the matches (match
+documents, paid invoices, transaction flags and learned customer IBANs),
+rewrites the stored suggestions and returns the results shown on the
+matching page. With a JobProgress the results are also published to the
+job as they are computed. The helpers for the transaction match flags are
+shared with the bank matching router.
+"""
+
+from datetime import datetime, timezone
+
+from google.cloud.firestore_v1 import FieldFilter
+from google.cloud.firestore_v1.field_path import FieldPath
+
+from app.services.batch_writes import BulkWrites, WriteGroups
+from app.services.jaarcijfers_snapshots import invalidate_snapshots
+from app.services.jobs import JobProgress
+from app.services.match_suggestions import (
+    STORED_MIN_SCORE,
+    STORED_SUGGESTIONS,
+    stale_suggestions,
+    suggestion_entries,
+    suggestion_entry,
+    suggestions_write,
+)
+from app.services.matching import IbanIndex, run_match
+
+# Job subcollection the results of a run are published to
+JOB_RESULTS = "resultaten"
+
+
+def matched_fields(invoice_id: str | None) -> dict:
+    """Denormalized match state of a bank transaction."""
+    return {"matched": invoice_id is not None, "matched_invoice_id": invoice_id}
+
+
+def load_accounts(db, uid: str) -> list:
+    return list(
+        db.collection("bank_accounts")
+        .where(filter=FieldFilter("user_id", "==", uid))
+        .stream()
+    )
+
+
+def ensure_matched_flags(db, uid: str, accounts: list):
+    """Backfill `matched` / `matched_invoice_id` on transactions uploaded before they existed.
+
+    Accounts uploaded since carry `matched_velden`; for the others the flags
+    are derived once from the match documents.
+    """
+    missing = [acc for acc in accounts if not acc.to_dict().get("matched_velden")]
+    if not missing:
+        return
+
+    matched = {}  # transaction id -> invoice id
+    for doc in db.collection("invoice_bank_matches").where(filter=FieldFilter("user_id", "==", uid)).stream():
+        d = doc.to_dict()
+        for tx_id in d.get("transaction_ids", []):
+            matched[tx_id] = d.get("invoice_id", "")
+
+    with BulkWrites(db) as writes:
+        for acc in missing:
+            tx_docs = (
+                db.collection("bank_transactions")
+                .where(filter=FieldFilter("user_id", "==", uid))
+                .where(filter=FieldFilter("account_number", "==", acc.to_dict().get("account_number", "")))
+                .select([FieldPath.document_id()])
+                .stream()
+            )
+            for doc in tx_docs:
+                writes.update(doc.reference, matched_fields(matched.get(doc.id)))
+
+    # Mark the accounts only once all their transactions are flagged
+    for acc in missing:
+        acc.reference.update({"matched_velden": True})
+
+
+def available_transactions(db, uid: str, accounts: list | None = None) -> list[dict]:
+    """Incoming transactions not matched to an invoice (one query on the `matched` flag)."""
+    ensure_matched_flags(db, uid, load_accounts(db, uid) if accounts is None else accounts)
+    tx_docs = (
+        db.collection("bank_transactions")
+        .where(filter=FieldFilter("user_id", "==", uid))
+        .where(filter=FieldFilter("af_bij", "==", "Bij"))
+        .where(filter=FieldFilter("matched", "==", False))
+        .stream()
+    )
+    return [{"id": doc.id, **doc.to_dict()} for doc in tx_docs]
+
+
+def iban_index(db, uid: str, invoices: list[dict], customers: dict[str, dict]) -> IbanIndex:
+    """IBANs of the customers, plus the tegenrekening of every matched transaction for its invoice's customer."""
+    klant_per_invoice = {inv["id"]: inv.get("klant_id", "") for inv in invoices}
+    pairs = [(cust.get("iban", ""), klant_id) for klant_id, cust in customers.items()]
+    matched_docs = (
+        db.collection("bank_transactions")
+        .where(filter=FieldFilter("user_id", "==", uid))
+        .where(filter=FieldFilter("af_bij", "==", "Bij"))
+        .where(filter=FieldFilter("matched", "==", True))
+        .select(["tegenrekening", "matched_invoice_id"])
+        .stream()
+    )
+    for doc in matched_docs:
+        d = doc.to_dict()
+        pairs.append((d.get("tegenrekening", ""), klant_per_invoice.get(d.get("matched_invoice_id"), "")))
+    return IbanIndex(pairs)
+
+
+def _load_new_transactions(db, uid: str, accounts: list) -> list[dict]:
+    """Incoming transactions uploaded after each account's `matched_ingelezen_at` watermark.
+
+    The watermark is the upload stamp (`ingelezen_at`) of the last upload
+    scored, so transactions backfilled into an earlier period are new too.
+    Accounts without a watermark are scanned in full.
+    """
+    transactions = []
+    for acc in accounts:
+        d = acc.to_dict()
+        query = (
+            db.collection("bank_transactions")
+            .where(filter=FieldFilter("user_id", "==", uid))
+            .where(filter=FieldFilter("af_bij", "==", "Bij"))
+            .where(filter=FieldFilter("account_number", "==", d.get("account_number", "")))
+        )
+        if d.get("matched_ingelezen_at"):
+            query = query.where(filter=FieldFilter("ingelezen_at", ">", d["matched_ingelezen_at"]))
+        transactions.extend({"id": doc.id, **doc.to_dict()} for doc in query.stream())
+    return transactions
+
+
+def _invoice_result(inv: dict) -> dict:
+    return {
+        "invoice_id": inv["id"],
+        "factuurnummer": inv.get("factuurnummer", ""),
+        "klant_naam": inv.get("klant_naam", ""),
+        "onderwerp": inv.get("onderwerp", ""),
+        "factuurdatum": inv.get("factuurdatum", ""),
+        "totaal": inv.get("totaal", 0),
+    }
+
+
+def _matched_transaction(tx: dict) -> dict:
+    return {
+        "id": tx["id"],
+        "datum": tx["datum"],
+        "bedrag": tx["bedrag"],
+        "omschrijving": tx["omschrijving"],
+        "tegenrekening": tx.get("tegenrekening", ""),
+    }
+
+
+def _matched_results(run) -> list[dict]:
+    """Results for the auto-matched invoices of a run."""
+    results = []
+    for match in run.auto_matched:
+        tx = match["transaction"]
+        results.append({
+            **_invoice_result(match["invoice"]),
+            "status": "matched",
+            "matched_transactions": [_matched_transaction(tx)],
+            "matched_amount": abs(tx["bedrag"]),
+            "remaining_amount": 0,
+        })
+    for match in run.meervoudig:
+        inv_ids = [inv["id"] for inv in match["invoices"]]
+        for inv in match["invoices"]:
+            results.append({
+                **_invoice_result(inv),
+                "status": "matched",
+                "matched_transactions": [_matched_transaction(match["transaction"])],
+                "gedeeld_met": [inv_id for inv_id in inv_ids if inv_id != inv["id"]],
+                "matched_amount": abs(inv.get("totaal", 0)),
+                "remaining_amount": 0,
+            })
+    return results
+
+
+def _unmatched_results(invoices: list[dict], suggestions: list, voorstellen: dict) -> list[dict]:
+    """Results with suggestions for invoices without a match."""
+    return [
+        {
+            **_invoice_result(inv),
+            "status": "unmatched",
+            "matched_transactions": [],
+            "suggestions": [suggestion_entry(tx, score) for score, tx in top],
+            "voorstel": voorstellen.get(inv["id"]),
+            "matched_amount": 0,
+            "remaining_amount": inv.get("totaal", 0),
+        }
+        for inv, top in zip(invoices, suggestions)
+    ]
+
+
+def sort_results(results: list[dict]):
+    # Unmatched first, then matched
+    results.sort(key=lambda r: (0 if r["status"] == "unmatched" else 1, r.get("factuurnummer", "")))
+
+
+def _write_matches(db, uid: str, run, customers: dict) -> dict[str, str]:
+    """Store the auto and multi-invoice matches of a run; returns the customer IBANs learned."""
+    # Apply auto matches: each match document lands atomically with its invoice update
+    now = datetime.now(timezone.utc).isoformat()
+    iban_updates = {}  # klant_id -> iban
+    writes = WriteGroups(db)
+
+    for match in run.auto_matched:
+        inv = match["invoice"]
+        tx = match["transaction"]
+
+        writes.add(
+            # Store match
+            ("set", db.collection("invoice_bank_matches").document(), {
+                "invoice_id": inv["id"],
+                "transaction_ids": [tx["id"]],
+                "match_type": match.get("match_type", "auto"),
+                "user_id": uid,
+                "matched_at": now,
+            }),
+            # Update invoice betaald_op
+            ("update", db.collection("invoices").document(inv["id"]), {
+                "betaald_op": tx["datum"],
+                "status": "betaald",
+                "updated_at": now,
+            }),
+            ("update", db.collection("bank_transactions").document(tx["id"]), matched_fields(inv["id"])),
+        )
+
+        # Collect IBAN for customer
+        tegenrekening = tx.get("tegenrekening", "")
+        klant_id = inv.get("klant_id", "")
+        if tegenrekening and klant_id and klant_id in customers:
+            existing_iban = customers[klant_id].get("iban", "")
+            if not existing_iban:
+                iban_updates[klant_id] = tegenrekening
+
+    # One transaction paying several invoices: a match document per invoice, landing together
+    for match in run.meervoudig:
+        tx = match["transaction"]
+        inv_ids = [inv["id"] for inv in match["invoices"]]
+        group = [("update", db.collection("bank_transactions").document(tx["id"]), matched_fields(inv_ids[0]))]
+        for inv in match["invoices"]:
+            group += [
+                ("set", db.collection("invoice_bank_matches").document(), {
+                    "invoice_id": inv["id"],
+                    "transaction_ids": [tx["id"]],
+                    "match_type": "auto_meervoudig",
+                    "gedeeld_met": [inv_id for inv_id in inv_ids if inv_id != inv["id"]],
+                    "user_id": uid,
+                    "matched_at": now,
+                }),
+                ("update", db.collection("invoices").document(inv["id"]), {
+                    "betaald_op": tx["datum"],
+                    "status": "betaald",
+                    "updated_at": now,
+                }),
+            ]
+        writes.add(*group)
+
+        klant_id = match["invoices"][0].get("klant_id", "")
+        if tx.get("tegenrekening") and klant_id in customers and not customers[klant_id].get("iban"):
+            iban_updates[klant_id] = tx["tegenrekening"]
+
+    # Update customer IBANs
+    for klant_id, iban in iban_updates.items():
+        writes.add(("update", db.collection("customers").document(klant_id), {
+            "iban": iban,
+            "updated_at": now,
+        }))
+
+    writes.commit()
+    return iban_updates
+
+
+def run_bank_matching(
+    db,
+    uid: str,
+    globaal: bool = False,
+    incrementeel: bool = False,
+    meervoudig: bool = False,
+    progress: JobProgress | None = None,
+) -> dict:
+    """Load, match, write and summarize one matching run for a user.
+
+    `incrementeel` only scores transactions uploaded after each bank
+    account's watermark against the open invoices; every run moves the
+    watermarks to the accounts' latest upload. With `progress`,
+    the matches and then the suggestions are published to the job as soon
+    as they are computed.
+    """
+    # Load all invoices (only verzonden/betaald - not concept)
+    inv_docs = list(
+        db.collection("invoices")
+        .where(filter=FieldFilter("user_id", "==", uid))
+        .stream()
+    )
+    all_invoices = [{"id": doc.id, **doc.to_dict()} for doc in inv_docs]
+
+    # Filter to invoices that are not yet paid (verzonden status) or betaald without betaald_op date
+    matchable_invoices = [
+        inv for inv in all_invoices
+        if inv.get("status") in ("verzonden", "betaald") and not inv.get("betaald_op")
+    ]
+
+    # Load free incoming bank transactions (Bij = credit = incoming payment)
+    accounts = load_accounts(db, uid)
+    if incrementeel:
+        ensure_matched_flags(db, uid, accounts)
+        free_transactions = [
+            tx for tx in _load_new_transactions(db, uid, accounts) if not tx.get("matched")
+        ]
+    else:
+        free_transactions = available_transactions(db, uid, accounts)
+
+    # Skip invoices that already have a match
+    match_docs = list(
+        db.collection("invoice_bank_matches")
+        .where(filter=FieldFilter("user_id", "==", uid))
+        .stream()
+    )
+    already_matched_inv_ids = {doc.to_dict().get("invoice_id", "") for doc in match_docs}
+    matchable_invoices = [
+        inv for inv in matchable_invoices if inv["id"] not in already_matched_inv_ids
+    ]
+
+    # Load customers for IBAN updates
+    cust_docs = list(
+        db.collection("customers")
+        .where(filter=FieldFilter("user_id", "==", uid))
+        .stream()
+    )
+    customers = {doc.id: {"id": doc.id, **doc.to_dict()} for doc in cust_docs}
+
+    # Phase 1 (auto-match by factuurnummer) and phase 2 (suggestions). The
+    # matches are stored as soon as they are known, before they are published.
+    ibans = iban_index(db, uid, all_invoices, customers)
+    iban_updates = {}
+
+    def on_matched(run):
+        iban_updates.update(_write_matches(db, uid, run, customers))
+        if progress:
+            matched = _matched_results(run)
+            progress.publish(JOB_RESULTS, matched)
+            progress.advance(len(matched), fase="suggesties")
+
+    def on_suggestions(invoices, suggestions, voorstellen):
+        progress.publish(JOB_RESULTS, _unmatched_results(invoices, suggestions, voorstellen))
+        progress.advance(len(invoices))
+
+    if progress:
+        progress.start(len(matchable_invoices), fase="matchen", transacties=len(free_transactions))
+    run = run_match(
+        matchable_invoices, free_transactions, globaal, meervoudig, ibans,
+        on_matched, on_suggestions if progress else None,
+        None if incrementeel else (STORED_SUGGESTIONS, STORED_MIN_SCORE),
+    )
+    if progress:
+        progress.advance(0, fase="opslaan")
+
+    writes = WriteGroups(db)
+
+    # Stored suggestions: a full run rewrites them for every open invoice; an
+    # incremental run only drops those listing a newly matched transaction
+    paid = [m["invoice"] for m in run.auto_matched] + [inv for m in run.meervoudig for inv in m["invoices"]]
+    used_tx_ids = {m["transaction"]["id"] for m in run.auto_matched + run.meervoudig}
+    if incrementeel:
+        stale = stale_suggestions(db, uid, used_tx_ids, (inv["id"] for inv in paid))
+    else:
+        for inv, top in zip(run.unmatched, run.kandidaten):
+            writes.add(suggestions_write(db, uid, inv, suggestion_entries(top)))
+        stale = stale_suggestions(db, uid, keep=(inv["id"] for inv in run.unmatched))
+    for ref in stale:
+        writes.add(("delete", ref, None))
+
+    # Everything up to each account's latest upload has now been scored
+    for acc in accounts:
+        ingelezen_at = acc.to_dict().get("ingelezen_at", "")
+        if ingelezen_at and ingelezen_at != acc.to_dict().get("matched_ingelezen_at"):
+            writes.add(("update", acc.reference, {"matched_ingelezen_at": ingelezen_at}))
+    writes.commit()
+
+    # Newly paid invoices change debiteuren in their year and after
+    if paid:
+        invalidate_snapshots(db, uid, *(inv.get("factuurdatum", "") for inv in paid))
+
+    results = _matched_results(run) + _unmatched_results(run.unmatched, run.suggestions, run.voorstellen)
+    sort_results(results)
+
+    return {
+        "results": results,
+        "summary": {
+            "total_matchable": len(matchable_invoices),
+            "auto_matched": len(run.auto_matched),
+            "meervoudig": len(run.meervoudig),
+            "unmatched": len(run.unmatched),
+            "iban_updates": len(iban_updates),
+            "incrementeel": incrementeel,
+            "transacties": len(free_transactions),
+        },
+    }
+
+
+def run_incremental_matching(db, uid: str):
+    """Background task after a bank upload: match the new transactions only."""
+    run_bank_matching(db, uid, incrementeel=True)
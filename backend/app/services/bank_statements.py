@@ -0,0 +1,386 @@
+"""Bank statement parsers for the bank upload.
+
+Every parser reads the uploaded file incrementally and yields
+(account_name, account_number, transaction) tuples, with transactions in
+the ING CSV shape: datum, omschrijving, bedrag (negative for debits),
+saldo_na_mutatie, af_bij, mutatiesoort, tegenrekening and mededelingen.
+`parse_statement` detects the format from the first bytes of the file:
+
+- ING CSV (betaalrekening or spaarrekening)
+- ISO 20022 CAMT.053 XML, read with `iterparse`; processed entries are
+  removed from the tree, so memory does not grow with the file
+- SWIFT MT940, read line by line
+
+CAMT.053 and MT940 do not list the balance per transaction; it is carried
+forward from the statement's opening balance.
+"""
+
+import csv
+import io
+import itertools
+import re
+from typing import BinaryIO, Iterator
+from xml.etree.ElementTree import ParseError, iterparse
+
+# Errors raised on malformed input, for the upload to report as such
+PARSE_ERRORS = (ValueError, csv.Error, ParseError)
+
+# File extensions accepted by the bank upload
+STATEMENT_EXTENSIONS = (".csv", ".xml", ".sta", ".940", ".mt940", ".swi", ".txt")
+
+
+def parse_statement(stream: BinaryIO) -> Iterator[tuple[str, str, dict]]:
+    """Detect the statement format and yield its transactions while reading."""
+    head = stream.read(512)
+    stream.seek(0)
+    start = head.lstrip(b"\xef\xbb\xbf \t\r\n")
+    if start.startswith(b"<"):
+        parser = parse_camt053
+    elif start.startswith((b"{1:", b":20:", b"0000 ", b":940:")) or b"\n:20:" in head:
+        parser = parse_mt940
+    else:
+        parser = parse_ing_csv
+    yield from parser(stream)
+
+
+def _text(stream: BinaryIO, **kwargs) -> io.TextIOWrapper:
+    return io.TextIOWrapper(stream, encoding="utf-8-sig", **kwargs)
+
+
+def _amount(value: str) -> float:
+    return float(value.strip().replace(",", "."))
+
+
+def _transaction(datum, omschrijving, bedrag, saldo, mutatiesoort, tegenrekening, mededelingen) -> dict:
+    return {
+        "datum": datum,
+        "omschrijving": omschrijving,
+        "bedrag": round(bedrag, 2),
+        "saldo_na_mutatie": round(saldo, 2),
+        "af_bij": "Af" if bedrag < 0 else "Bij",
+        "mutatiesoort": mutatiesoort,
+        "tegenrekening": tegenrekening,
+        "mededelingen": mededelingen,
+    }
+
+
+# === ING CSV ===
+
+def parse_ing_csv(stream: BinaryIO) -> Iterator[tuple[str, str, dict]]:
+    """
+    Parse an ING CSV export.
+
+    Supports two ING formats:
+    1. Betaalrekening: date=YYYYMMDD, amount col="Bedrag (EUR)", has "Code"/"Tag"
+    2. Spaarrekening: date=YYYY-MM-DD, amount col="Bedrag", has "Rekening naam"/"Valuta"
+    """
+    text = _text(stream, newline="")
+    try:
+        yield from _parse_ing_rows(text)
+    finally:
+        # Leave the upload's file open for its owner
+        text.detach()
+
+
+def _parse_ing_rows(text) -> Iterator[tuple[str, str, dict]]:
+    reader = csv.DictReader(text, delimiter=";")
+    fields = reader.fieldnames or []
+    # Strip quotes from fieldnames
+    fields = [f.strip('"') for f in fields]
+    reader.fieldnames = fields
+
+    is_spaar = "Rekening naam" in fields
+    amount_col = "Bedrag" if is_spaar else "Bedrag (EUR)"
+    account_number = ""
+    account_name = ""
+
+    for row in reader:
+        if None in row.values():
+            raise ValueError(f"Regel {reader.line_num} heeft te weinig kolommen")
+        raw_datum = row.get("Datum", "").strip('"')
+        if is_spaar:
+            # Format: YYYY-MM-DD → keep as-is
+            datum = raw_datum
+        else:
+            # Format: YYYYMMDD → convert to YYYY-MM-DD
+            if len(raw_datum) == 8:
+                datum = f"{raw_datum[:4]}-{raw_datum[4:6]}-{raw_datum[6:8]}"
+            else:
+                datum = raw_datum
+
+        af_bij = row.get("Af Bij", "").strip('"')
+        bedrag_str = row.get(amount_col, "0").strip('"').replace(".", "").replace(",", ".")
+        try:
+            bedrag = float(bedrag_str)
+        except ValueError:
+            bedrag = 0.0
+        if af_bij == "Af":
+            bedrag = -bedrag
+
+        saldo_str = row.get("Saldo na mutatie", "0").strip('"').replace(".", "").replace(",", ".")
+        try:
+            saldo = float(saldo_str)
+        except ValueError:
+            saldo = 0.0
+
+        if not account_number:
+            account_number = row.get("Rekening", "").strip('"')
+        if is_spaar and not account_name:
+            account_name = row.get("Rekening naam", "").strip('"')
+
+        omschrijving = row.get("Naam / Omschrijving", "") or row.get("Omschrijving", "")
+        omschrijving = omschrijving.strip('"')
+
+        tegenrekening = row.get("Tegenrekening", "").strip('"')
+        mededelingen = row.get("Mededelingen", "").strip('"')
+
+        yield account_name or f"Betaalrekening {account_number}", account_number, {
+            "datum": datum,
+            "omschrijving": omschrijving,
+            "bedrag": round(bedrag, 2),
+            "saldo_na_mutatie": round(saldo, 2),
+            "af_bij": af_bij,
+            "mutatiesoort": row.get("Mutatiesoort", "").strip('"'),
+            "tegenrekening": tegenrekening,
+            "mededelingen": mededelingen,
+        }
+
+
+# === CAMT.053 ===
+
+# Balance types that open a statement: opening booked, previously closed booked
+_OPENING_BALANCES = ("OPBD", "PRCD")
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _find(elem, *path):
+    """The first child along `path` of local names (any namespace version), or None."""
+    for name in path:
+        if elem is None:
+            return None
+        elem = next((child for child in elem if _local(child.tag) == name), None)
+    return elem
+
+
+def _findtext(elem, *path) -> str:
+    found = _find(elem, *path)
+    return " ".join((found.text or "").split()) if found is not None else ""
+
+
+def _signed_amount(elem) -> float:
+    bedrag = _amount(_findtext(elem, "Amt") or "0")
+    return -bedrag if _findtext(elem, "CdtDbtInd") == "DBIT" else bedrag
+
+
+def _camt_entry(ntry, saldo: float) -> dict:
+    bedrag = _signed_amount(ntry)
+    datum = _findtext(ntry, "BookgDt", "Dt") or _findtext(ntry, "BookgDt", "DtTm") or _findtext(ntry, "ValDt", "Dt")
+
+    # The counterparty is the debtor of incoming and the creditor of outgoing payments
+    party = "Dbtr" if bedrag >= 0 else "Cdtr"
+    details = _find(ntry, "NtryDtls", "TxDtls")
+    naam = _findtext(details, "RltdPties", party, "Nm") or _findtext(details, "RltdPties", party, "Pty", "Nm")
+    tegenrekening = (
+        _findtext(details, "RltdPties", f"{party}Acct", "Id", "IBAN")
+        or _findtext(details, "RltdPties", f"{party}Acct", "Id", "Othr", "Id")
+    )
+    remittance = _find(details, "RmtInf")
+    mededelingen = [] if remittance is None else [
+        " ".join((elem.text or "").split())
+        for elem in remittance.iter()
+        if _local(elem.tag) in ("Ustrd", "Ref") and elem.text
+    ]
+    info = _findtext(details, "AddtlTxInf") or _findtext(ntry, "AddtlNtryInf")
+
+    return _transaction(
+        datum[:10],
+        naam or info,
+        bedrag,
+        saldo + bedrag,
+        _findtext(ntry, "BkTxCd", "Prtry", "Cd") or _findtext(ntry, "BkTxCd", "Domn", "Fmly", "SubFmlyCd"),
+        tegenrekening,
+        " ".join(mededelingen) or (info if naam else ""),
+    )
+
+
+def parse_camt053(stream: BinaryIO) -> Iterator[tuple[str, str, dict]]:
+    """Parse an ISO 20022 CAMT.053 bank-to-customer statement (any version).
+
+    Booked entries only; pending ones (status PDNG) are skipped. Entries,
+    balances and statements are removed from the tree once read.
+    """
+    account_number = account_name = ""
+    saldo = 0.0
+    parents = []
+    for event, elem in iterparse(stream, events=("start", "end")):
+        if event == "start":
+            parents.append(elem)
+            continue
+        parents.pop()
+        name = _local(elem.tag)
+        parent = parents[-1] if parents else None
+
+        if name == "Acct" and parent is not None and _local(parent.tag) == "Stmt":
+            account_number = _findtext(elem, "Id", "IBAN") or _findtext(elem, "Id", "Othr", "Id")
+            account_name = (
+                _findtext(elem, "Nm") or _findtext(elem, "Ownr", "Nm") or f"Betaalrekening {account_number}"
+            )
+        elif name == "Bal":
+            if _findtext(elem, "Tp", "CdOrPrtry", "Cd") in _OPENING_BALANCES:
+                saldo = _signed_amount(elem)
+        elif name == "Ntry":
+            if "PDNG" not in (_findtext(elem, "Sts"), _findtext(elem, "Sts", "Cd")):
+                tx = _camt_entry(elem, saldo)
+                saldo = tx["saldo_na_mutatie"]
+                yield account_name, account_number, tx
+        elif name != "Stmt":
+            continue
+
+        # Read: drop it, so the tree only holds the statement being parsed
+        if parent is not None:
+            parent.remove(elem)
+
+
+# === MT940 ===
+
+_FIELD = re.compile(r":(\d{2}[A-Z]?):(.*)")
+# :61: value date YYMMDD, optional booking date MMDD, (reversal) credit/debit mark,
+# optional funds code, amount, transaction type
+_STATEMENT_LINE = re.compile(r"(\d{6})(\d{4})?(RC|RD|C|D)[A-Z]?(\d+,\d*)([A-Z][A-Z0-9]{3})?")
+_BALANCE = re.compile(r"([CD])\d{6}[A-Z]{3}(\d+,\d*)")
+# Subfields of a structured :86: field (ING, Rabobank, ABN AMRO SEPA)
+_SUBFIELD = re.compile(
+    r"/(TRTP|IBAN|BIC|NAME|REMI|USTD|STRD|CUR|CDTRREFTP|CDTRREF|CD|ISSR|EREF|MARF|CSID|ORDP|BENM|"
+    r"CNTP|ID|ADDR|PURP|ULTC|ULTD|ULTB|EXCH|CHGS|RTRN|ISDT|SWOC|OCMT)(?=/)"
+)
+# Labels of an unstructured :86: field (older ABN AMRO statements)
+_LABEL = re.compile(r"\b(IBAN|BIC|NAAM|OMSCHRIJVING|KENMERK|MACHTIGING|INCASSANT)\s*:\s*")
+
+
+def _mt940_fields(lines) -> Iterator[tuple[str, str]]:
+    """(tag, value) per field; continuation lines are joined to their field."""
+    tag = value = None
+    for line in lines:
+        line = line.rstrip("\r\n")
+        if line.startswith("{"):
+            # SWIFT envelope: only the text block {4: holds fields
+            _, found, line = line.partition("{4:")
+            if not found:
+                continue
+        field = _FIELD.match(line)
+        if field or line.startswith("-"):
+            if tag:
+                yield tag, value
+            tag, value = field.groups() if field else (None, None)
+        elif tag:
+            # :86: is wrapped at a fixed width, the others per subfield
+            value += ("" if tag == "86" else "\n") + line
+    if tag:
+        yield tag, value
+
+
+def _mt940_account(value: str) -> str:
+    account = value.strip().rsplit("/", 1)[-1].replace(" ", "")
+    # Strip a currency suffix (NL12INGB0001234567EUR)
+    if len(account) > 3 and account[-3:].isalpha() and account[-4].isdigit():
+        account = account[:-3]
+    return account
+
+
+def _mt940_balance(value: str) -> float:
+    match = _BALANCE.match(value.strip())
+    if not match:
+        raise ValueError(f"Ongeldig saldo in MT940: {value[:40]}")
+    bedrag = _amount(match.group(2))
+    return -bedrag if match.group(1) == "D" else bedrag
+
+
+def _mt940_line(value: str) -> tuple[str, float, str]:
+    """(datum, bedrag, transaction type) of a :61: field."""
+    match = _STATEMENT_LINE.match(value.strip())
+    if not match:
+        raise ValueError(f"Ongeldige transactieregel in MT940: {value[:40]}")
+    valuta, boeking, mark, amount, code = match.groups()
+    year, month, day = 2000 + int(valuta[:2]), valuta[2:4], valuta[4:6]
+    if boeking:
+        # The booking date may fall in the year before or after the value date
+        if boeking[:2] == "01" and month == "12":
+            year += 1
+        elif boeking[:2] == "12" and month == "01":
+            year -= 1
+        month, day = boeking[:2], boeking[2:]
+    bedrag = _amount(amount)
+    # Debits and reversed credits leave the account
+    if mark in ("D", "RC"):
+        bedrag = -bedrag
+    return f"{year}-{month}-{day}", bedrag, code or ""
+
+
+def _mt940_details(value: str) -> tuple[str, str, str, str]:
+    """(omschrijving, tegenrekening, mededelingen, mutatiesoort) from a :86: field."""
+    value = value.strip()
+    if value.startswith("/"):
+        parts = _SUBFIELD.split(value)
+        info = {}
+        for key, text in zip(parts[1::2], parts[2::2]):
+            text = " ".join(text.strip("/").split())
+            if text and key not in info:
+                info[key] = text
+        # Rabobank: /CNTP/account/BIC/name/city/
+        cntp = info.get("CNTP", "").split("/")
+        naam = info.get("NAME") or (cntp[2] if len(cntp) > 2 else "")
+        rekening = info.get("IBAN") or cntp[0]
+        mededelingen = " ".join(filter(None, (info.get(key) for key in ("REMI", "USTD", "CDTRREF"))))
+        return naam, rekening, mededelingen, info.get("TRTP", "")
+
+    parts = _LABEL.split(value)
+    info = {key: " ".join(text.split()) for key, text in zip(parts[1::2], parts[2::2])}
+    if not info:
+        return "", "", " ".join(value.split()), ""
+    mededelingen = " ".join(filter(None, (info.get(key) for key in ("OMSCHRIJVING", "KENMERK"))))
+    return info.get("NAAM", ""), info.get("IBAN", ""), mededelingen, " ".join(parts[0].split())
+
+
+def parse_mt940(stream: BinaryIO) -> Iterator[tuple[str, str, dict]]:
+    """Parse a SWIFT MT940 statement file (one or more statements, any account)."""
+    text = _text(stream, errors="replace")
+    try:
+        yield from _parse_mt940_fields(_mt940_fields(text))
+    finally:
+        text.detach()
+
+
+def _mt940_transaction(line: tuple[str, float, str], saldo: float, details: str = "") -> dict:
+    datum, bedrag, code = line
+    omschrijving, tegenrekening, mededelingen, soort = _mt940_details(details)
+    return _transaction(
+        datum, omschrijving or mededelingen, bedrag, saldo + bedrag, soort or code, tegenrekening, mededelingen,
+    )
+
+
+def _parse_mt940_fields(fields) -> Iterator[tuple[str, str, dict]]:
+    account_number = ""
+    saldo = 0.0
+    pending = None  # :61: line waiting for its :86: details
+
+    for tag, value in itertools.chain(fields, [(None, "")]):
+        if pending and tag != "86":
+            tx = _mt940_transaction(pending, saldo)
+            saldo = tx["saldo_na_mutatie"]
+            pending = None
+            yield f"Betaalrekening {account_number}", account_number, tx
+
+        if tag == "25":
+            account_number = _mt940_account(value)
+        elif tag in ("60F", "60M"):
+            saldo = _mt940_balance(value)
+        elif tag == "61":
+            pending = _mt940_line(value)
+        elif tag == "86" and pending:
+            tx = _mt940_transaction(pending, saldo, value)
+            saldo = tx["saldo_na_mutatie"]
+            pending = None
+            yield f"Betaalrekening {account_number}", account_number, tx
@@ -0,0 +1,137 @@
+"""Batched Firestore writes.
+
+Writes are collected as groups of operations that must land together (for
+example a match document and the invoice it pays). Groups are packed into
+WriteBatches of at most 500 operations without splitting a group, and the
+batches are committed in parallel; each batch is atomic on its own.
+
+`BulkWrites` is for large sets of independent writes (imports, deletes,
+cache invalidation). It wraps Firestore's BulkWriter, which chunks the
+operations, sends batches in parallel and follows the 500/50/5 ramp-up rule
+(start at 500 operations per second, grow by 50% every 5 minutes). Writes
+failing with a transient error are retried.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from google.cloud.firestore_v1.bulk_writer import BulkWriterOptions
+
+MAX_BATCH_OPERATIONS = 500
+MAX_PARALLEL_COMMITS = 8
+
+
+class WriteGroups:
+    """Collects set/update/delete operations in groups, then commits them in batches."""
+
+    def __init__(self, db):
+        self.db = db
+        self._groups: list[list[tuple]] = []
+
+    def add(self, *operations: tuple):
+        """Add one group of ("set" | "update" | "delete", ref, data) operations."""
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            raise ValueError(f"Een groep mag maximaal {MAX_BATCH_OPERATIONS} schrijfacties bevatten")
+        if operations:
+            self._groups.append(list(operations))
+
+    def __len__(self) -> int:
+        return sum(len(group) for group in self._groups)
+
+    def _batches(self) -> list:
+        batches = []
+        batch, size = None, 0
+        for group in self._groups:
+            if batch is None or size + len(group) > MAX_BATCH_OPERATIONS:
+                batch, size = self.db.batch(), 0
+                batches.append(batch)
+            for op, ref, data in group:
+                if op == "set":
+                    batch.set(ref, data)
+                elif op == "update":
+                    batch.update(ref, data)
+                elif op == "delete":
+                    batch.delete(ref)
+                else:
+                    raise ValueError(f"Onbekende schrijfactie: {op}")
+            size += len(group)
+        return batches
+
+    def commit(self) -> int:
+        """Commit all groups; returns the number of batches written."""
+        batches = self._batches()
+        if len(batches) == 1:
+            batches[0].commit()
+        elif batches:
+            with ThreadPoolExecutor(max_workers=min(MAX_PARALLEL_COMMITS, len(batches))) as pool:
+                # list() re-raises the first failed commit
+                list(pool.map(lambda batch: batch.commit(), batches))
+        self._groups = []
+        return len(batches)
+
+
+# BulkWriter ramp-up: 500 operations per second, +50% every 5 minutes up to this cap
+BULK_MAX_OPS_PER_SECOND = 10_000
+BULK_MAX_ATTEMPTS = 10
+
+# gRPC status codes worth retrying: DEADLINE_EXCEEDED, RESOURCE_EXHAUSTED, ABORTED, INTERNAL, UNAVAILABLE
+_RETRY_CODES = {4, 8, 10, 13, 14}
+
+
+class BulkWrites:
+    """Independent set/update/delete operations, written in parallel through a BulkWriter.
+
+    Operations are sent while more are being added. Use as a context
+    manager: leaving the block waits for every write and raises when a
+    write failed for good. Nothing is atomic; use WriteGroups for writes
+    that must land together.
+    """
+
+    def __init__(self, db):
+        self.count = 0
+        self.failures = []
+        self._writer = db.bulk_writer(BulkWriterOptions(max_ops_per_second=BULK_MAX_OPS_PER_SECOND))
+        self._writer.on_write_error(self._on_error)
+
+    def _on_error(self, failure, writer) -> bool:
+        if failure.code in _RETRY_CODES and failure.attempts < BULK_MAX_ATTEMPTS:
+            return True
+        self.failures.append(failure)
+        return False
+
+    def set(self, ref, data: dict):
+        self._writer.set(ref, data)
+        self.count += 1
+
+    def update(self, ref, data: dict):
+        self._writer.update(ref, data)
+        self.count += 1
+
+    def delete(self, ref):
+        self._writer.delete(ref)
+        self.count += 1
+
+    def close(self):
+        """Wait for all writes; raises RuntimeError if any of them failed."""
+        self._writer.close()
+        if self.failures:
+            raise RuntimeError(
+                f"{len(self.failures)} van {self.count} schrijfacties mislukt: {self.failures[0].message or self.failures[0].code}"
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Finish what was sent, but let the original error through
+            self._writer.close()
+
+
+def bulk_delete(db, refs) -> int:
+    """Delete the documents behind `refs` (any iterable); returns the number deleted."""
+    with BulkWrites(db) as writes:
+        for ref in refs:
+            writes.delete(ref)
+    return writes.count
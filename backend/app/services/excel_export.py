@@ -0,0 +1,86 @@
+"""Streaming Excel export helpers built on openpyxl's write-only mode.
+
+Write-only worksheets emit their column widths before the first row, so a
+SheetWriter keeps plain row values and tracks the widest value per column as
+rows are added; `save_workbook` then streams every sheet out in one pass.
+"""
+
+import io
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font
+from openpyxl.utils import get_column_letter
+
+MONEY_FORMAT = "#,##0.00"
+MAX_COLUMN_WIDTH = 50
+
+_BOLD = Font(bold=True)
+_TITLE = Font(bold=True, size=14)
+_LEFT = Alignment(horizontal="left")
+
+
+class SheetWriter:
+    """Collects the rows of one write-only worksheet and their column widths."""
+
+    def __init__(self, title: str, money_columns: set[int] | None = None):
+        self.title = title
+        self.money_columns = money_columns or set()  # 0-based column indexes
+        self._rows: list[tuple[tuple, str | None]] = []
+        self._widths: dict[int, int] = {}
+        self._merged: list[str] = []
+
+    def title_row(self, text: str, span: int):
+        """Add a large bold title merged over `span` columns (not width-tracked)."""
+        row_nr = len(self._rows) + 1
+        self._merged.append(f"A{row_nr}:{get_column_letter(span)}{row_nr}")
+        self._rows.append(((text,), "title"))
+
+    def header(self, values):
+        self._add(tuple(values), "bold")
+
+    def row(self, values, bold: bool = False):
+        self._add(tuple(values), "bold" if bold else None)
+
+    def blank(self):
+        self._rows.append(((), None))
+
+    def _add(self, values: tuple, style: str | None):
+        for col, value in enumerate(values):
+            if value is None or value == "":
+                continue
+            length = len(str(value))
+            if length > self._widths.get(col, 0):
+                self._widths[col] = length
+        self._rows.append((values, style))
+
+    def write_to(self, wb: Workbook):
+        ws = wb.create_sheet(self.title)
+        for col, length in self._widths.items():
+            ws.column_dimensions[get_column_letter(col + 1)].width = min(length + 3, MAX_COLUMN_WIDTH)
+        for merged in self._merged:
+            ws.merged_cells.add(merged)
+
+        for values, style in self._rows:
+            cells = []
+            for col, value in enumerate(values):
+                cell = WriteOnlyCell(ws, value=value)
+                if style == "title":
+                    cell.font = _TITLE
+                    cell.alignment = _LEFT
+                elif style == "bold":
+                    cell.font = _BOLD
+                if col in self.money_columns and isinstance(value, (int, float)):
+                    cell.number_format = MONEY_FORMAT
+                cells.append(cell)
+            ws.append(cells)
+
+
+def save_workbook(sheets: list[SheetWriter]) -> bytes:
+    """Stream the given sheets into a write-only workbook and return the xlsx bytes."""
+    wb = Workbook(write_only=True)
+    for sheet in sheets:
+        sheet.write_to(wb)
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
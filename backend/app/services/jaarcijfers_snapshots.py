@@ -0,0 +1,139 @@
+"""Frozen jaarcijfers for closed years.
+
+Computed jaarcijfers for a year before the current calendar year are stored in
+`jaarcijfers_snapshots` (document id `{uid}_{jaar}`) and served as-is on later
+requests. Any write to an invoice, expense or bank transaction dated in year Y
+calls `invalidate_snapshots`, which drops the snapshots of Y and all later
+years: balans begin values (debiteuren, crediteuren, MVA, liquide middelen)
+carry forward, so an old document also changes every year after it.
+
+Every invalidation also bumps a per-year counter (`generaties`). A
+computation reads the counters before loading its data, and the snapshot is
+only saved if they did not change meanwhile, so a result computed from data
+read before a concurrent write is never frozen.
+"""
+
+from datetime import datetime, timezone
+
+from google.cloud.firestore_v1 import FieldFilter, Increment, transactional
+
+from app.services.batch_writes import bulk_delete
+
+COLLECTION = "jaarcijfers_snapshots"
+# One document per user: invalidation counter per closed year, "alle" for undated writes
+GENERATIONS = "jaarcijfers_snapshot_generaties"
+
+# Bump when _compute_jaarcijfers changes, so stored snapshots are recomputed.
+SNAPSHOT_VERSION = 1
+
+
+def get_year(date_str) -> int:
+    """Year of a YYYY-MM-DD date string, 0 if missing or invalid."""
+    try:
+        return int(date_str[:4])
+    except (ValueError, IndexError, TypeError):
+        return 0
+
+
+def is_closed_year(jaar: int) -> bool:
+    return jaar < datetime.now(timezone.utc).year
+
+
+def _snapshot_id(uid: str, jaar: int) -> str:
+    return f"{uid}_{jaar}"
+
+
+def _is_valid(snapshot: dict, prev_eind: dict | None) -> bool:
+    # prev_eind comes from the previous year's accountant override, which is
+    # maintained outside this app, so it is checked on every read.
+    return snapshot.get("versie") == SNAPSHOT_VERSION and snapshot.get("prev_eind") == prev_eind
+
+
+def get_snapshot(db, uid: str, jaar: int, prev_eind: dict | None) -> dict | None:
+    """Return the stored jaarcijfers for a closed year, or None if absent or stale."""
+    if not is_closed_year(jaar):
+        return None
+    doc = db.collection(COLLECTION).document(_snapshot_id(uid, jaar)).get()
+    if not doc.exists:
+        return None
+    snapshot = doc.to_dict()
+    if not _is_valid(snapshot, prev_eind):
+        return None
+    return {**snapshot["result"], "bron": "snapshot"}
+
+
+def load_snapshots(db, uid: str) -> dict[int, dict]:
+    """Load all stored snapshots of a user, keyed by year (validate with `get_loaded_snapshot`)."""
+    docs = db.collection(COLLECTION).where(filter=FieldFilter("user_id", "==", uid)).stream()
+    return {d["jaar"]: d for d in (doc.to_dict() for doc in docs) if d.get("jaar")}
+
+
+def get_loaded_snapshot(snapshots: dict[int, dict], jaar: int, prev_eind: dict | None) -> dict | None:
+    snapshot = snapshots.get(jaar)
+    if not snapshot or not is_closed_year(jaar) or not _is_valid(snapshot, prev_eind):
+        return None
+    return {**snapshot["result"], "bron": "snapshot"}
+
+
+def load_generations(db, uid: str) -> dict:
+    """Invalidation counters of a user's snapshots; read before loading the data to compute from."""
+    doc = db.collection(GENERATIONS).document(uid).get()
+    return doc.to_dict() if doc.exists else {}
+
+
+def _generation(generations: dict, jaar: int) -> tuple[int, int]:
+    return generations.get(str(jaar), 0), generations.get("alle", 0)
+
+
+def save_snapshot(db, uid: str, jaar: int, result: dict, prev_eind: dict | None, generations: dict) -> bool:
+    """Freeze computed jaarcijfers of a closed year; open years are never stored.
+
+    `generations` are the counters loaded (load_generations) before the data
+    `result` was computed from. The snapshot is written in a transaction that
+    refuses if the year was invalidated since; returns whether it was saved.
+    """
+    if not is_closed_year(jaar):
+        return False
+    generations_ref = db.collection(GENERATIONS).document(uid)
+    snapshot_ref = db.collection(COLLECTION).document(_snapshot_id(uid, jaar))
+    expected = _generation(generations, jaar)
+
+    @transactional
+    def save(transaction) -> bool:
+        current = generations_ref.get(transaction=transaction)
+        if _generation(current.to_dict() if current.exists else {}, jaar) != expected:
+            return False
+        transaction.set(snapshot_ref, {
+            "user_id": uid,
+            "jaar": jaar,
+            "versie": SNAPSHOT_VERSION,
+            "prev_eind": prev_eind,
+            "result": result,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        })
+        return True
+
+    return save(db.transaction())
+
+
+def invalidate_snapshots(db, uid: str, *datums):
+    """Drop the snapshots affected by a write to documents dated on `datums`.
+
+    A missing or unparsable date invalidates every snapshot, as such documents
+    count towards the begin balance of all years.
+    """
+    if not datums:
+        return
+    first_year = min(get_year(d) for d in datums)
+    # Bump the counters first, so computations that read older data no longer save
+    if first_year:
+        bump = {str(jaar): Increment(1) for jaar in range(first_year, datetime.now(timezone.utc).year)}
+    else:
+        bump = {"alle": Increment(1)}
+    if bump:
+        db.collection(GENERATIONS).document(uid).set(bump, merge=True)
+    bulk_delete(db, (
+        doc.reference
+        for doc in db.collection(COLLECTION).where(filter=FieldFilter("user_id", "==", uid)).stream()
+        if (doc.to_dict().get("jaar") or 0) >= first_year
+    ))
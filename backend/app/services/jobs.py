@@ -0,0 +1,135 @@
+"""Long-running background jobs tracked as Firestore documents.
+
+A job document holds `status`, `done`/`total` progress and a heartbeat in
+`updated_at`. Work runs in a FastAPI background task; clients poll the
+document or follow it as a server-sent event stream. Jobs with large
+results publish them in numbered chunks to a subcollection of the job, so
+clients can show partial results and the job document stays small.
+"""
+
+import asyncio
+import json
+import time
+from datetime import datetime, timezone, timedelta
+
+from google.cloud.firestore_v1 import FieldFilter
+
+STATUS_QUEUED = "wachtrij"
+STATUS_RUNNING = "bezig"
+STATUS_DONE = "klaar"
+STATUS_FAILED = "mislukt"
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+FINAL_STATUSES = (STATUS_DONE, STATUS_FAILED)
+
+# A running job whose heartbeat is older than this is considered dead.
+STALE_AFTER = timedelta(minutes=5)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def create_job(db, collection: str, data: dict) -> dict:
+    """Create a queued job document and return it including its id."""
+    now = _now()
+    job = {
+        **data,
+        "status": STATUS_QUEUED,
+        "done": 0,
+        "total": 0,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+    ref = db.collection(collection).document()
+    ref.set(job)
+    return {"id": ref.id, **job}
+
+
+def is_stale(job: dict) -> bool:
+    """True if an active job stopped sending heartbeats (e.g. the instance was stopped)."""
+    try:
+        updated = datetime.fromisoformat(job.get("updated_at", ""))
+    except ValueError:
+        return True
+    return datetime.now(timezone.utc) - updated > STALE_AFTER
+
+
+class JobProgress:
+    """Writes progress to a job document, throttled to one write per interval."""
+
+    def __init__(self, db, collection: str, job_id: str, min_interval: float = 1.0):
+        self.ref = db.collection(collection).document(job_id)
+        self.min_interval = min_interval
+        self.done = 0
+        self.total = 0
+        self.chunks = 0
+        self._last_write = 0.0
+
+    def start(self, total: int, **fields):
+        self.total = total
+        self._write({"status": STATUS_RUNNING, "done": 0, "total": total, **fields})
+
+    def advance(self, step: int = 1, **fields):
+        self.done += step
+        if fields or time.monotonic() - self._last_write >= self.min_interval:
+            self._write({"done": self.done, **fields})
+
+    def finish(self, **fields):
+        self._write({"status": STATUS_DONE, "done": self.total, **fields})
+
+    def fail(self, error: str):
+        self._write({"status": STATUS_FAILED, "error": error})
+
+    def publish(self, collection: str, items: list, chunk_size: int = 100):
+        """Store (partial) results as documents `seq`, `items` in a subcollection of the job."""
+        for i in range(0, len(items), chunk_size):
+            self.ref.collection(collection).document(f"{self.chunks:05d}").set({
+                "seq": self.chunks,
+                "items": items[i:i + chunk_size],
+            })
+            self.chunks += 1
+
+    def _write(self, data: dict):
+        self.ref.update({**data, "updated_at": _now()})
+        self._last_write = time.monotonic()
+
+
+def load_chunks(ref, collection: str, after: int = -1) -> list[dict]:
+    """Result chunks published by a job (see JobProgress.publish), in order."""
+    docs = (
+        ref.collection(collection)
+        .where(filter=FieldFilter("seq", ">", after))
+        .order_by("seq")
+        .stream()
+    )
+    return [doc.to_dict() for doc in docs]
+
+
+async def job_event_stream(ref, formatter=None, interval: float = 1.0, chunks: str | None = None):
+    """Yield a job document as server-sent events until it reaches a final status.
+
+    `formatter` maps the raw job document to the payload sent to the client.
+    With `chunks`, result chunks published to that subcollection are sent
+    as `event: <chunks>` messages as they appear, before the job update
+    that follows them.
+    """
+    last = None
+    last_seq = -1
+    while True:
+        doc = await asyncio.to_thread(ref.get)
+        if not doc.exists:
+            yield f"event: error\ndata: {json.dumps({'detail': 'Taak niet gevonden'})}\n\n"
+            return
+        if chunks:
+            for chunk in await asyncio.to_thread(load_chunks, ref, chunks, last_seq):
+                yield f"event: {chunks}\ndata: {json.dumps(chunk['items'], default=str)}\n\n"
+                last_seq = chunk["seq"]
+        job = {"id": doc.id, **doc.to_dict()}
+        if job != last:
+            payload = formatter(job) if formatter else job
+            yield f"data: {json.dumps(payload, default=str)}\n\n"
+            last = job
+        if job.get("status") in FINAL_STATUSES:
+            return
+        await asyncio.sleep(interval)
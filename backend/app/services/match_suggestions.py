@@ -0,0 +1,135 @@
+"""Stored match suggestions per invoice.
+
+The top suggestions of an open invoice are kept in `match_suggestions`
+(document id = invoice id), so the suggestions endpoint is a single document
+read instead of scoring every free incoming transaction. A full matching run
+rewrites the entries of all open invoices; entries are dropped when the
+transactions they list are matched, and all entries of a user are dropped
+when bank transactions are uploaded, deleted or unmatched. An entry also
+stores the invoice fields the scores depend on and is ignored once those
+change.
+"""
+
+from datetime import datetime, timezone
+
+from google.cloud.firestore_v1 import FieldFilter
+
+from app.services.batch_writes import bulk_delete
+from app.services.matching import batch_top_matches
+
+COLLECTION = "match_suggestions"
+
+# Bump when the scoring changes, so stored suggestions are recomputed.
+SUGGESTIONS_VERSION = 2
+
+# Suggestions stored per invoice (more than a run shows, for partial payment selection)
+STORED_SUGGESTIONS = 10
+STORED_MIN_SCORE = 3
+
+
+def suggestion_entry(tx: dict, score: float) -> dict:
+    return {
+        "id": tx["id"],
+        "datum": tx["datum"],
+        "bedrag": tx["bedrag"],
+        "omschrijving": tx["omschrijving"],
+        "mededelingen": tx.get("mededelingen", ""),
+        "tegenrekening": tx.get("tegenrekening", ""),
+        "score": score,
+    }
+
+
+def invoice_summary(inv: dict) -> dict:
+    """The invoice fields shown with its suggestions; the scores depend on all of them."""
+    return {
+        "id": inv["id"],
+        "factuurnummer": inv.get("factuurnummer", ""),
+        "klant_naam": inv.get("klant_naam", ""),
+        "totaal": inv.get("totaal", 0),
+        "factuurdatum": inv.get("factuurdatum", ""),
+    }
+
+
+def compute_suggestions(
+    invoices: list[dict],
+    transactions: list[dict],
+    nummers=None,
+    klanten: dict[str, str] | None = None,
+) -> list[list[dict]]:
+    """Stored-format suggestions for every invoice against the free transactions."""
+    return [
+        suggestion_entries(top)
+        for top in batch_top_matches(
+            invoices, transactions, STORED_SUGGESTIONS, STORED_MIN_SCORE, nummers, klanten,
+        )
+    ]
+
+
+def suggestion_entries(top: list[tuple[float, dict]]) -> list[dict]:
+    """Stored-format suggestions from (score, transaction) pairs, such as `MatchRun.kandidaten`."""
+    return [suggestion_entry(tx, score) for score, tx in top]
+
+
+def get_suggestions(snapshot, uid: str, inv: dict) -> list[dict] | None:
+    """Stored suggestions from a `match_suggestions` document snapshot, or None if absent or stale."""
+    if not snapshot.exists:
+        return None
+    entry = snapshot.to_dict()
+    if (
+        entry.get("user_id") != uid
+        or entry.get("versie") != SUGGESTIONS_VERSION
+        or entry.get("invoice") != invoice_summary(inv)
+    ):
+        return None
+    return entry["suggestions"]
+
+
+def suggestions_ref(db, invoice_id: str):
+    return db.collection(COLLECTION).document(invoice_id)
+
+
+def suggestions_write(db, uid: str, inv: dict, suggestions: list[dict]) -> tuple:
+    """A ("set", ref, data) operation storing an invoice's suggestions (for WriteGroups)."""
+    return ("set", suggestions_ref(db, inv["id"]), {
+        "user_id": uid,
+        "versie": SUGGESTIONS_VERSION,
+        "invoice": invoice_summary(inv),
+        "suggestions": suggestions,
+        "transaction_ids": [s["id"] for s in suggestions],
+        "computed_at": datetime.now(timezone.utc).isoformat(),
+    })
+
+
+def save_suggestions(db, uid: str, inv: dict, suggestions: list[dict]):
+    _, ref, data = suggestions_write(db, uid, inv, suggestions)
+    ref.set(data)
+
+
+def stale_suggestions(db, uid: str, transaction_ids=None, invoice_ids=(), keep=()) -> list:
+    """References of the entries listing any of `transaction_ids` or belonging to `invoice_ids`.
+
+    Without `transaction_ids` every entry of the user is stale, except the
+    invoices in `keep`.
+    """
+    transaction_ids = None if transaction_ids is None else set(transaction_ids)
+    invoice_ids, keep = set(invoice_ids), set(keep)
+    stale = []
+    for doc in db.collection(COLLECTION).where(filter=FieldFilter("user_id", "==", uid)).stream():
+        if doc.id in keep:
+            continue
+        if (
+            transaction_ids is None
+            or doc.id in invoice_ids
+            or not transaction_ids.isdisjoint(doc.to_dict().get("transaction_ids", []))
+        ):
+            stale.append(doc.reference)
+    return stale
+
+
+def invalidate_suggestions(db, uid: str, transaction_ids=None, invoice_ids=()):
+    """Drop stored suggestions made stale by matching `transaction_ids` / `invoice_ids`.
+
+    Without `transaction_ids` (new, deleted or unmatched transactions) all
+    entries of the user are dropped.
+    """
+    bulk_delete(db, stale_suggestions(db, uid, transaction_ids, invoice_ids))
@@ -0,0 +1,848 @@
+"""Matching of incoming bank transactions to invoices.
+
+Pure helpers shared by the bank-matching router: normalization of invoice
+numbers and transaction text, match scoring (per pair and as a batch top-k
+over all pairs) and the matching run itself.
+
+Text features of a transaction (`transaction_match_fields`) are computed once
+when the CSV is imported and stored on the `bank_transactions` document, so
+scoring does no text processing per pair. Documents imported before these
+fields existed are prepared in memory when loaded.
+"""
+
+import heapq
+import re
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import numpy as np
+
+from app.services.similarity import TrigramIndex, best_ratio
+
+
+def normalize_factuurnummer(nr: str) -> str:
+    """
+    Normalize a factuurnummer for matching:
+    Remove dots, spaces, dashes, leading zeros after prefix.
+    E.g. "F.2024.001" -> "f2024001", "F 2024-001" -> "f2024001"
+    """
+    if not nr:
+        return ""
+    # Lowercase, strip whitespace
+    s = nr.strip().lower()
+    # Remove dots, spaces, dashes, slashes
+    s = re.sub(r'[\s.\-/]', '', s)
+    return s
+
+
+def extract_factuurnummers_from_text(text: str) -> list[str]:
+    """
+    Extract potential invoice numbers from bank transaction text (mededelingen/omschrijving).
+    Looks for patterns like F0001, F.2024.001, 2024-001, etc.
+    Returns normalized versions.
+    """
+    if not text:
+        return []
+
+    results = []
+    # Match typical invoice number patterns:
+    # F0001, F.0001, F-0001, F 0001
+    # F2024.001, F.2024.001
+    # 2024-001, 2024.001
+    # Also bare numbers like 0001
+    patterns = [
+        r'[A-Za-z]{1,3}[\s.\-/]?\d{4}[\s.\-/]?\d{1,4}',  # F2024001, F.2024.001
+        r'[A-Za-z]{1,3}[\s.\-/]?\d{1,6}',                   # F0001, F001
+        r'\d{4}[\s.\-/]\d{1,4}',                              # 2024-001, 2024.001
+    ]
+
+    for pattern in patterns:
+        for match in re.finditer(pattern, text):
+            results.append(normalize_factuurnummer(match.group()))
+
+    return results
+
+
+def transaction_text(tx: dict) -> str:
+    """Mededelingen and omschrijving of a transaction as one string."""
+    return f"{tx.get('mededelingen', '') or ''} {tx.get('omschrijving', '') or ''}"
+
+
+def transaction_match_fields(tx: dict) -> dict:
+    """Precomputed text features of a transaction, stored with it at import.
+
+    match_tekst: normalized mededelingen + omschrijving (invoice number search)
+    match_nummers: invoice number candidates extracted from that text
+    match_omschrijving: lowercased omschrijving (customer name search)
+    """
+    text = transaction_text(tx).lower()
+    return {
+        "match_tekst": normalize_factuurnummer(text),
+        "match_nummers": extract_factuurnummers_from_text(text),
+        "match_omschrijving": (tx.get("omschrijving", "") or "").lower(),
+    }
+
+
+def date_ordinal(datum: str) -> int | None:
+    """Day number of a YYYY-MM-DD date, or None if empty or invalid."""
+    if not datum:
+        return None
+    try:
+        return datetime.strptime(datum, "%Y-%m-%d").toordinal()
+    except ValueError:
+        return None
+
+
+def prepare_transaction(tx: dict) -> dict:
+    """Add missing match fields (older imports) and the parsed date to a loaded transaction."""
+    if "match_tekst" not in tx:
+        tx.update(transaction_match_fields(tx))
+    if "match_dag" not in tx:
+        tx["match_dag"] = date_ordinal(tx.get("datum", ""))
+    return tx
+
+
+def prepare_invoice(invoice: dict) -> dict:
+    """Add the normalized invoice number, customer name and parsed date used for scoring."""
+    if "match_nummer" not in invoice:
+        klant_naam = (invoice.get("klant_naam", "") or "").lower().strip()
+        invoice["match_nummer"] = normalize_factuurnummer(invoice.get("factuurnummer", ""))
+        invoice["match_klant"] = klant_naam
+        invoice["match_klant_delen"] = klant_naam.split()
+        invoice["match_dag"] = date_ordinal(invoice.get("factuurdatum", ""))
+    return invoice
+
+
+# === Scoring ===
+
+# Payments dated outside this window around the invoice date get no date points,
+# and are only match candidates when they mention the invoice number
+DAYS_BEFORE_INVOICE = 7
+DAYS_AFTER_INVOICE = 365
+
+
+def date_score(days_diff: int) -> float:
+    """Date proximity points (max 20) for a payment `days_diff` days after the invoice.
+
+    Smooth curve: closer payment dates score much higher.
+    Typical payment is 14-30 days after invoice. Payment before invoice = unlikely.
+    """
+    if days_diff < -DAYS_BEFORE_INVOICE:
+        # Payment well before invoice date — very unlikely match
+        return 0
+    if days_diff < 0:
+        # Payment slightly before invoice (up to 7 days) — rare but possible
+        return 3
+    if days_diff <= 90:
+        # Smooth decay: 20 points at 0 days, ~17 at 14d, ~13 at 30d, ~5 at 90d
+        return max(0, 20 * (1 - (days_diff / 120) ** 0.8))
+    if days_diff <= DAYS_AFTER_INVOICE:
+        # Long overdue but still possible
+        return max(0, 4 * (1 - (days_diff - 90) / 275))
+    # > 365 days: 0 points
+    return 0
+
+
+def compute_match_score(invoice: dict, transaction: dict) -> float:
+    """
+    Compute a matching score (0-100) between an invoice and a bank transaction.
+    Considers: amount match, factuurnummer in mededelingen, customer name in omschrijving, date proximity.
+    """
+    prepare_invoice(invoice)
+    prepare_transaction(transaction)
+    score = 0.0
+
+    inv_totaal = abs(invoice.get("totaal", 0))
+    tx_bedrag = abs(transaction.get("bedrag", 0))
+
+    # --- Amount match (max 40 points) ---
+    if inv_totaal > 0 and tx_bedrag > 0:
+        ratio = min(inv_totaal, tx_bedrag) / max(inv_totaal, tx_bedrag)
+        if abs(inv_totaal - tx_bedrag) < 0.01:
+            score += 40  # exact match
+        elif ratio > 0.95:
+            score += 35
+        elif ratio > 0.8:
+            score += 20
+        elif ratio > 0.5:
+            score += 10
+
+    # --- Factuurnummer in mededelingen/omschrijving (max 35 points) ---
+    inv_nr = invoice["match_nummer"]
+    extracted_nrs = transaction["match_nummers"]
+    if inv_nr and inv_nr in extracted_nrs:
+        score += 35
+    elif inv_nr and inv_nr in transaction["match_tekst"]:
+        score += 30
+    elif inv_nr:
+        # Fuzzy match on the invoice number
+        score += best_ratio(inv_nr, extracted_nrs) * 25
+
+    # --- Customer name in omschrijving (max 15 points) ---
+    klant_naam = invoice["match_klant"]
+    omschrijving = transaction["match_omschrijving"]
+    if klant_naam and len(klant_naam) > 2:
+        if klant_naam in omschrijving:
+            score += 15
+        else:
+            # Try partial name matching
+            name_parts = invoice["match_klant_delen"]
+            matches = sum(1 for part in name_parts if len(part) > 2 and part in omschrijving)
+            if name_parts:
+                score += (matches / len(name_parts)) * 12
+
+    # --- Date proximity (max 20 points) ---
+    if invoice["match_dag"] is not None and transaction["match_dag"] is not None:
+        # positive = payment after invoice
+        score += date_score(transaction["match_dag"] - invoice["match_dag"])
+
+    return round(score, 1)
+
+
+class FactuurnummerIndex:
+    """Maps normalized invoice numbers to the transactions whose text contains them.
+
+    The normalized text of every transaction is scanned for substrings of
+    the lengths of the wanted numbers. A number extracted from the text is a
+    substring of the normalized text as well, so `get` returns exactly the
+    transactions for which `inv_nr in extracted or inv_nr in norm_combined`
+    holds, in the original transaction order.
+    """
+
+    def __init__(self, transactions: list[dict], factuurnummers: set[str]):
+        wanted = {nr for nr in factuurnummers if nr}
+        lengths = sorted({len(nr) for nr in wanted})
+        self._index: dict[str, list[dict]] = defaultdict(list)
+
+        for tx in transactions:
+            text = prepare_transaction(tx)["match_tekst"]
+            found = set()
+            for length in lengths:
+                for i in range(len(text) - length + 1):
+                    part = text[i:i + length]
+                    if part in wanted:
+                        found.add(part)
+            for nr in found:
+                self._index[nr].append(tx)
+
+    def get(self, factuurnummer: str) -> list[dict]:
+        """Transactions mentioning the (normalized) invoice number."""
+        return self._index.get(factuurnummer, [])
+
+
+def normalize_iban(iban: str) -> str:
+    return re.sub(r"\s", "", iban or "").upper()
+
+
+class IbanIndex:
+    """Maps counter-account IBANs to the one customer known to pay from them.
+
+    Built from (iban, klant_id) pairs: the customers' `iban` field and the
+    tegenrekening of earlier matched transactions with the customer of their
+    invoice. An IBAN seen for more than one customer (shared accounts,
+    payment providers) is left out.
+    """
+
+    def __init__(self, pairs):
+        seen = defaultdict(set)
+        for iban, klant_id in pairs:
+            if iban and klant_id:
+                seen[normalize_iban(iban)].add(klant_id)
+        self._klanten = {iban: next(iter(ids)) for iban, ids in seen.items() if len(ids) == 1}
+
+    def __len__(self) -> int:
+        return len(self._klanten)
+
+    def get(self, iban: str) -> str | None:
+        return self._klanten.get(normalize_iban(iban)) if iban else None
+
+    def transaction_customers(self, transactions: list[dict]) -> dict[str, str]:
+        """Transaction id -> klant_id for transactions from a known IBAN."""
+        return {
+            tx["id"]: klant_id
+            for tx in transactions
+            if (klant_id := self.get(tx.get("tegenrekening", "")))
+        }
+
+
+# Score bonus for a transaction from an IBAN known to belong to the invoice's customer
+IBAN_PRIOR = 25
+
+
+# === Batch scoring ===
+
+# Amount ratios rewarded by compute_match_score: > 0.95 (35), > 0.8 (20), > 0.5 (10)
+MIN_AMOUNT_RATIO = 0.5
+# Trigram similarity of a mentioned number to the invoice number that makes it a candidate
+FUZZY_NUMBER_SIMILARITY = 0.4
+# Upper bounds of the text components of compute_match_score
+NUMBER_POINTS_FUZZY_MAX = 25
+# Pairs per NumPy block (invoices x transactions)
+BATCH_BLOCK_PAIRS = 2_000_000
+# Slack between the float matrix bound and the rounded exact score
+_BOUND_SLACK = 0.1
+
+
+def amount_points(inv_totaal: np.ndarray, tx_bedrag: np.ndarray) -> np.ndarray:
+    """Amount component (max 40) for all pairs; arguments are absolute amounts, shapes (I, 1) and (T,)."""
+    low = np.minimum(inv_totaal, tx_bedrag)
+    high = np.maximum(inv_totaal, tx_bedrag)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(high > 0, low / np.where(high > 0, high, 1), 0)
+    valid = (inv_totaal > 0) & (tx_bedrag > 0)
+    return np.select(
+        [
+            valid & (np.abs(inv_totaal - tx_bedrag) < 0.01),
+            valid & (ratio > 0.95),
+            valid & (ratio > 0.8),
+            valid & (ratio > MIN_AMOUNT_RATIO),
+        ],
+        [40.0, 35.0, 20.0, 10.0],
+        default=0.0,
+    )
+
+
+def date_points(inv_dag: np.ndarray, tx_dag: np.ndarray) -> np.ndarray:
+    """Date component (max 20) for all pairs; day numbers as floats with NaN for missing dates."""
+    days = tx_dag - inv_dag
+    with np.errstate(invalid="ignore"):
+        early = np.maximum(0.0, 20 * (1 - (np.clip(days, 0, 90) / 120) ** 0.8))
+        late = np.maximum(0.0, 4 * (1 - (days - 90) / 275))
+        return np.select(
+            [
+                np.isnan(days) | (days < -DAYS_BEFORE_INVOICE),
+                days < 0,
+                days <= 90,
+                days <= DAYS_AFTER_INVOICE,
+            ],
+            [0.0, 3.0, early, late],
+            default=0.0,
+        )
+
+
+def _name_points(invoice: dict, omschrijvingen: list[str]) -> np.ndarray:
+    """Customer-name component (max 15) of one invoice against every transaction."""
+    klant_naam = invoice["match_klant"]
+    if not klant_naam or len(klant_naam) <= 2:
+        return np.zeros(len(omschrijvingen))
+    delen = [part for part in invoice["match_klant_delen"] if len(part) > 2]
+    n_delen = len(invoice["match_klant_delen"])
+    return np.array([
+        15.0 if klant_naam in oms else sum(1 for part in delen if part in oms) / n_delen * 12
+        for oms in omschrijvingen
+    ])
+
+
+def batch_top_matches(
+    invoices: list[dict],
+    transactions: list[dict],
+    k: int,
+    min_score: float,
+    nummers: FactuurnummerIndex | None = None,
+    klanten: dict[str, str] | None = None,
+    on_block=None,
+) -> list[list[tuple[float, dict]]]:
+    """Exact top-k (score, transaction) pairs above min_score for every invoice, best first.
+
+    Candidates of an invoice are the transactions dated from
+    DAYS_BEFORE_INVOICE before to DAYS_AFTER_INVOICE after it whose amount
+    is within the ratio the amount score rewards, that come from the
+    customer's known IBAN or that mention a similar number (TrigramIndex),
+    plus those mentioning its invoice number at any date; invoices without a date are not windowed. Amount and date points of all pairs are computed as NumPy
+    matrices (in blocks of BATCH_BLOCK_PAIRS), customer-name points once per
+    customer name, and exact invoice-number hits come from the
+    FactuurnummerIndex. That leaves only the fuzzy number component (at most
+    25 points) unknown, so candidates are scored with compute_match_score in
+    order of this upper bound until the bound cannot beat the k-th best
+    score. The result equals scoring every candidate pair and sorting stably
+    by score.
+
+    `klanten` (transaction id -> klant_id, from the IbanIndex) restricts a
+    transaction from a known IBAN to invoices of that customer, and adds
+    IBAN_PRIOR to their score. `on_block(invoices, results)` is called after
+    every block of invoices.
+    """
+    for tx in transactions:
+        prepare_transaction(tx)
+    for inv in invoices:
+        prepare_invoice(inv)
+    if nummers is None:
+        nummers = FactuurnummerIndex(transactions, {inv["match_nummer"] for inv in invoices})
+    if not transactions:
+        return [[] for _ in invoices]
+
+    position = {tx["id"]: j for j, tx in enumerate(transactions)}
+    trigrammen = TrigramIndex()
+    for tx in transactions:
+        for nr in set(tx["match_nummers"]):
+            trigrammen.add(tx["id"], nr)
+    tx_bedrag = np.array([abs(tx.get("bedrag", 0)) for tx in transactions], dtype=float)
+    tx_dag = np.array(
+        [np.nan if tx["match_dag"] is None else tx["match_dag"] for tx in transactions], dtype=float,
+    )
+    omschrijvingen = [tx["match_omschrijving"] for tx in transactions]
+    name_cache: dict[tuple, np.ndarray] = {}
+    klanten = klanten or {}
+    tx_klant = np.array([klanten.get(tx["id"], "") for tx in transactions], dtype=object)
+    bekend = tx_klant != ""
+
+    results = []
+    rows = max(1, BATCH_BLOCK_PAIRS // len(transactions))
+    for start in range(0, len(invoices), rows):
+        block = invoices[start:start + rows]
+        inv_totaal = np.array([[abs(inv.get("totaal", 0))] for inv in block], dtype=float)
+        inv_dag = np.array(
+            [[np.nan if inv["match_dag"] is None else inv["match_dag"]] for inv in block], dtype=float,
+        )
+        amount = amount_points(inv_totaal, tx_bedrag)
+        base = amount + date_points(inv_dag, tx_dag)
+        days = tx_dag - inv_dag
+        with np.errstate(invalid="ignore"):
+            window = np.isnan(inv_dag) | ((days >= -DAYS_BEFORE_INVOICE) & (days <= DAYS_AFTER_INVOICE))
+        # Amount band: the ratios the amount component rewards (> MIN_AMOUNT_RATIO)
+        shortlist = window & (amount > 0)
+
+        for r, inv in enumerate(block):
+            name_key = (inv["match_klant"], tuple(inv["match_klant_delen"]))
+            if name_key not in name_cache:
+                name_cache[name_key] = _name_points(inv, omschrijvingen)
+            upper = base[r] + name_cache[name_key]
+            prior = np.zeros(len(transactions))
+            if klanten:
+                same = bekend & (tx_klant == (inv.get("klant_id") or ""))
+                prior[same] = IBAN_PRIOR
+                upper = np.where(bekend & ~same, -np.inf, upper + prior)
+
+            candidate = shortlist[r] | (window[r] & (prior > 0))
+            inv_nr = inv["match_nummer"]
+            if inv_nr:
+                upper += NUMBER_POINTS_FUZZY_MAX
+                for tx in nummers.get(inv_nr):
+                    j = position.get(tx["id"])
+                    if j is not None:
+                        upper[j] += (35 if inv_nr in tx["match_nummers"] else 30) - NUMBER_POINTS_FUZZY_MAX
+                        candidate[j] = True
+                for tx_id in trigrammen.search(inv_nr, FUZZY_NUMBER_SIMILARITY):
+                    j = position[tx_id]
+                    candidate[j] |= window[r, j]
+            upper[~candidate] = -np.inf
+
+            # Min-heap of (score, -position): the root is the k-th best so far
+            top: list[tuple[float, int]] = []
+            for j in np.argsort(-upper, kind="stable"):
+                bound = upper[j] + _BOUND_SLACK
+                if bound <= min_score or (len(top) == k and bound < top[0][0]):
+                    break
+                score = compute_match_score(inv, transactions[j])
+                if prior[j]:
+                    score = round(score + prior[j], 1)
+                if score <= min_score:
+                    continue
+                item = (score, -int(j))
+                if len(top) < k:
+                    heapq.heappush(top, item)
+                elif item > top[0]:
+                    heapq.heapreplace(top, item)
+            results.append([(score, transactions[-neg_j]) for score, neg_j in sorted(top, reverse=True)])
+        if on_block:
+            on_block(block, results[start:])
+    return results
+
+
+# === Assignment ===
+
+def assign_one_to_one(edges: list[tuple[float, object, object]]) -> list[tuple[float, object, object]]:
+    """Global one-to-one assignment over sparse (score, invoice_key, transaction_key) edges.
+
+    Priority-queue greedy: edges are taken by descending score, ties in the
+    given order, and accepted when neither side is assigned yet. Returns the
+    accepted edges in acceptance order.
+    """
+    heap = [(-score, order, a, b) for order, (score, a, b) in enumerate(edges)]
+    heapq.heapify(heap)
+    used_a, used_b = set(), set()
+    accepted = []
+    while heap:
+        neg_score, _, a, b = heapq.heappop(heap)
+        if a in used_a or b in used_b:
+            continue
+        used_a.add(a)
+        used_b.add(b)
+        accepted.append((-neg_score, a, b))
+    return accepted
+
+
+# === One transaction, several invoices ===
+
+# Tolerance on the summed amount, as for manual matches
+MULTI_TOLERANCE_CENTS = 5
+# Open invoices of one customer searched per transaction (closest dated first)
+MULTI_MAX_INVOICES = 20
+# Matching subsets examined per transaction before it counts as ambiguous
+MULTI_MAX_SOLUTIONS = 32
+
+
+def _cents(amount: float) -> int:
+    return round(abs(amount) * 100)
+
+
+def _subset_sums(amounts: list[int]) -> list[tuple[int, int]]:
+    """(sum, bitmask) of every subset of `amounts`."""
+    sums = [(0, 0)]
+    for i, amount in enumerate(amounts):
+        sums += [(total + amount, mask | (1 << i)) for total, mask in sums]
+    return sums
+
+
+def subsets_with_sum(amounts: list[int], target: int, tolerance: int, limit: int) -> list[int]:
+    """Bitmasks of subsets (two or more items) summing to target ± tolerance.
+
+    Meet in the middle: the subset sums of both halves are enumerated
+    (2^(n/2) each) and every left sum is paired with the right sums in range
+    by binary search. Stops after `limit` subsets.
+    """
+    half = len(amounts) // 2
+    left = _subset_sums(amounts[:half])
+    right = sorted((total, mask << half) for total, mask in _subset_sums(amounts[half:]))
+    right_sums = [total for total, _ in right]
+
+    found = []
+    for total, mask in left:
+        if total > target + tolerance:
+            continue
+        lo = bisect_left(right_sums, target - tolerance - total)
+        hi = bisect_right(right_sums, target + tolerance - total)
+        for _, right_mask in right[lo:hi]:
+            combined = mask | right_mask
+            if combined.bit_count() >= 2:
+                found.append(combined)
+                if len(found) >= limit:
+                    return found
+    return found
+
+
+def _customer_key(invoice: dict) -> str:
+    return invoice.get("klant_id") or invoice["match_klant"]
+
+
+def transaction_customers(
+    transactions: list[dict],
+    invoices: list[dict],
+    nummers: FactuurnummerIndex,
+    klanten: dict[str, str] | None = None,
+) -> dict[str, str]:
+    """Transaction id -> customer key, for transactions that point to exactly one customer.
+
+    A transaction from a known IBAN (`klanten`) belongs to that customer.
+    Otherwise it points to the customers of the invoice numbers in its text;
+    without numbers, to the customers whose full name is in its omschrijving.
+    """
+    by_number = defaultdict(set)
+    for inv in invoices:
+        for tx in nummers.get(prepare_invoice(inv)["match_nummer"]):
+            by_number[tx["id"]].add(_customer_key(inv))
+    names = {}
+    for inv in invoices:
+        if len(inv["match_klant"]) > 2:
+            names.setdefault(inv["match_klant"], set()).add(_customer_key(inv))
+
+    customers = {}
+    for tx in transactions:
+        if klanten and tx["id"] in klanten:
+            customers[tx["id"]] = klanten[tx["id"]]
+            continue
+        keys = by_number.get(tx["id"])
+        if not keys:
+            omschrijving = prepare_transaction(tx)["match_omschrijving"]
+            keys = set().union(*(k for naam, k in names.items() if naam in omschrijving))
+        if len(keys) == 1:
+            customers[tx["id"]] = next(iter(keys))
+    return customers
+
+
+def match_multi_invoice(
+    invoices: list[dict],
+    transactions: list[dict],
+    nummers: FactuurnummerIndex,
+    klanten: dict[str, str] | None = None,
+) -> list[dict]:
+    """Transactions that pay two or more open invoices of one customer at once.
+
+    For each transaction (oldest first) pointing to a single customer, the
+    customer's open invoices dated within DAYS_AFTER_INVOICE before to
+    DAYS_BEFORE_INVOICE after the payment are searched for subsets whose
+    totals sum to the amount (`subsets_with_sum`). The subset mentioning
+    most of its invoice numbers in the text wins, fewer invoices breaking
+    ties; when two subsets tie the transaction is skipped as ambiguous.
+    Returns {"transaction", "invoices"} entries; each invoice is used once.
+    """
+    customers = transaction_customers(transactions, invoices, nummers, klanten)
+    open_per_customer = defaultdict(list)
+    for inv in invoices:
+        if inv["match_dag"] is not None and abs(inv.get("totaal", 0)) > 0:
+            open_per_customer[_customer_key(inv)].append(inv)
+
+    used_inv_ids = set()
+    matches = []
+    dated = [tx for tx in transactions if tx["id"] in customers and tx["match_dag"] is not None]
+    for tx in sorted(dated, key=lambda tx: tx["match_dag"]):
+        tx_dag = tx["match_dag"]
+        window = [
+            inv for inv in open_per_customer[customers[tx["id"]]]
+            if inv["id"] not in used_inv_ids
+            and -DAYS_BEFORE_INVOICE <= tx_dag - inv["match_dag"] <= DAYS_AFTER_INVOICE
+        ]
+        if len(window) < 2:
+            continue
+        window.sort(key=lambda inv: abs(tx_dag - inv["match_dag"]))
+        window = window[:MULTI_MAX_INVOICES]
+
+        masks = subsets_with_sum(
+            [_cents(inv.get("totaal", 0)) for inv in window],
+            _cents(tx.get("bedrag", 0)), MULTI_TOLERANCE_CENTS, MULTI_MAX_SOLUTIONS,
+        )
+        if not masks or len(masks) >= MULTI_MAX_SOLUTIONS:
+            continue
+
+        def rank(mask: int) -> tuple[int, int]:
+            subset = [inv for i, inv in enumerate(window) if mask >> i & 1]
+            mentioned = sum(1 for inv in subset if inv["match_nummer"] and inv["match_nummer"] in tx["match_tekst"])
+            return mentioned, -len(subset)
+
+        ranked = sorted(masks, key=rank, reverse=True)
+        if len(ranked) > 1 and rank(ranked[0]) == rank(ranked[1]):
+            continue
+        subset = [inv for i, inv in enumerate(window) if ranked[0] >> i & 1]
+        subset.sort(key=lambda inv: inv["match_dag"])
+        used_inv_ids.update(inv["id"] for inv in subset)
+        matches.append({"transaction": tx, "invoices": subset})
+    return matches
+
+
+# === Matching run ===
+
+# Auto-match threshold for pairs with the invoice number in the text and the exact amount
+AUTO_MATCH_MIN_SCORE = 50
+SUGGESTIONS_PER_INVOICE = 5
+SUGGESTION_MIN_SCORE = 5
+# Candidate transactions per invoice considered by the global assignment
+GLOBAL_CANDIDATES = 10
+
+
+@dataclass
+class MatchRun:
+    auto_matched: list[dict] = field(default_factory=list)  # {"invoice", "transaction", "score"}
+    unmatched: list[dict] = field(default_factory=list)  # invoices without an auto-match
+    suggestions: list[list[tuple[float, dict]]] = field(default_factory=list)  # per unmatched invoice
+    voorstellen: dict[str, str] = field(default_factory=dict)  # invoice id -> proposed transaction id
+    meervoudig: list[dict] = field(default_factory=list)  # {"transaction", "invoices"}: one payment, several invoices
+    kandidaten: list[list[tuple[float, dict]]] = field(default_factory=list)  # wider top-k per unmatched invoice
+
+
+def auto_match(
+    invoices: list[dict],
+    transactions: list[dict],
+    nummers: FactuurnummerIndex,
+    globaal: bool = False,
+) -> list[dict]:
+    """Phase 1: pair invoices with a transaction that has their number and amount.
+
+    Candidate pairs have the invoice number in the text, the amount within
+    rounding and a score >= AUTO_MATCH_MIN_SCORE. By default each invoice in
+    turn takes its best free transaction; `globaal` assigns the highest
+    scoring pairs first across all invoices.
+    """
+    edges = []  # (score, invoice index, transaction)
+    for i, inv in enumerate(invoices):
+        inv_nr = prepare_invoice(inv)["match_nummer"]
+        if not inv_nr:
+            continue
+
+        inv_totaal = abs(inv.get("totaal", 0))
+        for tx in nummers.get(inv_nr):
+            tx_bedrag = abs(tx.get("bedrag", 0))
+            # Check amount match (allow small rounding differences)
+            if abs(inv_totaal - tx_bedrag) < 0.05:
+                score = compute_match_score(inv, tx)
+                if score >= AUTO_MATCH_MIN_SCORE:
+                    edges.append((score, i, tx))
+
+    matched = []
+    if globaal:
+        tx_by_id = {tx["id"]: tx for _, _, tx in edges}
+        accepted = assign_one_to_one([(score, i, tx["id"]) for score, i, tx in edges])
+        for score, i, tx_id in sorted(accepted, key=lambda e: e[1]):
+            matched.append({"invoice": invoices[i], "transaction": tx_by_id[tx_id], "score": score})
+        return matched
+
+    edges_per_invoice = defaultdict(list)
+    for score, i, tx in edges:
+        edges_per_invoice[i].append((score, tx))
+    used_tx_ids = set()
+    for i, inv in enumerate(invoices):
+        best_match = None
+        best_score = 0
+        for score, tx in edges_per_invoice[i]:
+            if tx["id"] not in used_tx_ids and score > best_score:
+                best_score = score
+                best_match = tx
+        if best_match:
+            used_tx_ids.add(best_match["id"])
+            matched.append({"invoice": inv, "transaction": best_match, "score": best_score})
+    return matched
+
+
+def auto_match_iban(invoices: list[dict], transactions: list[dict], klanten: dict[str, str]) -> list[dict]:
+    """Phase 1b: repeat payers, matched without text scoring.
+
+    A transaction from a customer's known IBAN (`klanten`) is matched when
+    exactly one open invoice of that customer, dated within the scoring
+    window, has its amount (within rounding). Transactions are taken oldest
+    first, so of two equal payments the first pays the invoice.
+    """
+    per_customer = defaultdict(list)
+    for inv in invoices:
+        if inv.get("klant_id") and prepare_invoice(inv)["match_dag"] is not None:
+            per_customer[inv["klant_id"]].append(inv)
+
+    used_inv_ids = set()
+    matched = []
+    dated = [tx for tx in transactions if tx["id"] in klanten and prepare_transaction(tx)["match_dag"] is not None]
+    for tx in sorted(dated, key=lambda tx: tx["match_dag"]):
+        tx_bedrag = abs(tx.get("bedrag", 0))
+        candidates = [
+            inv for inv in per_customer[klanten[tx["id"]]]
+            if inv["id"] not in used_inv_ids
+            and abs(abs(inv.get("totaal", 0)) - tx_bedrag) < 0.05
+            and -DAYS_BEFORE_INVOICE <= tx["match_dag"] - inv["match_dag"] <= DAYS_AFTER_INVOICE
+        ]
+        if len(candidates) == 1:
+            inv = candidates[0]
+            used_inv_ids.add(inv["id"])
+            matched.append({
+                "invoice": inv,
+                "transaction": tx,
+                "score": round(compute_match_score(inv, tx) + IBAN_PRIOR, 1),
+                "match_type": "auto_iban",
+            })
+    return matched
+
+
+def suggest(
+    invoices: list[dict],
+    transactions: list[dict],
+    nummers: FactuurnummerIndex | None = None,
+    globaal: bool = False,
+    klanten: dict[str, str] | None = None,
+    on_suggestions=None,
+    kandidaten: tuple[int, float] | None = None,
+) -> tuple[list[list[tuple[float, dict]]], dict[str, str], list[list[tuple[float, dict]]]]:
+    """Phase 2: top suggestions per invoice, and in global mode one proposal per invoice.
+
+    In global mode every invoice gets at most one proposed transaction and
+    vice versa; a transaction proposed for one invoice is not suggested for
+    the others. `on_suggestions(invoices, suggestions, voorstellen)` receives
+    the final suggestions per block of invoices, in global mode all at once.
+
+    With `kandidaten` (k, min score), the same scoring pass also returns the
+    wider top-k per invoice (for the stored suggestions); otherwise the third
+    value is empty.
+    """
+    k = GLOBAL_CANDIDATES if globaal else SUGGESTIONS_PER_INVOICE
+    wide_k, wide_min = k, SUGGESTION_MIN_SCORE
+    if kandidaten:
+        wide_k, wide_min = max(k, kandidaten[0]), min(wide_min, kandidaten[1])
+
+    def narrow(tops):
+        # Lists are sorted best first, so the top-k above the minimum is a prefix
+        return [[(score, tx) for score, tx in top[:k] if score >= SUGGESTION_MIN_SCORE] for top in tops]
+
+    on_block = (
+        (lambda block, results: on_suggestions(block, narrow(results), {}))
+        if on_suggestions and not globaal else None
+    )
+    wide = batch_top_matches(invoices, transactions, wide_k, wide_min, nummers, klanten, on_block)
+    suggestions = narrow(wide)
+    kept = [
+        [(score, tx) for score, tx in top[:kandidaten[0]] if score >= kandidaten[1]] for top in wide
+    ] if kandidaten else []
+    if not globaal:
+        return suggestions, {}, kept
+
+    voorstellen = {
+        invoices[i]["id"]: tx_id
+        for _, i, tx_id in assign_one_to_one([
+            (score, i, tx["id"]) for i, top in enumerate(suggestions) for score, tx in top
+        ])
+    }
+    proposed = set(voorstellen.values())
+    filtered = []
+    for inv, top in zip(invoices, suggestions):
+        voorstel = voorstellen.get(inv["id"])
+        top = [(score, tx) for score, tx in top if tx["id"] == voorstel or tx["id"] not in proposed]
+        top.sort(key=lambda item: item[1]["id"] != voorstel)
+        filtered.append(top[:SUGGESTIONS_PER_INVOICE])
+    if on_suggestions:
+        on_suggestions(invoices, filtered, voorstellen)
+    return filtered, voorstellen, kept
+
+
+def run_match(
+    invoices: list[dict],
+    transactions: list[dict],
+    globaal: bool = False,
+    meervoudig: bool = False,
+    ibans: IbanIndex | None = None,
+    on_matched=None,
+    on_suggestions=None,
+    kandidaten: tuple[int, float] | None = None,
+) -> MatchRun:
+    """Match open invoices against free incoming transactions (no database access).
+
+    With `ibans`, transactions from a known customer IBAN are auto-matched
+    to that customer's only open invoice with their amount (phase 1b) and
+    otherwise only suggested for that customer's invoices, with a prior.
+    With `meervoudig`, transactions left after phase 1 are also matched to
+    sets of invoices of one customer they pay together.
+
+    For progress reporting, `on_matched(run)` is called once the matches are
+    known and `on_suggestions` is passed on to `suggest`. With `kandidaten`
+    (k, min score), `run.kandidaten` holds the top-k per unmatched invoice
+    from the same scoring pass as the suggestions.
+    """
+    nummers = FactuurnummerIndex(
+        transactions, {prepare_invoice(inv)["match_nummer"] for inv in invoices},
+    )
+    for tx in transactions:
+        prepare_transaction(tx)
+    klanten = ibans.transaction_customers(transactions) if ibans else {}
+    run = MatchRun(auto_matched=auto_match(invoices, transactions, nummers, globaal))
+
+    matched_inv_ids = {m["invoice"]["id"] for m in run.auto_matched}
+    used_tx_ids = {m["transaction"]["id"] for m in run.auto_matched}
+
+    def open_invoices():
+        return [inv for inv in invoices if inv["id"] not in matched_inv_ids]
+
+    def free_transactions():
+        return [tx for tx in transactions if tx["id"] not in used_tx_ids]
+
+    if klanten:
+        for m in auto_match_iban(open_invoices(), free_transactions(), klanten):
+            run.auto_matched.append(m)
+            matched_inv_ids.add(m["invoice"]["id"])
+            used_tx_ids.add(m["transaction"]["id"])
+    if meervoudig:
+        run.meervoudig = match_multi_invoice(open_invoices(), free_transactions(), nummers, klanten)
+        for m in run.meervoudig:
+            used_tx_ids.add(m["transaction"]["id"])
+            matched_inv_ids.update(inv["id"] for inv in m["invoices"])
+    run.unmatched = open_invoices()
+    if on_matched:
+        on_matched(run)
+    run.suggestions, run.voorstellen, run.kandidaten = suggest(
+        run.unmatched, free_transactions(), nummers, globaal, klanten, on_suggestions, kandidaten,
+    )
+    return run
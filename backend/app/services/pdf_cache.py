@@ -0,0 +1,178 @@
+"""Content-addressed cache for rendered invoice PDFs.
+
+A rendered PDF is keyed by a hash of exactly the invoice, company and customer
+fields that generate_invoice_pdf reads. A process-local LRU sits in front of
+the copy in Firebase Storage; the hash of the stored copy is kept on the
+invoice document as `pdf_hash`, so a stale blob is never served.
+
+Once an invoice is no longer a concept, its stored copy is what the customer
+received: it is served as is and never re-rendered or overwritten, also
+when the company settings or customer change later. The invoices router
+drops the copy when it does not match the invoice as sent, or when a sent
+invoice is edited.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse, unquote
+
+from firebase_admin import storage
+
+from app.config import FIREBASE_STORAGE_BUCKET
+from app.services.pdf_generator import generate_invoice_pdf
+
+# Bump when the layout in pdf_generator changes, so every cached PDF is re-rendered.
+PDF_LAYOUT_VERSION = 1
+
+INVOICE_FIELDS = (
+    "factuurnummer", "factuurdatum", "klant_naam", "onderwerp", "notities",
+    "subtotaal", "btw_totaal", "totaal",
+)
+REGEL_FIELDS = ("beschrijving", "aantal", "tarief", "btw_percentage")
+COMPANY_FIELDS = (
+    "bedrijfsnaam", "adres", "postcode", "plaats", "kvk_nummer", "btw_nummer",
+    "iban", "email", "website", "logo_url",
+)
+KLANT_FIELDS = ("bedrijfsnaam", "voornaam", "achternaam", "adres", "postcode", "plaats")
+
+LRU_MAX_BYTES = 64 * 1024 * 1024
+
+
+class _LruCache:
+    """Thread-safe LRU of PDF bytes, bounded by total size."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._items[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+
+_lru = _LruCache(LRU_MAX_BYTES)
+
+
+def invoice_pdf_hash(invoice: dict, company: dict, klant: dict | None = None) -> str:
+    """Hash of all fields that affect the rendered invoice PDF."""
+    klant = klant or {}
+    key = {
+        "v": PDF_LAYOUT_VERSION,
+        "invoice": {f: invoice.get(f) for f in INVOICE_FIELDS},
+        "regels": [{f: r.get(f) for f in REGEL_FIELDS} for r in invoice.get("regels", [])],
+        "company": {f: company.get(f) for f in COMPANY_FIELDS},
+        "klant": {f: klant.get(f) for f in KLANT_FIELDS},
+    }
+    payload = json.dumps(key, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def invoice_pdf_path(uid: str, invoice_id: str) -> str:
+    return f"invoices/{uid}/{invoice_id}.pdf"
+
+
+def storage_path_from_url(url: str) -> str:
+    """Extract the Firebase Storage blob path from a public URL.
+    
+    Public URLs look like:
+      https://storage.googleapis.com/BUCKET/expenses/uid/timestamp_file.pdf
+    Or Firebase REST API URLs:
+      https://firebasestorage.googleapis.com/v0/b/BUCKET/o/path%2Fto%2Ffile
+    """
+    if not url:
+        return ""
+    decoded = unquote(urlparse(url).path)
+    # REST API format: /v0/b/bucket/o/the/actual/path
+    if "/o/" in decoded:
+        return decoded.split("/o/", 1)[1]
+    # Public URL format: /BUCKET/the/actual/path
+    bucket = FIREBASE_STORAGE_BUCKET
+    if bucket and f"/{bucket}/" in decoded:
+        return decoded.split(f"/{bucket}/", 1)[1]
+    # Fallback: everything after 3rd slash segment
+    parts = decoded.lstrip("/").split("/", 1)
+    return parts[1] if len(parts) > 1 else ""
+
+
+def has_final_pdf(invoice: dict) -> bool:
+    """Whether the invoice was sent (not a concept) and has a stored PDF, which is then authoritative."""
+    return invoice.get("status", "concept") != "concept" and bool(invoice.get("pdf_url"))
+
+
+def invoice_pdf_key(invoice: dict, company: dict, klant: dict | None = None) -> str:
+    """Key (and ETag) of the PDF get_invoice_pdf returns for an invoice.
+
+    For a sent invoice with a stored PDF this identifies the stored copy;
+    legacy copies without `pdf_hash` are identified by their URL.
+    """
+    if has_final_pdf(invoice):
+        return invoice.get("pdf_hash") or hashlib.sha256(invoice["pdf_url"].encode("utf-8")).hexdigest()
+    return invoice_pdf_hash(invoice, company, klant)
+
+
+def get_invoice_pdf(
+    db,
+    uid: str,
+    invoice_id: str,
+    invoice: dict,
+    company: dict,
+    klant: dict | None = None,
+) -> tuple[bytes, str]:
+    """Return (pdf_bytes, key) for an invoice, rendering only on a cache miss.
+
+    Lookup order: local LRU, then the Storage copy, then a fresh render. For
+    concepts the Storage copy is used only when the invoice's `pdf_hash`
+    matches, and a missing or stale copy is (re)written with `pdf_url` and
+    `pdf_hash` updated. A sent invoice with a stored PDF always gets that
+    copy; it is never overwritten. The stored copy is read from the path in
+    `pdf_url`, so copies stored by older versions elsewhere are found too.
+    """
+    final = has_final_pdf(invoice)
+    key = invoice_pdf_key(invoice, company, klant)
+    stored = final or (invoice.get("pdf_hash") == key and bool(invoice.get("pdf_url")))
+    bucket = storage.bucket()
+
+    pdf_bytes = _lru.get(key)
+    if pdf_bytes is None and stored:
+        path = storage_path_from_url(invoice["pdf_url"]) or invoice_pdf_path(uid, invoice_id)
+        try:
+            pdf_bytes = bucket.blob(path).download_as_bytes()
+        except Exception:
+            pdf_bytes = None
+    if pdf_bytes is None:
+        # Sent invoices whose copy cannot be read get a render, but the copy is kept
+        pdf_bytes = generate_invoice_pdf(invoice, company, klant)
+        if final:
+            return pdf_bytes, invoice_pdf_hash(invoice, company, klant)
+        stored = False
+    _lru.put(key, pdf_bytes)
+
+    if not stored:
+        blob = bucket.blob(invoice_pdf_path(uid, invoice_id))
+        blob.upload_from_string(pdf_bytes, content_type="application/pdf")
+        blob.make_public()
+        update = {"pdf_url": blob.public_url, "pdf_hash": key}
+        db.collection("invoices").document(invoice_id).update(update)
+        invoice.update(update)
+
+    return pdf_bytes, key
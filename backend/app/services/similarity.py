@@ -0,0 +1,97 @@
+"""String similarity for fuzzy invoice-number matching.
+
+`indel_ratio` is the normalized Indel similarity 2 * LCS / (len(a) + len(b)),
+with the longest common subsequence computed bit-parallel (one big-int
+operation per character of `b`). It is never lower than difflib's
+SequenceMatcher.ratio(), whose matching blocks form a common subsequence.
+`TrigramIndex` finds stored strings that share enough character trigrams
+with a query, so fuzzy candidates are found without comparing every pair.
+"""
+
+import math
+from collections import defaultdict
+
+
+def lcs_length(a: str, b: str) -> int:
+    """Length of the longest common subsequence of a and b (Hyyrö's bit-vector algorithm)."""
+    if not a or not b:
+        return 0
+    masks: dict[str, int] = {}
+    for i, ch in enumerate(a):
+        masks[ch] = masks.get(ch, 0) | (1 << i)
+    full = (1 << len(a)) - 1
+    v = full
+    for ch in b:
+        u = v & masks.get(ch, 0)
+        v = ((v + u) | (v - u)) & full
+    return len(a) - v.bit_count()
+
+
+def indel_ratio(a: str, b: str, cutoff: float = 0.0) -> float:
+    """Similarity in [0, 1]; returns 0.0 early when the result cannot exceed `cutoff`."""
+    total = len(a) + len(b)
+    if total == 0:
+        return 1.0
+    if 2 * min(len(a), len(b)) / total <= cutoff:
+        return 0.0
+    return 2 * lcs_length(a, b) / total
+
+
+def best_ratio(query: str, choices) -> float:
+    """Highest indel_ratio of query against any choice, skipping choices that cannot win."""
+    best = 0.0
+    for choice in choices:
+        r = indel_ratio(query, choice, cutoff=best)
+        if r > best:
+            best = r
+            if best == 1.0:
+                break
+    return best
+
+
+def trigrams(text: str) -> set[str]:
+    """Character trigrams, padded so short strings and their first characters count."""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """Inverted index from trigram to stored strings, searched by Dice similarity.
+
+    Each entry is a (key, text) pair; several entries may share a key.
+    """
+
+    def __init__(self):
+        self._entries: list[tuple[str, set[str]]] = []
+        self._postings: dict[str, list[int]] = defaultdict(list)
+
+    def add(self, key: str, text: str):
+        if not text:
+            return
+        grams = trigrams(text)
+        entry = len(self._entries)
+        self._entries.append((key, grams))
+        for gram in grams:
+            self._postings[gram].append(entry)
+
+    def search(self, text: str, min_similarity: float = 0.4) -> set[str]:
+        """Keys of entries whose trigram Dice coefficient with `text` is >= min_similarity."""
+        if not text or not self._entries:
+            return set()
+        query = trigrams(text)
+        # An entry needs at least `needed` shared trigrams, so it must share one
+        # of the len(query) - needed + 1 rarest ones (prefix filtering).
+        needed = max(1, math.ceil(min_similarity * len(query) / (2 - min_similarity)))
+        rare = sorted(query, key=lambda g: len(self._postings.get(g, ())))
+        candidates = set()
+        for gram in rare[:len(query) - needed + 1]:
+            candidates.update(self._postings.get(gram, ()))
+
+        keys = set()
+        for entry in candidates:
+            key, grams = self._entries[entry]
+            if key in keys:
+                continue
+            if 2 * len(query & grams) / (len(query) + len(grams)) >= min_similarity:
+                keys.add(key)
+        return keys
@@ -0,0 +1,169 @@
+"""Search over a user's incoming bank transactions.
+
+`TransactionSearchIndex` holds the searchable fields of every incoming
+transaction (omschrijving, mededelingen, tegenrekening, amount and date,
+lowercased once) with a trigram inverted index over them. A query matches
+the transactions that contain it as a substring of one of those fields, the
+same rule as the original linear filter; the trigram postings narrow the
+transactions to verify. Results are ranked (whole word, word prefix, other
+substring), newest first within a rank, and paged with an opaque cursor.
+
+Indexes are cached per user in this process and rebuilt when the stamp of
+the user's bank accounts (one entry per upload) changes.
+"""
+
+import base64
+import json
+import re
+import threading
+from bisect import bisect_right
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+
+from app.services.matching import date_ordinal
+
+# Users whose index is kept in memory (least recently used are dropped)
+MAX_CACHED_INDEXES = 16
+
+# Separates the fields, so a match never spans two of them
+_SEPARATOR = "\x00"
+
+# Ranks: the query is a whole word, starts a word, or appears anywhere
+RANK_WORD, RANK_PREFIX, RANK_SUBSTRING = 3, 2, 1
+
+
+def search_row(tx: dict) -> dict:
+    """A transaction as returned by the transaction search."""
+    return {
+        "id": tx["id"],
+        "datum": tx.get("datum", ""),
+        "bedrag": tx.get("bedrag", 0),
+        "omschrijving": tx.get("omschrijving", ""),
+        "mededelingen": tx.get("mededelingen", ""),
+        "tegenrekening": tx.get("tegenrekening", ""),
+    }
+
+
+def _search_text(tx: dict) -> str:
+    return _SEPARATOR.join([
+        (tx.get("omschrijving", "") or "").lower(),
+        (tx.get("mededelingen", "") or "").lower(),
+        (tx.get("tegenrekening", "") or "").lower(),
+        str(abs(tx.get("bedrag", 0))),
+        tx.get("datum", "") or "",
+    ])
+
+
+def _grams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _rank(query: re.Pattern, text: str) -> int:
+    best = RANK_SUBSTRING
+    for match in query.finditer(text):
+        start, end = match.span()
+        word_start = start == 0 or not text[start - 1].isalnum()
+        if word_start and (end == len(text) or not text[end].isalnum()):
+            return RANK_WORD
+        if word_start:
+            best = RANK_PREFIX
+    return best
+
+
+def encode_cursor(key: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode a cursor from `search`; raises ValueError when it is malformed."""
+    try:
+        rank, dag, tx_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(rank), int(dag), str(tx_id)
+    except Exception as e:
+        raise ValueError("Ongeldige cursor") from e
+
+
+class TransactionSearchIndex:
+    """Searchable fields and trigram postings of a fixed set of transactions."""
+
+    def __init__(self, transactions: list[dict]):
+        dagen = {tx["id"]: date_ordinal(tx.get("datum", "")) or -1 for tx in transactions}
+        # Newest first, so positions are already in result order within a rank
+        ordered = sorted(transactions, key=lambda tx: (-dagen[tx["id"]], tx["id"]))
+        self.rows = [search_row(tx) for tx in ordered]
+        self._dagen = [dagen[tx["id"]] for tx in ordered]
+        self._texts = [_search_text(tx) for tx in ordered]
+
+        postings = defaultdict(list)
+        for pos, text in enumerate(self._texts):
+            for gram in _grams(text):
+                postings[gram].append(pos)
+        self._postings = {gram: np.array(p, dtype=np.int32) for gram, p in postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _candidates(self, query: str):
+        """Positions that contain every trigram of the query (all positions for short queries)."""
+        grams = _grams(query)
+        if not grams:
+            return range(len(self.rows))
+        lists = sorted((self._postings.get(gram) for gram in grams), key=lambda p: 0 if p is None else len(p))
+        if lists[0] is None:
+            return []
+        found = lists[0]
+        for postings in lists[1:]:
+            found = np.intersect1d(found, postings, assume_unique=True)
+            if not len(found):
+                break
+        return found.tolist()
+
+    def search(self, search: str = "") -> list[tuple[tuple, dict]]:
+        """All (sort key, row) pairs matching the query, best first.
+
+        The sort key (-rank, -day number, id) is what `encode_cursor` stores.
+        """
+        search = search.lower()
+        if not search:
+            return [((-RANK_SUBSTRING, -dag, row["id"]), row) for dag, row in zip(self._dagen, self.rows)]
+
+        pattern = re.compile(re.escape(search))
+        hits = []
+        for pos in self._candidates(search):
+            text = self._texts[pos]
+            if search in text:
+                key = (-_rank(pattern, text), -self._dagen[pos], self.rows[pos]["id"])
+                hits.append((key, self.rows[pos]))
+        hits.sort(key=lambda hit: hit[0])
+        return hits
+
+
+def paginate(hits: list[tuple[tuple, dict]], limit: int, cursor: str = "") -> tuple[list[dict], str | None]:
+    """One page of `hits` after `cursor`, and the cursor of the next page (None on the last page)."""
+    if cursor:
+        hits = hits[bisect_right(hits, decode_cursor(cursor), key=lambda hit: hit[0]):]
+    page = hits[:limit]
+    next_cursor = encode_cursor(list(page[-1][0])) if len(hits) > limit else None
+    return [row for _, row in page], next_cursor
+
+
+_cache: OrderedDict[str, tuple[object, TransactionSearchIndex]] = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def cached_index(uid: str, stamp, load) -> TransactionSearchIndex:
+    """The user's index for `stamp`, built from `load()` when missing or stamped differently."""
+    with _cache_lock:
+        entry = _cache.get(uid)
+        if entry and entry[0] == stamp:
+            _cache.move_to_end(uid)
+            return entry[1]
+
+    index = TransactionSearchIndex(load())
+    with _cache_lock:
+        _cache[uid] = (stamp, index)
+        _cache.move_to_end(uid)
+        while len(_cache) > MAX_CACHED_INDEXES:
+            _cache.popitem(last=False)
+    return index
@@ -0,0 +1,312 @@
+"""Throughput and accuracy benchmark for bank matching.
+
+Generates a set of open invoices and ING-style incoming transactions with
+known ground truth: exact and partial payments, transfers paying several
+invoices of one customer at once, invoice numbers written in
+different ways or with typos, customer name variants, long payment delays
+and unrelated incoming transactions. The pure matching run (`run_match`,
+no Firestore) is timed on that data and its auto-matches and suggestions
+are checked against the truth, so changes to scoring weights, thresholds or
+candidate generation show their effect on both speed and match quality.
+
+Run from backend/:
+
+    python -m benchmarks.bank_matching --facturen 500 --ruis 5000
+"""
+
+import argparse
+import random
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from app.services.match_suggestions import STORED_MIN_SCORE, STORED_SUGGESTIONS
+from app.services.matching import (
+    SUGGESTIONS_PER_INVOICE,
+    IbanIndex,
+    batch_top_matches,
+    compute_match_score,
+    prepare_invoice,
+    prepare_transaction,
+    run_match,
+)
+
+VOORNAMEN = ["Jan", "Anna", "Pieter", "Sanne", "Henk", "Fatima", "Daan", "Lisa", "Mohamed", "Eva", "Kees", "Noor"]
+ACHTERNAMEN = [
+    "de Vries", "Jansen", "Bakker", "Visser", "Smit", "Meijer", "de Boer", "Mulder",
+    "de Groot", "Bos", "Vos", "Peters", "Hendriks", "van Dijk", "Dekker", "van Leeuwen",
+]
+BEDRIJVEN = ["Bouw", "Advies", "Design", "Installatie", "Media", "Zorg", "Techniek", "Consultancy"]
+RUIS = ["Terugbetaling", "Rente", "Overboeking spaarrekening", "Belastingdienst", "Tikkie", "Zorgverzekering"]
+
+START = date(2023, 1, 1)
+DAGEN = 730
+
+
+@dataclass
+class Scenario:
+    invoices: list[dict]
+    transactions: list[dict]
+    payments: dict[str, list[str]] = field(default_factory=dict)  # invoice id -> paying transaction ids
+    kinds: dict[str, str] = field(default_factory=dict)  # "volledig" | "deel" | "verzamel" | "open"
+    # Paid in full, exact amount and exact invoice number: what phase 1 should auto-match
+    auto_matchable: set[str] = field(default_factory=set)
+    customers: list[dict] = field(default_factory=list)  # {"id", "naam", "ibans"}
+
+
+def _iban(rng: random.Random) -> str:
+    return f"NL{rng.randint(10, 99)}{rng.choice(['INGB', 'RABO', 'ABNA', 'SNSB'])}0{rng.randint(10**8, 10**9 - 1)}"
+
+
+def _customers(rng: random.Random, n: int) -> list[dict]:
+    customers = []
+    for i in range(n):
+        achternaam = rng.choice(ACHTERNAMEN)
+        if rng.random() < 0.4:
+            naam = f"{achternaam} {rng.choice(BEDRIJVEN)} B.V.".replace("de ", "De ", 1)
+        else:
+            naam = f"{rng.choice(VOORNAMEN)} {achternaam}"
+        ibans = [_iban(rng)] + ([_iban(rng)] if rng.random() < 0.15 else [])
+        customers.append({"id": f"k{i}", "naam": naam, "ibans": ibans})
+    return customers
+
+
+def _name_variant(rng: random.Random, naam: str) -> str:
+    """How the bank shows the payer: as invoiced, upper case, initial + surname, or shortened."""
+    delen = naam.split()
+    r = rng.random()
+    if r < 0.45:
+        return naam
+    if r < 0.65:
+        return naam.upper()
+    if r < 0.85 and len(delen) > 1 and not naam.endswith("B.V."):
+        return f"{delen[0][0]}. {' '.join(delen[1:])}"
+    if naam.endswith("B.V."):
+        return naam.replace(" B.V.", "").upper() + " BV"
+    return f"FAM {delen[-1].upper()}"
+
+
+def _reference(rng: random.Random, factuurnummer: str) -> tuple[str, str]:
+    """Invoice number as written in mededelingen, and whether it is exact, a typo or missing."""
+    cijfers = factuurnummer[1:]
+    r = rng.random()
+    if r < 0.55:
+        schrijfwijze = rng.choice([factuurnummer, f"F.{cijfers}", f"f {cijfers}", f"F-{cijfers}"])
+        return f"Factuur {schrijfwijze}", "exact"
+    if r < 0.70:
+        digits = list(cijfers)
+        i = rng.randrange(len(digits) - 1)
+        digits[i], digits[i + 1] = digits[i + 1], digits[i]
+        if digits == list(cijfers):
+            digits[-1] = str((int(digits[-1]) + 1) % 10)
+        return f"Factuur F{''.join(digits)}", "typo"
+    return rng.choice(["Betaling", "Diensten", "Zie factuur", ""]), "geen"
+
+
+def _delay(rng: random.Random) -> int:
+    r = rng.random()
+    if r < 0.7:
+        return rng.randint(0, 30)
+    if r < 0.9:
+        return rng.randint(31, 90)
+    return rng.randint(91, 300)
+
+
+def generate(n_facturen: int = 500, n_ruis: int = 5000, seed: int = 1) -> Scenario:
+    rng = random.Random(seed)
+    customers = _customers(rng, max(5, n_facturen // 8))
+    scenario = Scenario(invoices=[], transactions=[], customers=customers)
+
+    def add_tx(datum: date, bedrag: float, klant: dict | None, mededelingen: str, naam: str) -> str:
+        tx = {
+            "id": f"t{len(scenario.transactions)}",
+            "datum": datum.isoformat(),
+            "bedrag": round(bedrag, 2),
+            "omschrijving": naam,
+            "mededelingen": mededelingen,
+            "tegenrekening": rng.choice(klant["ibans"]) if klant else _iban(rng),
+            "af_bij": "Bij",
+        }
+        scenario.transactions.append(tx)
+        return tx["id"]
+
+    verzamel = defaultdict(list)  # klant id -> invoices paid together later
+    for i in range(n_facturen):
+        klant = rng.choice(customers)
+        factuurdatum = START + timedelta(days=rng.randrange(DAGEN))
+        totaal = round(rng.lognormvariate(6.3, 0.9), 2)
+        inv = {
+            "id": f"f{i}",
+            "factuurnummer": f"F{i + 1:04d}",
+            "klant_id": klant["id"],
+            "klant_naam": klant["naam"],
+            "factuurdatum": factuurdatum.isoformat(),
+            "totaal": totaal,
+            "status": "verzonden",
+        }
+        scenario.invoices.append(inv)
+
+        r = rng.random()
+        if r < 0.12:
+            scenario.kinds[inv["id"]] = "open"
+            continue
+        betaaldatum = factuurdatum + timedelta(days=_delay(rng))
+        if r < 0.20:
+            scenario.kinds[inv["id"]] = "verzamel"
+            verzamel[klant["id"]].append(inv)
+        elif r < 0.88:
+            # A few payers round the amount or pay it minus bank costs
+            bedrag = totaal if rng.random() < 0.9 else round(totaal - rng.choice([0.01, 0.5, 1, 2.5]), 2)
+            mededelingen, referentie = _reference(rng, inv["factuurnummer"])
+            scenario.kinds[inv["id"]] = "volledig"
+            if bedrag == totaal and referentie == "exact":
+                scenario.auto_matchable.add(inv["id"])
+            scenario.payments[inv["id"]] = [
+                add_tx(betaaldatum, bedrag, klant, mededelingen, _name_variant(rng, klant["naam"]))
+            ]
+        else:
+            termijnen = rng.randint(2, 3)
+            scenario.kinds[inv["id"]] = "deel"
+            scenario.payments[inv["id"]] = []
+            for t in range(termijnen):
+                mededelingen, _ = _reference(rng, inv["factuurnummer"])
+                scenario.payments[inv["id"]].append(add_tx(
+                    betaaldatum + timedelta(days=30 * t), totaal / termijnen, klant,
+                    f"{mededelingen} termijn {t + 1}", _name_variant(rng, klant["naam"]),
+                ))
+
+    # Collective transfers: a customer pays two or three invoices close in date at once
+    klanten = {k["id"]: k for k in customers}
+    for klant_id, pending in verzamel.items():
+        klant = klanten[klant_id]
+        pending.sort(key=lambda inv: inv["factuurdatum"])
+        while pending:
+            group = pending[:rng.randint(2, 3)]
+            pending = pending[len(group):]
+            if len(group) == 1:
+                scenario.kinds[group[0]["id"]] = "volledig"
+            betaaldatum = date.fromisoformat(group[-1]["factuurdatum"]) + timedelta(days=_delay(rng))
+            nummers = " ".join(inv["factuurnummer"] for inv in group)
+            tx_id = add_tx(
+                betaaldatum, sum(inv["totaal"] for inv in group), klant,
+                rng.choice([f"Facturen {nummers}", "Betaling facturen", ""]), _name_variant(rng, klant["naam"]),
+            )
+            for inv in group:
+                scenario.payments[inv["id"]] = [tx_id]
+
+    for _ in range(n_ruis):
+        naam = rng.choice([f"{rng.choice(VOORNAMEN)} {rng.choice(ACHTERNAMEN)}", rng.choice(RUIS)])
+        add_tx(
+            START + timedelta(days=rng.randrange(DAGEN + 120)),
+            round(rng.lognormvariate(5, 1.3), 2),
+            None,
+            rng.choice(["", "Terugbetaling", f"Kenmerk {rng.randint(10**6, 10**7)}", "Bedankt"]),
+            naam,
+        )
+
+    rng.shuffle(scenario.transactions)
+    return scenario
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def measure(
+    scenario: Scenario,
+    globaal: bool = False,
+    meervoudig: bool = False,
+    iban: bool = False,
+    pair_sample: int = 20_000,
+) -> dict:
+    """Throughput and match quality of one matching run over the scenario.
+
+    With `iban`, the run knows each customer's first IBAN, as stored on the
+    customer after an earlier match.
+    """
+    invoices, transactions = scenario.invoices, scenario.transactions
+    truth = {inv_id: set(tx_ids) for inv_id, tx_ids in scenario.payments.items()}
+    for inv in invoices:
+        prepare_invoice(inv)
+    for tx in transactions:
+        prepare_transaction(tx)
+
+    # Single-pair scoring
+    rng = random.Random(0)
+    pairs = [(rng.choice(invoices), rng.choice(transactions)) for _ in range(pair_sample)]
+    _, pair_time = _timed(lambda: [compute_match_score(inv, tx) for inv, tx in pairs])
+
+    # Batch top-k over all pairs
+    _, batch_time = _timed(lambda: batch_top_matches(invoices, transactions, SUGGESTIONS_PER_INVOICE, 5))
+
+    # End-to-end run, including the stored suggestions a full run writes
+    ibans = IbanIndex((klant["ibans"][0], klant["id"]) for klant in scenario.customers) if iban else None
+    run, run_time = _timed(lambda: run_match(
+        invoices, transactions, globaal, meervoudig, ibans, kandidaten=(STORED_SUGGESTIONS, STORED_MIN_SCORE),
+    ))
+    used = {m["transaction"]["id"] for m in run.auto_matched + run.meervoudig}
+
+    via_iban = [m for m in run.auto_matched if m.get("match_type") == "auto_iban"]
+    correct = [m["invoice"]["id"] for m in run.auto_matched if m["transaction"]["id"] in truth.get(m["invoice"]["id"], ())]
+    volledig = sum(1 for kind in scenario.kinds.values() if kind == "volledig")
+    auto_matchable = scenario.auto_matchable
+
+    # Suggestions for paid invoices that were not auto-matched, whose payment is still free
+    findable = hits = top1 = 0
+    for inv, top in zip(run.unmatched, run.suggestions):
+        free = truth.get(inv["id"], set()) - used
+        if not free:
+            continue
+        findable += 1
+        ids = [tx["id"] for _, tx in top]
+        hits += any(tx_id in free for tx_id in ids)
+        top1 += bool(ids) and ids[0] in free
+    multi = [(inv["id"], m["transaction"]["id"]) for m in run.meervoudig for inv in m["invoices"]]
+    multi_correct = sum(1 for inv_id, tx_id in multi if tx_id in truth.get(inv_id, ()))
+    verzamel = sum(1 for kind in scenario.kinds.values() if kind == "verzamel")
+    voorstellen_correct = sum(1 for inv_id, tx_id in run.voorstellen.items() if tx_id in truth.get(inv_id, ()))
+
+    return {
+        "facturen": len(invoices),
+        "transacties": len(transactions),
+        "paren_per_s_los": pair_sample / pair_time,
+        "paren_per_s_batch": len(invoices) * len(transactions) / batch_time,
+        "run_s": run_time,
+        "auto_matches": len(run.auto_matched),
+        "auto_precision": len(correct) / len(run.auto_matched) if run.auto_matched else 1.0,
+        "auto_recall": len(correct) / volledig if volledig else 1.0,
+        "auto_recall_matchbaar": (
+            len(auto_matchable.intersection(correct)) / len(auto_matchable) if auto_matchable else 1.0
+        ),
+        "auto_via_iban": len(via_iban),
+        "meervoudig_facturen": len(multi),
+        "meervoudig_precision": multi_correct / len(multi) if multi else 1.0,
+        "meervoudig_recall": multi_correct / verzamel if verzamel else 1.0,
+        "suggesties_vindbaar": findable,
+        "suggesties_recall_top5": hits / findable if findable else 1.0,
+        "suggesties_precision_top1": top1 / findable if findable else 1.0,
+        "voorstellen": len(run.voorstellen),
+        "voorstellen_precision": voorstellen_correct / len(run.voorstellen) if run.voorstellen else 1.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bank matching benchmark")
+    parser.add_argument("--facturen", type=int, default=500)
+    parser.add_argument("--ruis", type=int, default=5000, help="incoming transactions unrelated to any invoice")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--globaal", action="store_true", help="global one-to-one assignment")
+    parser.add_argument("--meervoudig", action="store_true", help="match transfers paying several invoices")
+    parser.add_argument("--iban", action="store_true", help="use the customers' known IBANs")
+    args = parser.parse_args()
+
+    scenario = generate(args.facturen, args.ruis, args.seed)
+    for key, value in measure(scenario, args.globaal, args.meervoudig, args.iban).items():
+        print(f"{key:28} {value:,.3f}" if isinstance(value, float) else f"{key:28} {value:,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -54,6 +54,7 @@ export default function InvoiceDetailPage() {
   const [searchQuery, setSearchQuery] = useState("");
   const [searchResults, setSearchResults] = useState<BankTransaction[]>([]);
   const [searchLoading, setSearchLoading] = useState(false);
+  const [searchCursor, setSearchCursor] = useState<string | null>(null);
   const [suggestionsLoading, setSuggestionsLoading] = useState(false);
   const [selectedTxIds, setSelectedTxIds] = useState<Set<string>>(new Set());
   const [partialMode, setPartialMode] = useState(false);
@@ -147,19 +148,22 @@ export default function InvoiceDetailPage() {
     }
   };
 
-  const handleSearchTransactions = async (query: string) => {
-    setSearchQuery(query);
+  const handleSearchTransactions = async (query: string, cursor?: string) => {
+    if (!cursor) setSearchQuery(query);
     if (!query.trim()) {
       setSearchResults([]);
+      setSearchCursor(null);
       return;
     }
     setSearchLoading(true);
     try {
-      const data = (await getAvailableTransactions(query)) as {
+      const data = (await getAvailableTransactions(query, cursor)) as {
         transactions: BankTransaction[];
         total: number;
+        next_cursor: string | null;
       };
-      setSearchResults(data.transactions);
+      setSearchResults((prev) => (cursor ? [...prev, ...data.transactions] : data.transactions));
+      setSearchCursor(data.next_cursor);
     } catch (e: any) {
       toast.error(e.message);
     } finally {
@@ -508,6 +512,15 @@ export default function InvoiceDetailPage() {
                     </div>
                   );
                 })}
+                {searchCursor && (
+                  <button
+                    onClick={() => handleSearchTransactions(searchQuery, searchCursor)}
+                    disabled={searchLoading}
+                    className="w-full rounded-lg border border-gray-200 py-2 text-sm text-gray-600 hover:bg-gray-50 disabled:opacity-50"
+                  >
+                    Meer laden
+                  </button>
+                )}
               </div>
             )}
             {searchQuery.trim() && !searchLoading && searchResults.length === 0 && (
@@ -3,13 +3,14 @@
 import { useEffect, useState, useCallback } from "react";
 import Link from "next/link";
 import {
-  runBankMatching,
+  runBankMatchingJob,
   manualMatch,
   partialPaymentMatch,
   getMatchSuggestions,
   getMatchingStatus,
   unmatchInvoice,
   getAvailableTransactions,
+  type MatchingJob,
 } from "@/lib/api";
 import { formatCurrency, formatDateShort } from "@/lib/utils";
 import toast from "react-hot-toast";
@@ -34,6 +35,8 @@ interface MatchResult {
   status: "matched" | "partial" | "unmatched";
   matched_transactions: MatchedTransaction[];
   suggestions: MatchedTransaction[];
+  voorstel?: string | null;
+  gedeeld_met?: string[];
   matched_amount: number;
   remaining_amount: number;
 }
@@ -53,9 +56,21 @@ interface MatchingStatusData {
   verzonden: number;
 }
 
+// Unmatched first, then matched; a later result for an invoice replaces the earlier one
+function mergeResults(current: MatchResult[], items: MatchResult[]): MatchResult[] {
+  const byInvoice = new Map<string, MatchResult>(current.map((r) => [r.invoice_id, r]));
+  for (const item of items) byInvoice.set(item.invoice_id, item);
+  return Array.from(byInvoice.values()).sort(
+    (a, b) =>
+      Number(a.status !== "unmatched") - Number(b.status !== "unmatched") ||
+      a.factuurnummer.localeCompare(b.factuurnummer)
+  );
+}
+
 export default function BankMatchingPage() {
   const [loading, setLoading] = useState(true);
   const [running, setRunning] = useState(false);
+  const [progress, setProgress] = useState<MatchingJob | null>(null);
   const [status, setStatus] = useState<MatchingStatusData | null>(null);
   const [results, setResults] = useState<MatchResult[]>([]);
   const [summary, setSummary] = useState<MatchingSummary | null>(null);
@@ -68,6 +83,7 @@ export default function BankMatchingPage() {
   const [searchQuery, setSearchQuery] = useState<Record<string, string>>({});
   const [searchResults, setSearchResults] = useState<Record<string, MatchedTransaction[]>>({});
   const [searchLoading, setSearchLoading] = useState<Record<string, boolean>>({});
+  const [searchCursor, setSearchCursor] = useState<Record<string, string | null>>({});
 
   const loadStatus = useCallback(async () => {
     try {
@@ -86,27 +102,34 @@ export default function BankMatchingPage() {
 
   const handleRunMatching = async () => {
     setRunning(true);
+    setProgress(null);
+    setResults([]);
+    setSummary(null);
     try {
-      const data = (await runBankMatching()) as {
-        results: MatchResult[];
-        summary: MatchingSummary;
-      };
-      setResults(data.results);
-      setSummary(data.summary);
+      // Results are shown as the job publishes them; after a dropped connection they come at the end
+      const { job, results: allResults } = await runBankMatchingJob<MatchResult>(
+        setProgress,
+        (items) => setResults((prev) => mergeResults(prev, items))
+      );
+      if (allResults) {
+        setResults(mergeResults([], allResults));
+      }
+      const jobSummary = job.summary as unknown as MatchingSummary;
+      setSummary(jobSummary);
 
-      if (data.summary.auto_matched > 0) {
+      if (jobSummary.auto_matched > 0) {
         toast.success(
-          `${data.summary.auto_matched} facturen automatisch gekoppeld`
+          `${jobSummary.auto_matched} facturen automatisch gekoppeld`
         );
       }
-      if (data.summary.iban_updates > 0) {
+      if (jobSummary.iban_updates > 0) {
         toast.success(
-          `${data.summary.iban_updates} klant IBAN's bijgewerkt`
+          `${jobSummary.iban_updates} klant IBAN's bijgewerkt`
         );
       }
-      if (data.summary.unmatched > 0) {
+      if (jobSummary.unmatched > 0) {
         toast(
-          `${data.summary.unmatched} facturen vereisen handmatige koppeling`,
+          `${jobSummary.unmatched} facturen vereisen handmatige koppeling`,
           { icon: "⚠️" }
         );
       }
@@ -116,6 +139,7 @@ export default function BankMatchingPage() {
       toast.error(e.message);
     } finally {
       setRunning(false);
+      setProgress(null);
     }
   };
 
@@ -188,19 +212,25 @@ export default function BankMatchingPage() {
     }
   };
 
-  const handleSearchTransactions = async (invoiceId: string, query: string) => {
-    setSearchQuery((prev) => ({ ...prev, [invoiceId]: query }));
+  const handleSearchTransactions = async (invoiceId: string, query: string, cursor?: string) => {
+    if (!cursor) setSearchQuery((prev) => ({ ...prev, [invoiceId]: query }));
     if (!query.trim()) {
       setSearchResults((prev) => ({ ...prev, [invoiceId]: [] }));
+      setSearchCursor((prev) => ({ ...prev, [invoiceId]: null }));
       return;
     }
     setSearchLoading((prev) => ({ ...prev, [invoiceId]: true }));
     try {
-      const data = (await getAvailableTransactions(query)) as {
+      const data = (await getAvailableTransactions(query, cursor)) as {
         transactions: MatchedTransaction[];
         total: number;
+        next_cursor: string | null;
       };
-      setSearchResults((prev) => ({ ...prev, [invoiceId]: data.transactions }));
+      setSearchResults((prev) => ({
+        ...prev,
+        [invoiceId]: cursor ? [...(prev[invoiceId] ?? []), ...data.transactions] : data.transactions,
+      }));
+      setSearchCursor((prev) => ({ ...prev, [invoiceId]: data.next_cursor }));
     } catch (e: any) {
       toast.error(e.message);
     } finally {
@@ -242,7 +272,7 @@ export default function BankMatchingPage() {
             {running ? (
               <>
                 <div className="h-4 w-4 animate-spin rounded-full border-2 border-white border-t-transparent" />
-                Bezig...
+                {progress?.total ? `Bezig... ${progress.done}/${progress.total}` : "Bezig..."}
               </>
             ) : (
               <>
@@ -659,6 +689,21 @@ export default function BankMatchingPage() {
                                 </div>
                               );
                             })}
+                            {searchCursor[result.invoice_id] && (
+                              <button
+                                onClick={() =>
+                                  handleSearchTransactions(
+                                    result.invoice_id,
+                                    searchQuery[result.invoice_id] ?? "",
+                                    searchCursor[result.invoice_id] ?? undefined
+                                  )
+                                }
+                                disabled={searchLoading[result.invoice_id]}
+                                className="w-full rounded-lg border border-gray-200 py-2 text-sm text-gray-600 hover:bg-gray-50 disabled:opacity-50"
+                              >
+                                Meer laden
+                              </button>
+                            )}
                           </div>
                         )}
                         {searchQuery[result.invoice_id]?.trim() &&
@@ -721,7 +766,7 @@ export default function BankMatchingPage() {
       )}
 
       {/* Empty state */}
-      {results.length === 0 && !summary && (
+      {results.length === 0 && !summary && !running && (
         <div className="card text-center py-12">
           <svg
             className="mx-auto h-12 w-12 text-gray-300"
@@ -72,6 +72,7 @@ export default function JaarcijfersPage() {
   const [jaar, setJaar] = useState<number>(new Date().getFullYear() - 1);
   const [uploading, setUploading] = useState(false);
   const [exporting, setExporting] = useState(false);
+  const [exportProgress, setExportProgress] = useState<{ done: number; total: number } | null>(null);
   const fileInputRef = useRef<HTMLInputElement>(null);
 
   const loadData = useCallback(async () => {
@@ -98,15 +99,16 @@ export default function JaarcijfersPage() {
       const res = (await uploadBankCsv(file)) as {
         account_name: string;
         transactions: number;
+        nieuw: number;
         min_date: string;
         max_date: string;
       };
       toast.success(
-        `${res.account_name}: ${res.transactions} transacties geladen (${res.min_date} t/m ${res.max_date})`
+        `${res.account_name}: ${res.transactions} transacties geladen, ${res.nieuw} nieuw (${res.min_date} t/m ${res.max_date})`
       );
       await loadData();
     } catch (err: any) {
-      toast.error(err?.message || "Fout bij uploaden CSV");
+      toast.error(err?.message || "Fout bij uploaden bankafschrift");
     } finally {
       setUploading(false);
       if (fileInputRef.current) fileInputRef.current.value = "";
@@ -169,7 +171,7 @@ export default function JaarcijfersPage() {
           </div>
           <input
             type="file"
-            accept=".csv"
+            accept=".csv,.xml,.sta,.940,.mt940,.swi,.txt"
             ref={fileInputRef}
             onChange={handleCsvUpload}
             className="hidden"
@@ -177,26 +179,32 @@ export default function JaarcijfersPage() {
           <button
             onClick={async () => {
               setExporting(true);
+              setExportProgress(null);
               try {
-                await exportJaarcijfers(activeJaar);
+                await exportJaarcijfers(activeJaar, (done, total) => setExportProgress({ done, total }));
                 toast.success("Export gedownload");
               } catch (err: any) {
                 toast.error(err?.message || "Fout bij exporteren");
               } finally {
                 setExporting(false);
+                setExportProgress(null);
               }
             }}
             disabled={exporting}
             className="btn-primary text-sm"
           >
-            {exporting ? "Exporteren…" : `Export ${activeJaar}`}
+            {exporting
+              ? exportProgress?.total
+                ? `Exporteren… ${exportProgress.done}/${exportProgress.total}`
+                : "Exporteren…"
+              : `Export ${activeJaar}`}
           </button>
           <button
             onClick={() => fileInputRef.current?.click()}
             disabled={uploading}
             className="btn-secondary text-sm"
           >
-            {uploading ? "Uploaden…" : "Bank CSV uploaden"}
+            {uploading ? "Uploaden…" : "Bankafschrift uploaden"}
           </button>
         </div>
       </div>
@@ -122,22 +122,43 @@ export const getJaarcijfers = (jaar: number) =>
   request(`/jaarcijfers/${jaar}`);
 export const getJaarcijfersOverzicht = () =>
   request(`/jaarcijfers/overzicht`);
-export const uploadBankCsv = (file: File) => {
+export const uploadBankCsv = (file: File, matchen = false) => {
   const formData = new FormData();
   formData.append("file", file);
-  return request("/jaarcijfers/upload-csv", { method: "POST", body: formData });
+  return request(`/jaarcijfers/upload-csv${matchen ? "?matchen=true" : ""}`, { method: "POST", body: formData });
 };
 export const getBankStatus = () =>
   request("/jaarcijfers/bank-status");
 export const deleteBankAccount = (id: string) =>
   request(`/jaarcijfers/bank/${id}`, { method: "DELETE" });
-export const exportJaarcijfers = async (jaar: number): Promise<void> => {
+type ExportJob = {
+  id: string;
+  status: "wachtrij" | "bezig" | "klaar" | "mislukt";
+  done: number;
+  total: number;
+  error: string | null;
+};
+
+export const exportJaarcijfers = async (
+  jaar: number,
+  onProgress?: (done: number, total: number) => void
+): Promise<void> => {
+  let job = await request<ExportJob>(`/jaarcijfers/${jaar}/export-jobs`, { method: "POST" });
+  while (job.status === "wachtrij" || job.status === "bezig") {
+    onProgress?.(job.done, job.total);
+    await new Promise((resolve) => setTimeout(resolve, 1500));
+    job = await request<ExportJob>(`/jaarcijfers/export-jobs/${job.id}`);
+  }
+  if (job.status === "mislukt") {
+    throw new Error(job.error || "Fout bij exporteren");
+  }
+
   const apiBase = getApiBase();
   const token = await getIdToken();
   const headers: Record<string, string> = {};
   if (token) headers["Authorization"] = `Bearer ${token}`;
 
-  const res = await fetch(`${apiBase}/jaarcijfers/${jaar}/export`, { headers });
+  const res = await fetch(`${apiBase}/jaarcijfers/export-jobs/${job.id}/download`, { headers });
   if (!res.ok) {
     const error = await res.json().catch(() => ({ detail: "Er ging iets mis" }));
     throw new Error(error.detail || `HTTP ${res.status}`);
@@ -152,9 +173,100 @@ export const exportJaarcijfers = async (jaar: number): Promise<void> => {
   URL.revokeObjectURL(url);
 };
 
+// Follow a server-sent event stream; fetch instead of EventSource, which cannot send the auth header
+async function streamEvents(
+  path: string,
+  onEvent: (event: string, data: string) => void
+): Promise<void> {
+  const apiBase = getApiBase();
+  const token = await getIdToken();
+  const headers: Record<string, string> = { Accept: "text/event-stream" };
+  if (token) headers["Authorization"] = `Bearer ${token}`;
+
+  const res = await fetch(`${apiBase}${path}`, { headers });
+  if (!res.ok || !res.body) {
+    throw new Error(`HTTP ${res.status}`);
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) return;
+    buffer += decoder.decode(value, { stream: true });
+    let end = buffer.indexOf("\n\n");
+    while (end >= 0) {
+      let event = "message";
+      const data: string[] = [];
+      for (const line of buffer.slice(0, end).split("\n")) {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data.push(line.slice(6));
+      }
+      if (data.length) onEvent(event, data.join("\n"));
+      buffer = buffer.slice(end + 2);
+      end = buffer.indexOf("\n\n");
+    }
+  }
+}
+
 // Bank Matching
-export const runBankMatching = () =>
-  request("/bank-matching/run", { method: "POST" });
+export type MatchingJob = {
+  id: string;
+  status: "wachtrij" | "bezig" | "klaar" | "mislukt";
+  fase: string | null;
+  done: number;
+  total: number;
+  summary: Record<string, number> | null;
+  error: string | null;
+};
+
+const isFinished = (job: MatchingJob) => job.status === "klaar" || job.status === "mislukt";
+
+// Runs matching as a background job. Results arrive through onResults while the job runs;
+// if the connection drops, the job is polled instead and all its results are returned at the end.
+export const runBankMatchingJob = async <T>(
+  onProgress: (job: MatchingJob) => void,
+  onResults: (items: T[]) => void,
+  globaal = false,
+  meervoudig = false
+): Promise<{ job: MatchingJob; results: T[] | null }> => {
+  const params = new URLSearchParams();
+  if (globaal) params.set("globaal", "true");
+  if (meervoudig) params.set("meervoudig", "true");
+  const qs = params.toString();
+  let job = await request<MatchingJob>(`/bank-matching/jobs${qs ? `?${qs}` : ""}`, { method: "POST" });
+  onProgress(job);
+
+  let followed = false;
+  try {
+    await streamEvents(`/bank-matching/jobs/${job.id}/events`, (event, data) => {
+      if (event === "resultaten") {
+        onResults(JSON.parse(data));
+      } else if (event === "message") {
+        job = JSON.parse(data);
+        onProgress(job);
+      }
+    });
+    followed = isFinished(job);
+  } catch {
+    // Connection dropped; the job keeps running on the server
+  }
+
+  while (!isFinished(job)) {
+    await new Promise((resolve) => setTimeout(resolve, 1500));
+    job = await request<MatchingJob>(`/bank-matching/jobs/${job.id}`);
+    onProgress(job);
+  }
+  if (job.status === "mislukt") {
+    throw new Error(job.error || "Fout bij matchen");
+  }
+  if (followed) {
+    return { job, results: null };
+  }
+  const data = await request<{ results: T[] }>(`/bank-matching/jobs/${job.id}/results`);
+  return { job, results: data.results };
+};
 export const manualMatch = (invoiceId: string, transactionIds: string[]) =>
   request("/bank-matching/manual", {
     method: "POST",
@@ -169,9 +281,11 @@ export const getMatchSuggestions = (invoiceId: string) =>
   request(`/bank-matching/suggestions/${invoiceId}`);
 export const getMatchingStatus = () =>
   request("/bank-matching/status");
-export const getAvailableTransactions = (search?: string) => {
+export const getAvailableTransactions = (search?: string, cursor?: string, limit?: number) => {
   const params = new URLSearchParams();
   if (search) params.set("search", search);
+  if (cursor) params.set("cursor", cursor);
+  if (limit) params.set("limit", String(limit));
   const qs = params.toString();
   return request(`/bank-matching/transactions${qs ? `?${qs}` : ""}`);
 };
@@ -219,7 +219,7 @@ export interface JaarcijfersData {
   winst_verlies: JaarcijfersWinstVerlies;
   balans: JaarcijfersBalans;
   mva: MVAOverzicht;
-  bron?: "berekend" | "accountant";
+  bron?: "berekend" | "snapshot" | "accountant";
 }
 
 export interface BankAccountStatus {